@@ -54,8 +54,46 @@ CREATE TABLE `messages` (
   `id` bigint NOT NULL,
   `guild_id` bigint NOT NULL,
   `user_id` bigint NOT NULL,
+  `message_id` bigint NOT NULL,
+  `channel_id` bigint NOT NULL,
   `message` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
-  `time` datetime NOT NULL
+  `time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `profiles`
+--
+
+CREATE TABLE `profiles` (
+  `id` bigint NOT NULL,
+  `guild_id` bigint NOT NULL,
+  `user_id` bigint NOT NULL,
+  `warnings` int NOT NULL DEFAULT '0',
+  `kickCount` int NOT NULL DEFAULT '0',
+  `text_xp` int NOT NULL DEFAULT '0',
+  `text_lvl` int NOT NULL DEFAULT '0',
+  `voice_xp` int NOT NULL DEFAULT '0',
+  `voice_lvl` int NOT NULL DEFAULT '0',
+  `banned_at` datetime DEFAULT NULL,
+  `banned_until` datetime DEFAULT NULL,
+  `muted_at` datetime DEFAULT NULL,
+  `muted_until` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `reactions`
+--
+
+CREATE TABLE `reactions` (
+  `id` bigint NOT NULL,
+  `guild_id` bigint NOT NULL,
+  `message_id` bigint NOT NULL,
+  `role_id` bigint NOT NULL,
+  `emoji` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -90,9 +128,34 @@ CREATE TABLE `settings` (
   `lvl_channel_id` bigint NOT NULL DEFAULT '0',
   `cmd_channel_id` bigint NOT NULL DEFAULT '0',
   `prefix` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL DEFAULT 'LQ==',
-  `Color` varchar(25) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci DEFAULT 'default()'
+  `Color` varchar(25) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci DEFAULT 'default()',
+  `raidAuthorCount` int NOT NULL DEFAULT '10',
+  `exactDuplicates` tinyint(1) NOT NULL DEFAULT '0'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `schema_migrations`
+--
+
+CREATE TABLE `schema_migrations` (
+  `version` int NOT NULL PRIMARY KEY,
+  `description` varchar(255) NOT NULL,
+  `applied_at` datetime NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+--
+-- Dumping data for table `schema_migrations`
+--
+-- This file already has the schema of these migrations, so python -m base_folder.migrations skips them
+--
+
+INSERT INTO `schema_migrations` (`version`, `description`, `applied_at`) VALUES
+(1, 'composite keys for the profile, message and reaction lookups', CURRENT_TIMESTAMP),
+(2, 'raid detection threshold per guild', CURRENT_TIMESTAMP),
+(3, 'exact duplicate scoring per guild', CURRENT_TIMESTAMP);
+
 -- --------------------------------------------------------
 
 --
@@ -139,7 +202,23 @@ ALTER TABLE `guilds`
 ALTER TABLE `messages`
   ADD PRIMARY KEY (`id`),
   ADD KEY `guild_id` (`guild_id`) USING BTREE,
-  ADD KEY `user_id` (`user_id`) USING BTREE;
+  ADD KEY `user_id` (`user_id`) USING BTREE,
+  ADD UNIQUE KEY `messages_guild_message` (`guild_id`,`message_id`);
+
+--
+-- Indexes for table `profiles`
+--
+ALTER TABLE `profiles`
+  ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `profiles_guild_user` (`guild_id`,`user_id`),
+  ADD KEY `user_id` (`user_id`);
+
+--
+-- Indexes for table `reactions`
+--
+ALTER TABLE `reactions`
+  ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `reactions_guild_message_emoji` (`guild_id`,`message_id`,`emoji`);
 
 --
 -- Indexes for table `roles`
@@ -180,6 +259,18 @@ ALTER TABLE `Error`
 ALTER TABLE `messages`
   MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
 
+--
+-- AUTO_INCREMENT for table `profiles`
+--
+ALTER TABLE `profiles`
+  MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
+
+--
+-- AUTO_INCREMENT for table `reactions`
+--
+ALTER TABLE `reactions`
+  MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
+
 --
 -- AUTO_INCREMENT for table `user_info`
 --
@@ -203,6 +294,18 @@ ALTER TABLE `messages`
   ADD CONSTRAINT `messages_ibfk_1` FOREIGN KEY (`guild_id`) REFERENCES `guilds` (`guild_id`) ON DELETE CASCADE ON UPDATE CASCADE,
   ADD CONSTRAINT `messages_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `user_info` (`user_id`) ON DELETE CASCADE ON UPDATE CASCADE;
 
+--
+-- Constraints for table `profiles`
+--
+ALTER TABLE `profiles`
+  ADD CONSTRAINT `profiles_ibfk_1` FOREIGN KEY (`guild_id`) REFERENCES `guilds` (`guild_id`) ON DELETE CASCADE ON UPDATE CASCADE;
+
+--
+-- Constraints for table `reactions`
+--
+ALTER TABLE `reactions`
+  ADD CONSTRAINT `reactions_ibfk_1` FOREIGN KEY (`guild_id`) REFERENCES `guilds` (`guild_id`) ON DELETE CASCADE ON UPDATE CASCADE;
+
 --
 -- Constraints for table `roles`
 --
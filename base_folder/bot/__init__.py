@@ -6,7 +6,11 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pretty_help import PrettyHelp, Navigation
 
 from base_folder.bot.utils.util_functions import prefix, loadmodules
-from base_folder.config import BOT_TOKEN
+from base_folder.config import BOT_TOKEN, USER_CACHE_SWEEP_INTERVAL, SPAM_SNAPSHOT_INTERVAL, \
+    PUNISHMENT_FLUSH_INTERVAL, WARMUP_ON_BOOT, MIGRATE_ON_BOOT, BLACKLIST_REFRESH_INTERVAL, MESSAGE_FLUSH_INTERVAL, \
+    XP_FLUSH_INTERVAL, TASK_EXECUTOR, engine
+from base_folder.celery import local
+from base_folder.migrations import upgrade
 from base_folder.bot.modules.base.db_management import Db
 from base_folder.bot.utils.logger import Log
 from base_folder.bot.utils.checks import *
@@ -29,11 +33,23 @@ class MainBot(commands.Bot):
         self.booted = False
 
     def run(self, modules):
+        if MIGRATE_ON_BOOT:
+            print("Migrating database...")
+            upgrade(engine)
         loadmodules(modules, self)
         print("Running bot...")
         super().run(MAIN_BOT_TOKEN, reconnect=True)
 
     async def shutdown(self):
+        print("Saving anti spam state...")
+        await self.cache.snapshot_users()
+        await self.cache.flush_punishments(wait=True)
+        await self.cache.xp_accumulator.flush()
+        print("Sending buffered messages...")
+        await self.cache.message_buffer.flush()
+        if TASK_EXECUTOR == "local":
+            print("Waiting for the database tasks...")
+            await self.loop.run_in_executor(None, local.shutdown)
         print("Closing connection to Discord...")
         await super().close()
 
@@ -52,15 +68,24 @@ class MainBot(commands.Bot):
 
     async def on_ready(self):
         if super().is_ready():
-            self.booted = True
             if not self.scheduler.running:
+                self.scheduler.add_job(self.cache.sweep_users, "interval", seconds=USER_CACHE_SWEEP_INTERVAL)
+                self.scheduler.add_job(self.cache.snapshot_users, "interval", seconds=SPAM_SNAPSHOT_INTERVAL)
+                self.scheduler.add_job(self.cache.flush_punishments, "interval", seconds=PUNISHMENT_FLUSH_INTERVAL)
+                self.scheduler.add_job(self.cache.xp_accumulator.flush, "interval", seconds=XP_FLUSH_INTERVAL)
+                self.scheduler.add_job(self.cache.message_buffer.flush, "interval", seconds=MESSAGE_FLUSH_INTERVAL)
+                self.scheduler.add_job(self.cache.blacklist.refresh, "interval", seconds=BLACKLIST_REFRESH_INTERVAL)
                 self.scheduler.start()
             self.cache.make_states(self.guilds, self.log)
-            for guild in self.guilds:
-                await self.cache.states[guild.id].set_channels()
-                await self.cache.states[guild.id].set_banned_lists()
-                await self.cache.states[guild.id].set_permission_roles()
-                await self.cache.states[guild.id].set_spamsettings()
+            await self.cache.prefetch_punishments()
+            await self.cache.blacklist.load()
+            self.loop.create_task(self.cache.leaderboards.rebuild([guild.id for guild in self.guilds]))
+            self.booted = True
+            if WARMUP_ON_BOOT:
+                # Guilds the warm up didn't reach yet get hydrated by their first event
+                self.loop.create_task(self.cache.warm_up())
+            # Runs in the background, so on_ready doesn't wait for the file
+            self.loop.create_task(self.cache.restore_users())
             self.client_id = (await self.application_info()).id
             await self.change_presence(activity=discord.Game(name="Crushing data..."))
             print("Bot ready.")
@@ -108,20 +133,28 @@ class MainBot(commands.Bot):
     @banned_channel_list_spam
     @banned_roles_list_spam'''
     async def process_spam(self, ctx):
+        if ctx.guild is None:
+            return
+        state = self.cache.states[ctx.guild.id]
+        await state.hydrate()
+        # Ignored authors are dropped before any user state gets created
+        if state.policy is None or state.policy.ignores(ctx.message):
+            return
         try:
-            self.cache.states[ctx.guild.id].users[ctx.author.id].propagate(ctx.message)
+            state.users[ctx.author.id].propagate(ctx.message)
         except KeyError:
-            stdchannel = super().get_channel(self.cache.states[ctx.guild.id].get_channel())
-            warnchannel = super().get_channel(self.cache.states[ctx.guild.id].get_channel("warn"))
-            kickchannel = super().get_channel(self.cache.states[ctx.guild.id].get_channel("kick"))
-            banchannel = super().get_channel(self.cache.states[ctx.guild.id].get_channel("ban"))
-            print(banchannel, self.cache.states[ctx.guild.id].get_channel("ban"))
-            await self.cache.states[ctx.guild.id].set_user(ctx.author.id, stdchannel, warnchannel, kickchannel, banchannel)
-            self.cache.states[ctx.guild.id].users[ctx.author.id].propagate(ctx.message)
+            # The channels belong to this guild, so there is no need to search all guilds for them
+            stdchannel = ctx.guild.get_channel(state.get_channel())
+            warnchannel = ctx.guild.get_channel(state.get_channel("warn"))
+            kickchannel = ctx.guild.get_channel(state.get_channel("kick"))
+            banchannel = ctx.guild.get_channel(state.get_channel("ban"))
+            await state.set_user(ctx.author.id, stdchannel, warnchannel, kickchannel, banchannel)
+            state.users[ctx.author.id].propagate(ctx.message)
 
     async def on_message(self, msg):
         if not msg.author.bot:
             if self.booted:
+                await self.cache.hydrate(msg.guild)
                 await self.process_commands(msg)
                 return
             await msg.channel.send(f"The quantumframe is still booting up.")
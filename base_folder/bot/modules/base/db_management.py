@@ -1,9 +1,18 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from sqlalchemy.dialects.mysql import CHAR
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, FLOAT, BIGINT, DATETIME, ForeignKey, VARCHAR, TEXT, BOOLEAN
+from sqlalchemy import Column, Integer, String, FLOAT, BIGINT, DATETIME, ForeignKey, VARCHAR, TEXT, BOOLEAN, or_, \
+    UniqueConstraint, func
+from sqlalchemy import exc
 from sqlalchemy.orm import relationship
 
-from base_folder.config import Session
+from base_folder.config import Session, engine, DB_EXECUTOR_WORKERS
+from base_folder.query_stats import instrument_engine
 
 '''
 The following classes represent there corresponding database table
@@ -144,6 +153,7 @@ class Guild(Base):
 
 class Messages(Base):
     __tablename__ = "messages"
+    __table_args__ = (UniqueConstraint("guild_id", "message_id", name="messages_guild_message"),)
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     guild_id = Column(BIGINT, ForeignKey('guilds.guild_id'))
@@ -159,6 +169,7 @@ class Messages(Base):
 
 class Profiles(Base):
     __tablename__ = 'profiles'
+    __table_args__ = (UniqueConstraint("guild_id", "user_id", name="profiles_guild_user"),)
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     guild_id = Column(BIGINT, ForeignKey('guilds.guild_id'))
@@ -180,6 +191,7 @@ class Profiles(Base):
 
 class Reaction(Base):
     __tablename__ = "reactions"
+    __table_args__ = (UniqueConstraint("guild_id", "message_id", "emoji", name="reactions_guild_message_emoji"),)
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     guild_id = Column(BIGINT, ForeignKey('guilds.guild_id'))
@@ -239,6 +251,8 @@ class Settings(Base):
     banMessage = Column(VARCHAR(length=2000), default="$USERNAME was banned for spamming/sending duplicate messages.")
     messageDuplicateCount = Column(Integer, default=5)
     messageDuplicateAccuracy = Column(FLOAT, default=90)
+    raidAuthorCount = Column(Integer, default=10)  # 0 turns the raid detection off
+    exactDuplicates = Column(BOOLEAN, default=False)  # scores every message of the window instead of the candidates
     ignoreBots = Column(BOOLEAN, default=True)
 
     guilds = relationship("Guild", back_populates="settings")
@@ -259,21 +273,100 @@ class UserInfo(Base):
     banned_users_cmds = relationship("BannedUsersCmds", back_populates="user_info")
 
 
+# name -> (table, id column) of the lists GuildStates.set_banned_lists fills
+BANNED_LISTS = {
+    "channels_cmd": (BannedChannelsCmds, BannedChannelsCmds.channel_id),
+    "roles_cmd": (BannedRolesCmds, BannedRolesCmds.role_id),
+    "users_cmd": (BannedUsersCmds, BannedUsersCmds.user_id),
+    "channels_spam": (BannedChannelsSpam, BannedChannelsSpam.channel_id),
+    "roles_spam": (BannedRolesSpam, BannedRolesSpam.role_id),
+    "users_spam": (BannedUsersSpam, BannedUsersSpam.user_id),
+}
+
+instrument_engine(engine)
+
+# The queries are blocking, so they run in a bounded pool instead of the event loop
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+class PoolStats:
+    """
+    Counts how long the queries of Db had to wait for a connection of the pool
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self):
+        pool = engine.pool
+        return {
+            "size": pool.size(),
+            "checked out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg wait": f"{self.wait_total / self.checkouts * 1000:.2f}ms" if self.checkouts else "-",
+            "max wait": f"{self.wait_max * 1000:.2f}ms",
+        }
+
+
+pool_stats = PoolStats()
+
+
+def run_in_executor(func):
+    """
+    Runs a query method of Db in the executor with a session of its own, the method stays awaitable
+    :param func: the synchronous method
+    :return: the coroutine function
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(
+            _executor, functools.partial(self._call, func, *args, **kwargs))
+    return wrapper
+
+
 class Db:
     """
     This class is more or less a layer on top of sqlalchemy,
     that can read data from the database and represent it in useful forms.
+    The sessions come from the scoped Session of the config, a Db holds no connection itself,
+    so any amount of them can exist.
     TODO: add consistent error handling
     """
-    def __init__(self):
-        self._session = None
 
     @property
     def session(self):
-        if self._session is None:
-            self._session = Session()
-            return self._session
-        return self._session
+        return Session()
+
+    def _call(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            connection = engine.connect()
+        except exc.TimeoutError:
+            pool_stats.timed_out()
+            raise
+        pool_stats.record(time.perf_counter() - start)
+        # Only reads run here, so the transaction is just rolled back when the session is removed
+        Session(bind=connection)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            Session.remove()
+            connection.close()
 
     def prefix_lookup(self, guild_id: int):
         """
@@ -281,18 +374,72 @@ class Db:
         :param guild_id: the id of the guild
         :returns: the prefix for the given guild
         """
-        prefix = self.session.query(Settings.prefix).filter_by(guild_id=guild_id).one()
-        self.session.commit()
-        return prefix
+        # Runs on the event loop thread, the session is removed so the connection doesn't stay checked out
+        try:
+            return self.session.query(Settings.prefix).filter_by(guild_id=guild_id).one()
+        finally:
+            Session.remove()
+
+    @run_in_executor
+    def get_settings(self, guild_id: int):
+        """
+        Fetches the whole settings row, so a guild can be set up with one round trip
+        :param guild_id: the id of the guild
+        :returns: the settings row with the columns as attributes, None if the guild has none
+        """
+        settings = self.session.query(*Settings.__table__.columns).filter(Settings.guild_id == guild_id).one_or_none()
+        return settings
 
-    async def roles_from_db(self, guild_id: int):
+    @run_in_executor
+    def get_settings_bulk(self, guild_ids):
+        """
+        Fetches the settings rows of many guilds with one query
+        :param guild_ids: the ids of the guilds
+        :returns: dict with the guild id as key and the settings row as value, guilds without settings are missing
+        """
+        rows = self.session.query(*Settings.__table__.columns).filter(Settings.guild_id.in_(list(guild_ids))).all()
+        return {row.guild_id: row for row in rows}
+
+    @run_in_executor
+    def get_banned_lists_bulk(self, guild_ids):
+        """
+        Fetches the banned channels, roles and users for commands and the spam detection of many guilds
+        :param guild_ids: the ids of the guilds
+        :returns: dict with the guild id as key and a dict like GuildStates.set_banned_lists takes as value
+        """
+        guild_ids = list(guild_ids)
+        lists = {guild_id: {name: [] for name in BANNED_LISTS} for guild_id in guild_ids}
+        for name, (table, column) in BANNED_LISTS.items():
+            rows = self.session.query(table.guild_id, column).filter(table.guild_id.in_(guild_ids)).all()
+            for guild_id, target_id in rows:
+                # Same one column rows the single guild getters return
+                lists[guild_id][name].append((target_id,))
+        return lists
+
+    @run_in_executor
+    def get_reaction_roles_bulk(self, guild_ids):
+        """
+        Fetches the reaction roles of many guilds with one query
+        :param guild_ids: the ids of the guilds
+        :returns: dict with the guild id as key and a dict with (message id, emoji) -> role id as value
+        """
+        guild_ids = list(guild_ids)
+        roles = {guild_id: {} for guild_id in guild_ids}
+        rows = self.session.query(Reaction.guild_id, Reaction.message_id, Reaction.emoji,
+                                  Reaction.role_id).filter(Reaction.guild_id.in_(guild_ids)).all()
+        for guild_id, message_id, emoji, role_id in rows:
+            roles[guild_id].setdefault((message_id, emoji), role_id)
+        return roles
+
+    @run_in_executor
+    def roles_from_db(self, guild_id: int):
         # returns a tuple with all role name's and id's
 
         roles = self.session.query(Roles.role_name, Roles.role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return roles
 
-    async def get_admin_role(self, guild_id: int):
+    @run_in_executor
+    def get_admin_role(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -300,10 +447,10 @@ class Db:
         """
 
         role_id = self.session.query(Settings.admin_role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return role_id[0]
 
-    async def get_dev_role(self, guild_id: int):
+    @run_in_executor
+    def get_dev_role(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -311,10 +458,10 @@ class Db:
         """
 
         role_id = self.session.query(Settings.dev_role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return role_id[0]
 
-    async def get_mod_role(self, guild_id: int):
+    @run_in_executor
+    def get_mod_role(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -322,10 +469,10 @@ class Db:
         """
 
         role_id = self.session.query(Settings.mod_role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return role_id[0]
 
-    async def get_standard_role(self, guild_id: int):
+    @run_in_executor
+    def get_standard_role(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -333,10 +480,10 @@ class Db:
         """
 
         role_id = self.session.query(Settings.standard_role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return role_id[0]
 
-    async def get_warns(self, guild_id: int, user_id: int):
+    @run_in_executor
+    def get_warns(self, guild_id: int, user_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -345,12 +492,12 @@ class Db:
         """
         warnings = self.session.query(Profiles.warnings).filter(Profiles.guild_id == guild_id,
                                                                 Profiles.user_id == user_id).all()
-        self.session.commit()
         if not warnings:
             return 0
         return warnings[0][0]
 
-    async def get_welcome_channel(self, guild_id: int):
+    @run_in_executor
+    def get_welcome_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -358,10 +505,10 @@ class Db:
         """
 
         welcome_channel = self.session.query(Settings.welcome_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return welcome_channel[0]
 
-    async def get_cmd_channel(self, guild_id: int):
+    @run_in_executor
+    def get_cmd_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -369,10 +516,10 @@ class Db:
         """
 
         cmd_channel = self.session.query(Settings.cmd_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return cmd_channel[0]
 
-    async def get_lvl_channel(self, guild_id: int):
+    @run_in_executor
+    def get_lvl_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -380,10 +527,10 @@ class Db:
         """
 
         lvl_channel = self.session.query(Settings.lvl_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return lvl_channel[0]
 
-    async def get_leave_channel(self, guild_id: int):
+    @run_in_executor
+    def get_leave_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -391,10 +538,10 @@ class Db:
         """
 
         leave_channel = self.session.query(Settings.leave_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return leave_channel[0]
 
-    async def get_stdout_channel(self, guild_id: int):
+    @run_in_executor
+    def get_stdout_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -402,10 +549,10 @@ class Db:
         """
 
         stdout_channel = self.session.query(Settings.stdout_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return stdout_channel[0]
 
-    async def get_warn_channel(self, guild_id: int):
+    @run_in_executor
+    def get_warn_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -413,10 +560,10 @@ class Db:
         """
 
         stdout_channel = self.session.query(Settings.warn_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return stdout_channel[0]
 
-    async def get_kick_channel(self, guild_id: int):
+    @run_in_executor
+    def get_kick_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -424,10 +571,10 @@ class Db:
         """
 
         stdout_channel = self.session.query(Settings.kick_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return stdout_channel[0]
 
-    async def get_ban_channel(self, guild_id: int):
+    @run_in_executor
+    def get_ban_channel(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -435,10 +582,10 @@ class Db:
         """
 
         stdout_channel = self.session.query(Settings.ban_channel_id).filter_by(guild_id=guild_id).one()
-        self.session.commit()
         return stdout_channel[0]
 
-    async def get_leave_text(self, guild_id: int):
+    @run_in_executor
+    def get_leave_text(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -446,10 +593,10 @@ class Db:
         """
 
         leave_text = self.session.query(Settings.leave_text).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return leave_text[0][0]
 
-    async def get_img(self, guild_id: int):
+    @run_in_executor
+    def get_img(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -457,10 +604,10 @@ class Db:
         """
 
         img = self.session.query(Settings.imgwelcome_toggle).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return img[0][0]
 
-    async def get_img_text(self, guild_id: int):
+    @run_in_executor
+    def get_img_text(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -468,10 +615,10 @@ class Db:
         """
 
         text = self.session.query(Settings.imgwelcome_text).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return text[0][0]
 
-    async def get_text_xp(self, guild_id: int, user_id: int):
+    @run_in_executor
+    def get_text_xp(self, guild_id: int, user_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -481,10 +628,23 @@ class Db:
 
         xp = self.session.query(Profiles.text_xp).filter(Profiles.guild_id == guild_id,
                                                          Profiles.user_id == user_id).all()
-        self.session.commit()
         return xp[0][0]
 
-    async def get_lvl_text(self, guild_id: int, user_id: int):
+    @run_in_executor
+    def get_profile(self, guild_id: int, user_id: int):
+        """
+        Fetches everything the profile cache holds with one query
+        :param guild_id: the id of the guild
+        :param user_id: the ID of the user
+        :returns: tuple with text_xp, text_lvl and warnings, None if the user has no profile
+        """
+        profile = self.session.query(Profiles.text_xp, Profiles.text_lvl,
+                                     Profiles.warnings).filter(Profiles.guild_id == guild_id,
+                                                               Profiles.user_id == user_id).first()
+        return profile
+
+    @run_in_executor
+    def get_lvl_text(self, guild_id: int, user_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -494,10 +654,10 @@ class Db:
 
         lvl = self.session.query(Profiles.text_lvl).filter(Profiles.guild_id == guild_id,
                                                            Profiles.user_id == user_id).all()
-        self.session.commit()
         return lvl[0][0]
 
-    async def get_levelsystem(self, guild_id: int):
+    @run_in_executor
+    def get_levelsystem(self, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -505,10 +665,10 @@ class Db:
         """
 
         lvl_toggle = self.session.query(Settings.levelsystem_toggle).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return lvl_toggle[0][0]
 
-    async def get_banned_until(self, user_id: int, guild_id: int):
+    @run_in_executor
+    def get_banned_until(self, user_id: int, guild_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -518,24 +678,37 @@ class Db:
 
         date = self.session.query(Profiles.banned_until).filter(Profiles.guild_id == guild_id,
                                                                 Profiles.user_id == user_id).all()
-        self.session.commit()
         return date[0][0]
 
-    async def get_bannlist(self, user_id: int):
+    @run_in_executor
+    def get_bannlist(self, user_id: int):
         """
         Searches in the db if the user is blacklisted
         :param user_id: the ID of the user
         :returns: if the user is in the blacklist if false the user isnt blacklisted
         """
 
-        user = self.session.query(Banlist.user_id).filter_by(user_id=user_id).all()
-        self.session.commit()
-        if user_id in user:
-            return True
-        else:
-            return False
+        user = self.session.query(Banlist.id).filter(Banlist.user_id == user_id).first()
+        return user is not None
 
-    async def get_message(self, guild_id: int, message_id: int):
+    @run_in_executor
+    def get_blacklist_since(self, last_id: int):
+        """
+        Fetches the blacklist entries that were added after a given row
+        :param last_id: the highest row id that is already known, 0 for all
+        :returns: list of (id, user_id) tuples ordered by id
+        """
+        return self.session.query(Banlist.id, Banlist.user_id).filter(Banlist.id > last_id).order_by(Banlist.id).all()
+
+    @run_in_executor
+    def get_blacklist_count(self):
+        """
+        :returns: the amount of rows in the blacklist
+        """
+        return self.session.query(func.count(Banlist.id)).scalar()
+
+    @run_in_executor
+    def get_message(self, guild_id: int, message_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -545,10 +718,10 @@ class Db:
 
         message = self.session.query(Messages.message, Messages.user_id).filter(Messages.message_id == message_id,
                                                                                 Messages.guild_id == guild_id).all()
-        self.session.commit()
         return message
 
-    async def get_guild_byuserid(self, user_id: int):
+    @run_in_executor
+    def get_guild_byuserid(self, user_id: int):
         """
 
         :param user_id: the id of the user
@@ -556,10 +729,10 @@ class Db:
         """
 
         guilds = self.session.query(UserInfo.guild_id).filter_by(user_id=user_id).all()
-        self.session.commit()
         return guilds
 
-    async def get_reaction_role(self, guild_id: int, message_id: int, emoji):
+    @run_in_executor
+    def get_reaction_role(self, guild_id: int, message_id: int, emoji):
         """
 
         :param guild_id: the id of the guild
@@ -571,12 +744,26 @@ class Db:
         roleid = self.session.query(Reaction.role_id).filter(Reaction.message_id == message_id,
                                                              Reaction.guild_id == guild_id,
                                                              Reaction.emoji == emoji).all()
-        self.session.commit()
         if not roleid:
             return False
         return roleid[0][0]
 
-    async def leaderboard(self, guild_id: int):
+    @run_in_executor
+    def get_text_xp_bulk(self, guild_ids):
+        """
+        Fetches the text xp of every user with any in many guilds, the ids are queried in chunks
+        :param guild_ids: the ids of the guilds
+        :returns: list of (guild_id, user_id, text_xp) tuples
+        """
+        rows = []
+        for i in range(0, len(guild_ids), 500):
+            rows += self.session.query(Profiles.guild_id, Profiles.user_id,
+                                       Profiles.text_xp).filter(Profiles.guild_id.in_(guild_ids[i:i + 500]),
+                                                                Profiles.text_xp > 0).all()
+        return rows
+
+    @run_in_executor
+    def leaderboard(self, guild_id: int):
         """
 
         :param guild_id:  the id of the guild
@@ -586,10 +773,10 @@ class Db:
         ranks = self.session.query(Profiles.text_lvl, Profiles.text_xp,
                                    Profiles.user_id).filter(Profiles.guild_id == guild_id).order_by(
             Profiles.text_xp.desc())[0:10]
-        self.session.commit()
         return ranks
 
-    async def get_spam_settings(self, guild_id: int):
+    @run_in_executor
+    def get_spam_settings(self, guild_id: int):
         """
 
         :param guild_id: the id of the given guild
@@ -620,6 +807,10 @@ class Db:
             Amount of duplicate messages needed within messageInterval to trip a ban
         messageDuplicateAccuracy : float, optional
             How 'close' messages need to be to be registered as duplicates (Out of 100)
+        raidAuthorCount : int, optional
+            Amount of distinct users posting the same payload within messageInterval that counts as a raid, 0 is off
+        exactDuplicates : bool, optional
+            Compare each message with the whole window instead of only the similar looking ones
         ignorePerms : list, optional
             The perms (ID Form), that bypass anti-spam
         ignoreUsers : list, optional
@@ -631,12 +822,13 @@ class Db:
         settings = self.session.query(Settings.warnThreshold, Settings.kickThreshold, Settings.banThreshold,
                                       Settings.messageInterval, Settings.warnMessage, Settings.kickMessage,
                                       Settings.banMessage,
-                                      Settings.messageDuplicateCount, Settings.messageDuplicateAccuracy
+                                      Settings.messageDuplicateCount, Settings.messageDuplicateAccuracy,
+                                      Settings.raidAuthorCount, Settings.exactDuplicates
                                       ).filter(Settings.guild_id == guild_id).all()
-        self.session.commit()
         return settings
 
-    async def get_kick_count(self, guild_id: int, user_id: int):
+    @run_in_executor
+    def get_kick_count(self, guild_id: int, user_id: int):
         """
 
         :param guild_id: the id of the guild
@@ -645,12 +837,37 @@ class Db:
         """
         kickcount = self.session.query(Profiles.kickCount).filter(Profiles.guild_id == guild_id,
                                                                   Profiles.user_id == user_id).all()
-        self.session.commit()
         if not kickcount:
             return 0
         return kickcount[0][0]
 
-    async def get_banned_channels_cmd(self, guild_id: int, command: str = None):
+    @run_in_executor
+    def get_punishment_counts(self, guild_ids, user_ids=None):
+        """
+        Fetches the warnings and kick counts of many users at once, the ids are queried in chunks
+        :param guild_ids: the ids of the guilds
+        :param user_ids: the ids of the users, if none only users with at least one warning or kick are returned
+        :returns: dict with (guild_id, user_id) as key and (warnings, kickCount) as value, missing users have 0 of both
+        """
+        guild_ids = list(guild_ids)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+        counts = {}
+        for i in range(0, len(guild_ids), 500):
+            query = self.session.query(Profiles.guild_id, Profiles.user_id, Profiles.warnings,
+                                       Profiles.kickCount).filter(Profiles.guild_id.in_(guild_ids[i:i + 500]))
+            if user_ids is None:
+                rows = query.filter(or_(Profiles.warnings > 0, Profiles.kickCount > 0)).all()
+            else:
+                rows = []
+                for j in range(0, len(user_ids), 500):
+                    rows += query.filter(Profiles.user_id.in_(user_ids[j:j + 500])).all()
+            for guild_id, user_id, warnings, kickcount in rows:
+                counts[(guild_id, user_id)] = (warnings or 0, kickcount or 0)
+        return counts
+
+    @run_in_executor
+    def get_banned_channels_cmd(self, guild_id: int, command: str = None):
         """
         Returns the banned channels for the given command
         :param guild_id: id of the given guild
@@ -658,10 +875,10 @@ class Db:
         :return: list of channel ids
         """
         channels_cmds = self.session.query(BannedChannelsCmds.channel_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return channels_cmds
 
-    async def get_banned_roles_cmd(self, guild_id: int, command: str = None):
+    @run_in_executor
+    def get_banned_roles_cmd(self, guild_id: int, command: str = None):
         """
         Returns the banned roles for the given command
         :param guild_id:id of the given guild
@@ -669,10 +886,10 @@ class Db:
         :return:list with role ids
         """
         channels_cmds = self.session.query(BannedRolesCmds.role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return channels_cmds
 
-    async def get_banned_users_cmd(self, guild_id: int, command: str = None):
+    @run_in_executor
+    def get_banned_users_cmd(self, guild_id: int, command: str = None):
         """
         Returns the banned users from spam detection
         :param guild_id:id of the given guild
@@ -680,35 +897,34 @@ class Db:
         :return: list with user ids
         """
         channels_cmds = self.session.query(BannedUsersCmds.user_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return channels_cmds
 
-    async def get_banned_channels_spam(self, guild_id: int):
+    @run_in_executor
+    def get_banned_channels_spam(self, guild_id: int):
         """
         Returns the banned channels from spam detection
         :param guild_id:id of the given guild
         :return:list of channel ids
         """
         channels_spam = self.session.query(BannedChannelsSpam.channel_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return channels_spam
 
-    async def get_banned_roles_spam(self, guild_id: int):
+    @run_in_executor
+    def get_banned_roles_spam(self, guild_id: int):
         """
         Returns the banned roles from spam detection
         :param guild_id:id of the given guild
         :return:list with role ids
         """
         roles_spam = self.session.query(BannedRolesSpam.role_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return roles_spam
 
-    async def get_banned_users_spam(self, guild_id: int):
+    @run_in_executor
+    def get_banned_users_spam(self, guild_id: int):
         """
         Returns the banned users from spam detection
         :param guild_id: id of the given guild
         :return: list with user ids
         """
         user_spam = self.session.query(BannedUsersSpam.user_id).filter_by(guild_id=guild_id).all()
-        self.session.commit()
         return user_spam
@@ -1,5 +1,10 @@
+import functools
+
 from discord.ext import commands
 
+from base_folder.bot.modules.base.db_management import pool_stats
+from base_folder.query_stats import query_stats
+from base_folder.config import QUEUE_TASKS
 from base_folder.bot.utils.Permissions_checks import admin
 from base_folder.bot.utils.util_functions import success_embed, error_embed
 from base_folder.celery.db import *
@@ -95,6 +100,103 @@ class Dev(commands.Cog):
         await ctx.send(embed=e)
         return e
 
+    @commands.command(pass_context=True, name="cache_stats", brief="Shows the size of the internal caches",
+                      usage="cache_stats")
+    @commands.is_owner()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def cache_stats(self, ctx):
+        e = success_embed(self.client)
+        e.title = "Cache stats"
+        for name, value in self.client.cache.users.stats().items():
+            e.add_field(name=f"Anti spam {name}", value=str(value), inline=True)
+        for name, value in self.client.cache.punishment_buffer.stats().items():
+            e.add_field(name=f"Punishments {name}", value=str(value), inline=True)
+        for name, value in self.client.cache.profiles.stats().items():
+            e.add_field(name=f"Profiles {name}", value=str(value), inline=True)
+        for name, value in self.client.cache.xp_accumulator.stats().items():
+            e.add_field(name=f"XP {name}", value=str(value), inline=True)
+        for name, value in self.client.cache.message_buffer.stats().items():
+            e.add_field(name=f"Messages {name}", value=str(value), inline=True)
+        for name, value in self.client.cache.blacklist.stats().items():
+            e.add_field(name=f"Blacklist {name}", value=str(value), inline=True)
+        await ctx.send(embed=e)
+
+    @commands.command(pass_context=True, name="pool_stats", brief="Shows the usage of the database connection pool",
+                      usage="pool_stats")
+    @commands.is_owner()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def pool_stats(self, ctx):
+        e = success_embed(self.client)
+        e.title = "Connection pool"
+        for name, value in pool_stats.stats().items():
+            e.add_field(name=name, value=str(value), inline=True)
+        # Asks a worker of every queue, each one has its own processes and pools
+        for queue in QUEUE_TASKS:
+            try:
+                result = worker_pool_stats.apply_async(queue=queue)
+                worker = await self.client.loop.run_in_executor(None, functools.partial(result.get, timeout=5))
+                for name, value in worker.items():
+                    e.add_field(name=f"{queue} worker {name}", value=str(value), inline=True)
+            except Exception as ex:
+                e.add_field(name=f"{queue} worker", value=f"The worker didn't answer: {ex}", inline=False)
+        await ctx.send(embed=e)
+
+    @commands.command(pass_context=True, name="top_queries", brief="Shows the statements with the most database "
+                                                                    "time", usage="top_queries amount")
+    @commands.is_owner()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def top_queries(self, ctx, amount: int = 5):
+        amount = max(1, min(amount, 10))  # two sections with up to 10 fields each fit into an embed
+        try:
+            result = top_queries.delay(amount)
+            worker = await self.client.loop.run_in_executor(None, functools.partial(result.get, timeout=5))
+        except Exception as ex:
+            worker = ex
+        for title, stats in (("Bot", query_stats.top(amount)), ("Worker", worker)):
+            e = success_embed(self.client)
+            e.title = f"{title} queries"
+            if isinstance(stats, Exception):
+                e.description = f"The worker didn't answer: {stats}"
+            elif not stats:
+                e.description = "No queries yet"
+            for row in stats if isinstance(stats, list) else ():
+                e.add_field(name=f"{row['count']}x, {row['total']}ms total, avg {row['avg']}ms, "
+                                 f"p99 {row['p99']}ms, max {row['max']}ms",
+                            value=row['shape'][:1000], inline=False)
+            await ctx.send(embed=e)
+
+    @commands.command(pass_context=True, name="blacklist", brief="Bans a user from every guild the bot is in on join",
+                      usage="blacklist userid")
+    @commands.is_owner()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def blacklist(self, ctx, userid: int):
+        blacklist_add.delay(userid)
+        self.client.cache.blacklist.add(userid)
+        e = success_embed(self.client)
+        e.description = f"{userid} is now blacklisted"
+        await ctx.send(embed=e)
+
+    @commands.command(pass_context=True, name="unblacklist", brief="Removes a user from the blacklist",
+                      usage="unblacklist userid")
+    @commands.is_owner()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def unblacklist(self, ctx, userid: int):
+        blacklist_remove.delay(userid)
+        self.client.cache.blacklist.discard(userid)
+        e = success_embed(self.client)
+        e.description = f"{userid} was removed from the blacklist"
+        await ctx.send(embed=e)
+
     @commands.command(hidden=True, name="leave", brief="leaves a specific guild", usage="leave guildid")
     @commands.is_owner()
     async def leave(self, ctx, guildid: int):
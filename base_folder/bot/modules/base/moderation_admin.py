@@ -82,14 +82,13 @@ class ModerationAdmin(commands.Cog):
     @purge_command_in_channel
     @logging_to_channel_cmd
     async def clear_infractions(self, ctx, member: discord.Member = None):
-        warnings = await self.client.sql.get_warns(ctx.guild.id, member.id)
+        warnings = await self.client.cache.states[ctx.guild.id].get_warns(member.id)
         e = build_embed(author=self.client.user.name, author_img=self.client.user.avatar_url, title="Infractions cleared!",
                         description=f"{member} Had {warnings} infractions but now {member} has 0!",
                         timestamp=datetime.datetime.now(),
                         )
         await ctx.send(embed=e)
-        self.client.cache.states[ctx.guild.id].users[ctx.author.id].warn_count = 0
-        edit_warns.delay(ctx.guild.id, member.id, 0)
+        self.client.cache.states[ctx.guild.id].update_warns(member.id, 0)
         return e
 
 
@@ -174,11 +174,11 @@ class ModerationMod(commands.Cog):
     @purge_command_in_channel
     @logging_to_channel_cmd
     async def warn(self, ctx, member: discord.Member = None, *, reason="you made a mistake"):
-        warnings = await self.client.sql.get_warns(ctx.guild.id, member.id)
+        warnings = await self.client.cache.states[ctx.guild.id].get_warns(member.id)
         e = success_embed(self.client)
         if warnings == 0:
             warnings += 1
-            edit_warns.delay(ctx.guild.id, member.id, warnings)
+            self.client.cache.states[ctx.guild.id].update_warns(member.id, warnings)
             e.description = f"{member.mention} you have been warned this is your " \
                             f"first infraction keep it at this, reason {reason}"
             await member.send(embed=e)
@@ -186,7 +186,7 @@ class ModerationMod(commands.Cog):
         else:
             warnings += 1
             e.description = f"{member.mention} you have been warned, you have now {warnings} warning(s)"
-            edit_warns.delay(ctx.guild.id, member.id, warnings)
+            self.client.cache.states[ctx.guild.id].update_warns(member.id, warnings)
             await member.send(embed=e)
             await ctx.send(embed=e)
         return e
@@ -201,7 +201,7 @@ class ModerationMod(commands.Cog):
     @logging_to_channel_cmd
     async def infractions(self, ctx, member: discord.Member = None):
         e = success_embed(self.client)
-        warnings = await self.client.sql.get_warns(ctx.guild.id, member.id)
+        warnings = await self.client.cache.states[ctx.guild.id].get_warns(member.id)
         e.description = f"{member.mention} Has {warnings} infraction(s)!"
         await ctx.send(embed=e)
         return e
@@ -8,7 +8,7 @@ class Fun(commands.Cog):
 
     @commands.command(aliases=["vc", "voice"], brief="In den Voice schleifen")
     async def vc(self, ctx, member: discord.member):
-        stdoutchannel = self.client.get_channel(self.client.cache.states[ctx.guild.id].get_channel())
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[ctx.guild.id].channel())
         if stdoutchannel is not None:
             await self.client.log.stdout(stdoutchannel, ctx.message.content, ctx)
         await self.client.log.stdout(stdoutchannel, ctx.message.content, ctx)
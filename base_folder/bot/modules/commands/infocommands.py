@@ -7,6 +7,7 @@ import platform
 from base_folder.bot.utils.util_functions import success_embed, build_embed
 from base_folder.bot.utils.Permissions_checks import user, mod
 from base_folder.bot.utils.checks import check_args_datatyp, logging_to_channel_stdout, purge_command_in_channel
+from base_folder.bot.modules.listener.levelsystem import level
 
 
 class UserCmds(commands.Cog):
@@ -19,9 +20,10 @@ class UserCmds(commands.Cog):
     @logging_to_channel_stdout
     @purge_command_in_channel
     async def profile(self, ctx):
-        xp = await self.client.sql.get_text_xp(ctx.guild.id, ctx.author.id)
-        lvl = await self.client.sql.get_lvl_text(ctx.guild.id, ctx.author.id)
-        warnings = await self.client.sql.get_warns(ctx.guild.id, ctx.author.id)
+        profile = await self.client.cache.profiles.get(ctx.guild.id, ctx.author.id)
+        xp, lvl = profile.text_xp, profile.text_lvl
+        # The anti spam state can hold warnings that aren't in the profile yet
+        warnings = await self.client.cache.states[ctx.guild.id].get_warns(ctx.author.id)
         e = build_embed(
             author=ctx.author.display_name,
             author_img=ctx.author.avatar_url,
@@ -61,34 +63,49 @@ class UserCmds(commands.Cog):
         await ctx.send(embed=e)
 
     @commands.command(pass_context=True, name="leaderboard", brief="Shows the leaderboard for text xp",
-                      usage="leaderboard")
+                      usage="leaderboard page")
     @user()
     @check_args_datatyp
     @logging_to_channel_stdout
     @purge_command_in_channel
-    async def leaderboard(self, ctx):
-        lvl = []
-        xp = []
-        userlist = []
-        ranks = await self.client.sql.leaderboard(ctx.guild.id)
-        for user in ranks:
-            userlist.append(user[2])
-            lvl.append(user[1])
-            xp.append(user[0])
+    async def leaderboard(self, ctx, page: int = 1):
+        ranks = (await self.client.cache.leaderboards.ranking(ctx.guild.id)).page(page - 1)
         embed = discord.Embed(
             colour=ctx.author.colour,
             timestamp=datetime.datetime.utcnow()
         )
-        embed.set_author(name="Leaderboard for the server")
+        embed.set_author(name=f"Leaderboard for the server, page {page}")
         embed.set_footer(text=f"Requested by {ctx.author.display_name}", icon_url=ctx.author.avatar_url)
-        for index, u in enumerate(zip(userlist, lvl, xp), start=1):
+        if not ranks:
+            embed.description = "Nobody is on this page"
+        for rank, user_id, xp in ranks:
             embed.add_field(
-                name=f"Rank {index} ",
-                value=f"User:\t** <@{ u[0]}> **\n Level:{str(u[1])} xp:{str(u[2])}",
+                name=f"Rank {rank} ",
+                value=f"User:\t** <@{user_id}> **\n Level:{level(xp)} xp:{xp}",
                 inline=False
             )
         await ctx.send(embed=embed)
 
+    @commands.command(pass_context=True, name="rank", brief="Shows the leaderboard rank of you or a member",
+                      usage="rank @member")
+    @commands.guild_only()
+    @user()
+    @check_args_datatyp
+    @logging_to_channel_stdout
+    @purge_command_in_channel
+    async def rank(self, ctx, member: discord.Member = None):
+        member = member or ctx.author
+        ranking = await self.client.cache.leaderboards.ranking(ctx.guild.id)
+        e = success_embed(self.client)
+        rank = ranking.rank(member.id)
+        if rank is None:
+            e.description = f"{member.mention} has no xp yet"
+        else:
+            xp = ranking.xp(member.id)
+            e.description = f"{member.mention} is rank **#{rank}** of {len(ranking)} " \
+                            f"with level {level(xp)} and {xp}XP"
+        await ctx.send(embed=e)
+
     @commands.command(pass_context=True, name="roleinfo",
                       brief="Info about a role", usage="roleinfo @role")
     @commands.guild_only()
@@ -42,7 +42,7 @@ class IMGWelcome(commands.Cog):
         self.client = bot
 
     async def __is_enabled(self, guild: int):
-        if self.client.cache.states[guild].get_imgtoggle == 1:
+        if await self.client.cache.states[guild].imgtoggle() == 1:
             return True
         else:
             return False
@@ -153,7 +153,7 @@ class IMGWelcome(commands.Cog):
     @commands.Cog.listener()
     async def on_member_join(self, member):
         guild = member.guild
-        channel = self.client.get_channel(self.client.cache.states[member.guild.id].get_channel("welcome"))
+        channel = self.client.get_channel(await self.client.cache.states[member.guild.id].channel("welcome"))
         print("test")
         if not channel:
             return
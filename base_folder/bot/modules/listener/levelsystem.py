@@ -2,21 +2,21 @@ from discord.ext import commands
 
 from base_folder.bot.utils.Permissions_checks import mod
 from base_folder.bot.utils.util_functions import success_embed
-from base_folder.celery.db import update_text_lvl, update_xp_text, edit_settings_levelsystem
+from base_folder.celery.db import edit_settings_levelsystem
 from base_folder.bot.utils.checks import check_args_datatyp, logging_to_channel_stdout, purge_command_in_channel
 
 
-async def update_data(ctx, xp):
-    amount = 0
-    for i in str(ctx.content).split(" "):
-        amount += 1
-    xp += amount
-    update_xp_text.delay(ctx.guild.id, ctx.author.id, xp)
-    return xp
+def earned_xp(message):
+    # Every word is worth one xp
+    return len(str(message.content).split(" "))
+
+
+def level(xp):
+    return int(float(int(xp) ** (1 / 4)))
 
 
 async def _enabled(client, guildid):
-    if client.cache.states[guildid].get_levelsystem == 1:
+    if await client.cache.states[guildid].levelsystem() == 1:
         return True
     else:
         return False
@@ -34,7 +34,7 @@ class Levelsystem(commands.Cog):
     @purge_command_in_channel
     async def levelsystemtoggle(self, ctx):
         e = success_embed(self.client)
-        if self.client.cache.states[ctx.guild.id].get_levelsystem == 1:
+        if await self.client.cache.states[ctx.guild.id].levelsystem() == 1:
             edit_settings_levelsystem.delay(ctx.guild.id, 0)
             e.description = "The levelsystem is now disabled"
         else:
@@ -53,23 +53,29 @@ class Levelsystem(commands.Cog):
             return
         if message.author.id == self.client.user.id:
             return
-        channel_id = self.client.cache.states[message.guild.id].get_channel("lvl")
+        channel_id = await self.client.cache.states[message.guild.id].channel("lvl")
         print(channel_id)
         if channel_id is None or channel_id == 0:
             channel = message.guild.system_channel
         else:
             channel = self.client.get_channel(channel_id)
-        xp_before = await self.client.sql.get_text_xp(message.guild.id, message.author.id)
-        xp_after = await update_data(message, xp_before)
-        e = success_embed(self.client)
-        lvl_start = await self.client.sql.get_lvl_text(message.guild.id, message.author.id)
-        lvl_end = int(float(int(xp_after) ** (1 / 4)))
-        if lvl_start < lvl_end:
+        profile = await self.client.cache.profiles.get(message.guild.id, message.author.id)
+        earned = earned_xp(message)
+        xp_after = profile.text_xp + earned
+        lvl_start = profile.text_lvl
+        lvl_end = level(xp_after)
+        leveled_up = lvl_start < lvl_end
+        # The accumulator writes the xp and the level with its next flush
+        self.client.cache.xp_accumulator.add(message.guild.id, message.author.id, earned,
+                                             lvl_end if leveled_up else None)
+        self.client.cache.profiles.update(message.guild.id, message.author.id, text_xp=xp_after,
+                                          text_lvl=max(lvl_start, lvl_end))
+        self.client.cache.leaderboards.update(message.guild.id, message.author.id, xp_after)
+        if leveled_up:
+            e = success_embed(self.client)
             e.title = "LEEVEEL UP"
             e.description = f"{message.author.mention} reached level {lvl_end} and has now {xp_after}XP"
             await channel.send(embed=e)
-            update_text_lvl.delay(message.guild.id, message.author.id, lvl_end)
-            update_xp_text.delay(message.guild.id, message.author.id, xp_after)
 
 
 def setup(client):
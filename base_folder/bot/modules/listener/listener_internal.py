@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 from base_folder.bot.utils.util_functions import build_embed
-from base_folder.celery.db import initialize_guild, is_user_indb, insert_message, roles_to_db
+from base_folder.celery.db import initialize_guild, is_user_indb, roles_to_db
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from base_folder.bot.utils.checks import logging_to_channel_stdout, purge_command_in_channel
 
@@ -48,7 +48,8 @@ class Internal(commands.Cog):
         if message.author.id == self.client.user.id:
             return
 
-        insert_message.delay(message.guild.id, message.author.id, message.id, message.channel.id, message.content)
+        self.client.cache.message_buffer.append(message.guild.id, message.author.id, message.id, message.channel.id,
+                                                message.content)
     # TODO: FIX GUILD ID etc
 
     @commands.Cog.listener()
@@ -58,7 +59,7 @@ class Internal(commands.Cog):
             content = await self.client.sql.get_message(guildid, payload.message_id)
             if not content:
                 return
-            stdoutchannel = self.client.get_channel(self.client.cache.states[int(guildid)].get_channel())
+            stdoutchannel = self.client.get_channel(await self.client.cache.states[int(guildid)].channel())
             if stdoutchannel is None:
                 return
             channel = self.client.get_channel(payload.channel_id)
@@ -79,7 +80,7 @@ class Internal(commands.Cog):
             content = await self.client.sql.get_message(payload.guild_id, payload.message_id)
             if not content:
                 return
-            stdoutchannel = self.client.get_channel(self.client.cache.states[payload.guild_id].get_channel())
+            stdoutchannel = self.client.get_channel(await self.client.cache.states[payload.guild_id].channel())
             if stdoutchannel is None:
                 return
             channel = self.client.get_channel(payload.channel_id)
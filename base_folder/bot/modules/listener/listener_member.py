@@ -12,10 +12,9 @@ class ListenerMember(commands.Cog):
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        stdoutchannel = self.client.get_channel(self.client.cache.states[member.guild.id].get_channel())
-        blacklisted = await self.client.sql.get_blacklist(member.id)
-        if blacklisted:
-            await member.ban(member, reason="Blacklisted")
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[member.guild.id].channel())
+        if await self.client.cache.blacklist.is_blacklisted(member.id):
+            await member.ban(reason="Blacklisted")
             if stdoutchannel is not None:
                 await self.client.log.stdout(stdoutchannel, f"Member {member.name} was banned reason : blacklisted")
             return
@@ -33,7 +32,7 @@ class ListenerMember(commands.Cog):
     async def on_member_remove(self, member):
         if member.id == self.client.user.id:
             return
-        stdoutchannel = self.client.get_channel(self.client.cache.states[member.guild.id].get_channel())
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[member.guild.id].channel())
         if stdoutchannel is not None:
             await self.client.log.stdout(stdoutchannel, f"Member {member.name} left or got banned/kicked")
         channel_id = await self.client.sql.get_leave_channel(self.client, member.guild.id)
@@ -57,7 +56,7 @@ class ListenerMember(commands.Cog):
         data = await self.client.sql.get_guild_byuserid(before.id)
         for guildID in range(len(data)):
             guild_id = data[guildID][0]
-            stdoutchannel = self.client.get_channel(self.client.cache.states[guild_id].get_channel())
+            stdoutchannel = self.client.get_channel(await self.client.cache.states[guild_id].channel())
             if stdoutchannel is not None:
                 if before.display_name != after.display_name:
                     await self.client.log.stdout(stdoutchannel, f"Member {after.name}#{after.discriminator} "
@@ -77,9 +76,9 @@ class ListenerMember(commands.Cog):
     async def on_member_update(self, before, after):
         if before.display_name != after.display_name:
             if not before.guild.id:
-                stdoutchannel = self.client.get_channel(self.client.cache.states[after.guild.id].get_channel())
+                stdoutchannel = self.client.get_channel(await self.client.cache.states[after.guild.id].channel())
             else:
-                stdoutchannel = self.client.get_channel(self.client.cache.states[before.guild.id].get_channel())
+                stdoutchannel = self.client.get_channel(await self.client.cache.states[before.guild.id].channel())
             if stdoutchannel is None:
                 return
             await self.client.log.stdout(stdoutchannel, f"Member {after.name} changed their nickname "
@@ -88,7 +87,7 @@ class ListenerMember(commands.Cog):
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         if member:
-            stdoutchannel = self.client.get_channel(self.client.cache.states[member.guild.id].get_channel())
+            stdoutchannel = self.client.get_channel(await self.client.cache.states[member.guild.id].channel())
             if stdoutchannel is not None:
                 if before.deaf != after.deaf:
                     if after.deaf:
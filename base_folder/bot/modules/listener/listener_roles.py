@@ -13,21 +13,21 @@ class ListenerRoles(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_role_create(self, role: discord.Role):
-        stdoutchannel = self.client.get_channel(self.client.cache.states[role.guild.id].get_channel())
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[role.guild.id].channel())
         if stdoutchannel is not None:
             await self.client.log.stdout(stdoutchannel, f"Role {role.name} got created")
         roles_to_db.delay(role.guild.id, role.name, role.id)
 
     @commands.Cog.listener()
     async def on_guild_role_delete(self, role: discord.Role):
-        stdoutchannel = self.client.get_channel(self.client.cache.states[role.guild.id].get_channel())
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[role.guild.id].channel())
         if stdoutchannel is not None:
             await self.client.log.stdout(stdoutchannel, f"Role {role.name} got deleted")
         remove_role.delay(role.guild.id, role.id)
 
     @commands.Cog.listener()
     async def on_guild_role_update(self, before, after):
-        stdoutchannel = self.client.get_channel(self.client.cache.states[before.guild.id].get_channel())
+        stdoutchannel = self.client.get_channel(await self.client.cache.states[before.guild.id].channel())
         if stdoutchannel is not None:
             if before.name != after.name:
                 await self.client.log.stdout(stdoutchannel, f"Role {after.name} got updated from {before.name} to {after.name}")
@@ -1,15 +1,13 @@
-import datetime
-
 import asyncio
 import logging
-from copy import deepcopy
+from collections import deque
 
 import discord
 import discord.ext.commands
-from fuzzywuzzy import fuzz
 
 from base_folder.bot.utils.exceptions import DuplicateObject, LogicError, MissingGuildPermissions, ObjectMismatch
-from base_folder.bot.utils.util_functions import transform_message, send_to_obj
+from base_folder.bot.utils.util_functions import transform_message, send_to_obj, snowflake_time_ms
+from base_folder.bot.utils.spam_index import SimilarityIndex, score_window, token_sort_key
 from base_folder.celery.db import edit_warns, edit_kickcount
 
 
@@ -46,7 +44,11 @@ class User:
         "_id",
         "_guild_id",
         "_messages",
-        "options",
+        "_index",
+        "_raid_index",
+        "_punishment_buffer",
+        "_on_raid",
+        "policy",
         "warn_count",
         "kick_count",
         "duplicate_counter",
@@ -59,7 +61,8 @@ class User:
         "KICK",
     ]
 
-    def __init__(self, id, guild_id, options, user_data, logger, stdout, warnchannel, kickchannel, banchannel):
+    def __init__(self, id, guild_id, policy, user_data, logger, stdout, warnchannel, kickchannel, banchannel,
+                 raid_index=None, punishment_buffer=None, on_raid=None):
         """
         Set the relevant information in order to maintain
         and use a per User object for a guild
@@ -69,13 +72,23 @@ class User:
             The relevant member id
         guild_id : int
             The guild (id) this member is belonging to
-        options : Dict
-            The options we need to check against
+        policy : SpamPolicy
+            The compiled settings we need to check against
+        raid_index : RaidIndex, optional
+            The guild wide index shared by all users of the guild
+        punishment_buffer : PunishmentBuffer, optional
+            Collects the warn and kick counts, else every change is its own task
+        on_raid : callable, optional
+            Called with the author id and message of every earlier raider once a payload becomes a raid
         """
         self.id = int(id)
         self.guild_id = int(guild_id)
-        self._messages = []
-        self.options = options
+        self._messages = deque()
+        self._index = SimilarityIndex(exact=policy.exact_duplicates)
+        self._raid_index = raid_index
+        self._punishment_buffer = punishment_buffer
+        self._on_raid = on_raid
+        self.policy = policy
         self.warn_count = user_data["warnCount"]
         self.kick_count = user_data["kickCount"]
         self.duplicate_counter = 1
@@ -87,6 +100,14 @@ class User:
         self.kick_channel = kickchannel if type(kickchannel) == discord.TextChannel else stdout
         self.ban_channel = banchannel if type(banchannel) == discord.TextChannel else stdout
 
+    def apply_policy(self, policy):
+        """
+        Switches to a newly compiled policy of the guild
+        :param policy: the SpamPolicy
+        """
+        self.policy = policy
+        self._index.exact = policy.exact_duplicates
+
     def __repr__(self):
         return (
             f"'{self.__class__.__name__} object. User id: {self.id}, Guild id: {self.guild_id}, "
@@ -144,7 +165,8 @@ class User:
         if not isinstance(value, discord.Message):
             raise ValueError("Expected message of ignore_type: discord.Message")
 
-        self.clean_up(datetime.datetime.now(datetime.timezone.utc))
+        # The snowflake is used as the current time so we don't depend on the local clock being in sync with discord
+        self.clean_up(snowflake_time_ms(value.id))
 
         # No point saving empty messages, although discord shouldn't allow them anyway
         if not bool(value.content and value.content.strip()):
@@ -158,104 +180,132 @@ class User:
                 value.guild.id,
             )
 
-        for message_obj in self.messages:
-            # This calculates the relation to each other
-            if message == message_obj:
-                raise DuplicateObject
-
-            elif (
-                    fuzz.token_sort_ratio(message.content, message_obj.content)
-                    >= self.options["message_duplicate_accuracy"]
-            ):
-                """
-                The handler works off an internal message duplicate counter 
-                so just increment that and then let our logic process it
-                """
-                self.duplicate_counter += 1
-                message.is_duplicate = True
-
-                if self.duplicate_counter >= self.options["message_duplicate_count"]:
-                    break
+        if message.id in self._index:
+            raise DuplicateObject
+
+        # The content is processed like fuzz.token_sort_ratio would do it, but only once per message
+        key = token_sort_key(message.content)
+        signature = self._index.signature(key)
+        # This calculates the relation to each other, scoring stops once the duplicate count is reached
+        duplicates = score_window(
+            key,
+            self._index.candidates(key, signature),
+            self.policy.duplicate_accuracy,
+            max(self.policy.duplicate_count - self.duplicate_counter, 1),
+        )
+        if duplicates:
+            """
+            The handler works off an internal message duplicate counter 
+            so just increment that and then let our logic process it
+            """
+            self.duplicate_counter += duplicates
+            message.is_duplicate = True
+
+        # Many authors posting the same payload once each never trip the counter above, so check the guild as well
+        raid = (
+                self._raid_index is not None
+                and self.policy.raid_author_count > 0
+                and self._raid_index.add(key, self.id, message.creation_time, value)
+                >= self.policy.raid_author_count
+        )
+        if raid:
+            self.logger.debug(self.stdout_channel, f"Message: ({message.id}) is part of a raid")
+            # The authors that posted the payload before it became a raid are punished once as well
+            for author_id, raid_message in self._raid_index.take_raiders(key).items():
+                if author_id != self.id and self._on_raid is not None:
+                    self._on_raid(author_id, raid_message)
 
         # We check this again, because theoretically the above can take awhile to process etc
 
-        self.messages = message
+        self._add_message(message, key, signature)
         self.logger.log.info(f"Created Message: {message.id}")
 
-        if self.duplicate_counter >= self.options["message_duplicate_count"]:
-            self.logger.debug(self.stdout_channel,
-                              f"Message: ({message.id}) requires some form of punishment"
-                              )
-            # We need to punish the member with something
-
-            if (
-                    self.duplicate_counter >= self.options["warn_threshold"]
-                    and self.warn_count < self.options["kick_threshold"]
-                    and self.kick_count < self.options["ban_threshold"]
-            ):
-                self.logger.debug(self.warn_channel, f"Attempting to warn: {message.author_id}")
-                """
-                The member has yet to reach the warn threshold,
-                after the warn threshold is reached this will
-                then become a kick and so on
-                """
-                # We are still in the warning area
-                channel = value.channel
-                guild_message = transform_message(
-                    self.options["guild_warn_message"],
-                    value,
-                    {"warn_count": self.warn_count, "kick_count": self.kick_count},
-                )
+        if raid or self.duplicate_counter >= self.policy.duplicate_count:
+            self._punish(value, raid)
 
-                asyncio.ensure_future(send_to_obj(channel, guild_message))
-                self.warn_count += 1
-                edit_warns.delay(self.guild_id, self.id, self.warn_count)
-
-            elif (
-                    self.warn_count >= self.options["kick_threshold"]
-                    and self.kick_count < self.options["ban_threshold"]
-            ):
-                # Set this to False here to stop processing other messages, we can revert on failure
-
-                self.logger.debug(self.kick_channel, f"Attempting to kick: {message.author_id}")
-                # We should kick the member
-                guild_message = transform_message(
-                    self.options["guild_kick_message"],
-                    value,
-                    {"warn_count": self.warn_count, "kick_count": self.kick_count},
-                )
-                user_message = transform_message(
-                    self.options["user_kick_message"],
-                    value,
-                    {"warn_count": self.warn_count, "kick_count": self.kick_count},
-                )
-                asyncio.ensure_future(
-                    self._punish_user(value, user_message, guild_message, self.KICK, )
-                )
-                self.kick_count += 1
-                edit_kickcount.delay(self.guild_id, self.id, self.kick_count)
+    def punish_raid(self, value):
+        """
+        Punishes the member for a message that only turned out to be part of a raid after it was processed
+        Parameters
+        ==========
+        value : discord.Message
+            The message of the member with the raid payload
+        """
+        self._punish(value, raid=True)
 
-            elif self.kick_count >= self.options["ban_threshold"]:
+    def _punish(self, value, raid):
+        self.logger.debug(self.stdout_channel,
+                          f"Message: ({value.id}) requires some form of punishment"
+                          )
+        # We need to punish the member with something
+        if (
+                (raid or self.duplicate_counter >= self.policy.warn_threshold)
+                and self.warn_count < self.policy.kick_threshold
+                and self.kick_count < self.policy.ban_threshold
+        ):
+            self.logger.debug(self.warn_channel, f"Attempting to warn: {value.author.id}")
+            """
+            The member has yet to reach the warn threshold,
+            after the warn threshold is reached this will
+            then become a kick and so on
+            """
+            # We are still in the warning area
+            channel = value.channel
+            guild_message = transform_message(
+                self.policy.guild_warn_message,
+                value,
+                {"warn_count": self.warn_count, "kick_count": self.kick_count},
+            )
 
-                self.logger.debug(self.ban_channel, f"Attempting to ban: {message.author_id}")
-                # We should ban the member
-                guild_message = transform_message(
-                    self.options["guild_ban_message"],
-                    value,
-                    {"warn_count": self.warn_count, "kick_count": self.kick_count},
-                )
-                user_message = transform_message(
-                    self.options["user_ban_message"],
-                    value,
-                    {"warn_count": self.warn_count, "kick_count": self.kick_count},
-                )
-                asyncio.ensure_future(
-                    self._punish_user(value, user_message, guild_message, self.BAN, )
-                )
-                self.kick_count += 1
+            asyncio.ensure_future(send_to_obj(channel, guild_message))
+            self.warn_count += 1
+            self._store_punishment("warnings", self.warn_count)
 
-            else:
-                raise LogicError
+        elif (
+                self.warn_count >= self.policy.kick_threshold
+                and self.kick_count < self.policy.ban_threshold
+        ):
+            # Set this to False here to stop processing other messages, we can revert on failure
+
+            self.logger.debug(self.kick_channel, f"Attempting to kick: {value.author.id}")
+            # We should kick the member
+            guild_message = transform_message(
+                self.policy.guild_kick_message,
+                value,
+                {"warn_count": self.warn_count, "kick_count": self.kick_count},
+            )
+            user_message = transform_message(
+                self.policy.user_kick_message,
+                value,
+                {"warn_count": self.warn_count, "kick_count": self.kick_count},
+            )
+            asyncio.ensure_future(
+                self._punish_user(value, user_message, guild_message, self.KICK, )
+            )
+            self.kick_count += 1
+            self._store_punishment("kickCount", self.kick_count)
+
+        elif self.kick_count >= self.policy.ban_threshold:
+
+            self.logger.debug(self.ban_channel, f"Attempting to ban: {value.author.id}")
+            # We should ban the member
+            guild_message = transform_message(
+                self.policy.guild_ban_message,
+                value,
+                {"warn_count": self.warn_count, "kick_count": self.kick_count},
+            )
+            user_message = transform_message(
+                self.policy.user_ban_message,
+                value,
+                {"warn_count": self.warn_count, "kick_count": self.kick_count},
+            )
+            asyncio.ensure_future(
+                self._punish_user(value, user_message, guild_message, self.BAN, )
+            )
+            self.kick_count += 1
+
+        else:
+            raise LogicError
 
     async def _punish_user(self, value, user_message, guild_message, method):
         """
@@ -383,6 +433,49 @@ class User:
         except Exception as e:
             raise e
 
+    def _store_punishment(self, column, amount):
+        if self._punishment_buffer is not None:
+            self._punishment_buffer.set(self.guild_id, self.id, column, amount)
+        elif column == "warnings":
+            edit_warns.delay(self.guild_id, self.id, amount)
+        else:
+            edit_kickcount.delay(self.guild_id, self.id, amount)
+
+    def snapshot(self):
+        """
+        Returns the state of this user in a compact form,
+        so it survives restarts
+        Returns
+        -------
+        list
+            warn count, kick count, duplicate counter and
+            the messages as [id, content, channel id, is duplicate]
+        """
+        return [
+            self.warn_count,
+            self.kick_count,
+            self.duplicate_counter,
+            [[m.id, m.content, m.channel_id, m.is_duplicate] for m in self._messages],
+        ]
+
+    def restore(self, state):
+        """
+        Restores the state created by snapshot, messages
+        that are already in the window are skipped
+        Parameters
+        ----------
+        state : list
+            The state returned by snapshot
+        """
+        self.warn_count, self.kick_count, self.duplicate_counter, messages = state
+        for message_id, content, channel_id, is_duplicate in messages:
+            if message_id in self._index:
+                continue
+            message = Message(message_id, content, self.id, channel_id, self.guild_id)
+            message.is_duplicate = is_duplicate
+            key = token_sort_key(message.content)
+            self._add_message(message, key, self._index.signature(key))
+
     def get_correct_duplicate_count(self):
         """
         Given the internal math has an extra number cos
@@ -397,40 +490,25 @@ class User:
         """
         This logic works around checking the current
         time vs a messages creation time. If the message
-        is older by the config amount it can be cleaned up
+        is older by the config amount it can be cleaned up.
+        The window is ordered by creation time, so the outdated
+        messages are always at the head and can just be popped
+        until the first message that is still valid
+        Parameters
+        ----------
+        current_time : int
+            The current time in milliseconds since the unix epoch
         """
         self.logger.log.debug("Attempting to remove outdated Message's")
 
-        def _is_still_valid(message):
-            """
-            Given a message, figure out if it hasnt
-            expired yet based on timestamps
-            """
-            difference = current_time - message.creation_time
-            offset = datetime.timedelta(
-                milliseconds=self.options.get("message_interval")
-            )
-
-            if difference >= offset:
-                return False
-            return True
-
-        current_messages = []
-        outstanding_messages = []
-
-        for message in self._messages:
-            if _is_still_valid(message):
-                current_messages.append(message)
-            else:
-                outstanding_messages.append(message)
-
-        self._messages = deepcopy(current_messages)
-
-        # Now if we have outstanding messages we need
-        # to process them and see if we need to deincrement
-        # the duplicate counter as we are removing them from
-        # the queue otherwise everything stacks up
-        for outstanding_message in outstanding_messages:
+        messages = self._messages
+        expired = current_time - self.policy.interval
+        while messages and messages[0].creation_time <= expired:
+            outstanding_message = messages.popleft()
+            self._index.remove(outstanding_message.id)
+            # If the message was a duplicate we need to deincrement
+            # the duplicate counter as we are removing it from
+            # the queue otherwise everything stacks up
             if outstanding_message.is_duplicate:
                 self.duplicate_counter -= 1
                 self.logger.debug(self.stdout_channel,
@@ -439,6 +517,20 @@ class User:
             elif self.logger.log.isEnabledFor(logging.DEBUG):
                 self.logger.debug(self.stdout_channel, f"Removing Message: {outstanding_message.id}")
 
+    def _add_message(self, message, key, signature):
+        """
+        Appends the message to the window and the similarity index
+        Raises
+        ======
+        ObjectMismatch
+            If the message doesn't belong to this user
+        """
+        if message.author_id != self.id or message.guild_id != self.guild_id:
+            raise ObjectMismatch
+
+        self._messages.append(message)
+        self._index.add(message.id, key, signature)
+
     @property
     def id(self):
         return self._id
@@ -475,14 +567,11 @@ class User:
         if not isinstance(value, Message):
             raise ValueError("Expected Message object")
 
-        if value.author_id != self.id or value.guild_id != self.guild_id:
-            raise ObjectMismatch
-
-        for message in self._messages:
-            if message == value:
-                raise DuplicateObject
+        if value.id in self._index:
+            raise DuplicateObject
 
-        self._messages.append(value)
+        key = token_sort_key(value.content)
+        self._add_message(value, key, self._index.signature(key))
 
 
 class Message:
@@ -555,7 +644,7 @@ class Message:
         self.channel_id = int(channel_id)
         self.guild_id = int(guild_id)
         self.is_duplicate = False
-        self._creation_time = datetime.datetime.now(datetime.timezone.utc)
+        self._creation_time = snowflake_time_ms(self.id)
 
     def __repr__(self):
         return (
@@ -672,6 +761,9 @@ class Message:
 
     @property
     def creation_time(self):
+        """
+        The creation time of the message in milliseconds since the unix epoch
+        """
         return self._creation_time
 
     @creation_time.setter
@@ -2,7 +2,7 @@ import asyncio
 
 from discord.ext import commands
 import discord
-from base_folder.celery.db import insert_reaction
+from base_folder.celery.db import insert_reaction, delete_reaction
 """
 This will be for custom reaction roles on messages for this to work somethings are neeeded:
     - guild id of the guild 
@@ -75,23 +75,27 @@ class ReactionRoles(commands.Cog):
             await ctx.send("Done " + '👍')
         await message.add_reaction(emoji)
         insert_reaction.delay(ctx.guild.id, messageid, role[0].id, emoji)
+        self.client.cache.states[ctx.guild.id].add_reaction_role(messageid, emoji, role[0].id)
 
     @commands.command(brief="deletes reaction roles from a msg")
-    async def del_reaction(self, messageid: int, emoji: discord.emoji):
+    async def del_reaction(self, ctx, messageid: int, emoji: str = None):
         """
 
-        :param messageid: the message id to react on
-        :param emoji: the emoji that the bot reacted with
+        :param ctx: is the current context, guild etc
+        :param messageid: the message id with the reaction roles
+        :param emoji: the emoji that the bot reacted with, every reaction role of the message if none
         :return:nothing
         """
-        pass
+        delete_reaction.delay(ctx.guild.id, messageid, emoji)
+        self.client.cache.states[ctx.guild.id].remove_reaction_role(messageid, emoji)
+        await ctx.send("Done " + '👍')
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
         if not payload.member.bot:
             if payload.emoji.name:
-                roleid = await self.client.sql.get_reaction_role(payload.guild_id, payload.message_id,
-                                                                 payload.emoji.name)
+                roleid = await self.client.cache.states[payload.guild_id].get_reaction_role(payload.message_id,
+                                                                                            payload.emoji.name)
                 if roleid:
                     role = discord.utils.get(payload.member.guild.roles, id=roleid)
                     await payload.member.add_roles(role, reason="reaction added", atomic=True)
@@ -103,7 +107,8 @@ class ReactionRoles(commands.Cog):
         guild = self.client.get_guild(payload.guild_id)
         member = guild.get_member(payload.user_id)
         if not member.bot:
-            roleid = await self.client.sql.get_reaction_role(payload.guild_id, payload.message_id, payload.emoji.name)
+            roleid = await self.client.cache.states[payload.guild_id].get_reaction_role(payload.message_id,
+                                                                                        payload.emoji.name)
             if roleid:
                 role = discord.utils.get(guild.roles, id=roleid)
                 await member.remove_roles(role, reason="reaction removed", atomic=True)
@@ -0,0 +1,135 @@
+"""
+In memory copy of the blacklist table, so member joins can be checked without a query.
+"""
+import hashlib
+import math
+
+from base_folder.config import BLACKLIST_BLOOM_THRESHOLD, BLACKLIST_BLOOM_ERROR_RATE
+
+
+class BloomFilter:
+    """
+    Set membership with false positives but no false negatives, in a fraction of the memory of a set
+    """
+    __slots__ = ["size", "hashes", "_bits"]
+
+    def __init__(self, capacity, error_rate=BLACKLIST_BLOOM_ERROR_RATE):
+        """
+        :param capacity: amount of items the filter is sized for
+        :param error_rate: the false positive rate at capacity
+        """
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing, two 64 bit halves of one digest give all positions
+        digest = hashlib.blake2b(int(item).to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class Blacklist:
+    """
+    Holds the blacklisted user ids in a set, or in a Bloom filter once the list grows past bloom_threshold.
+    With the filter a miss is still answered without I/O, only possible hits are confirmed by the database.
+    refresh only fetches the rows added since the last load, a changed row count means rows were deleted
+    and the whole list gets loaded again.
+    """
+
+    def __init__(self, db, bloom_threshold=BLACKLIST_BLOOM_THRESHOLD):
+        """
+        :param db: the Db the list is read from
+        :param bloom_threshold: amount of entries from which on a Bloom filter is used instead of a set
+        """
+        self.db = db
+        self.bloom_threshold = bloom_threshold
+        self._ids = None  # user ids, None until loaded or if the bloom filter is used
+        self._bloom = None
+        self._last_id = 0  # highest row id that was loaded
+        self._rows = 0  # rows loaded, compared with the count of the table to notice deletions
+        self.lookups = 0
+        self.confirmations = 0  # bloom filter hits that had to be checked with the database
+
+    @property
+    def loaded(self):
+        return self._ids is not None or self._bloom is not None
+
+    def __len__(self):
+        return self._rows
+
+    async def load(self):
+        rows = await self.db.get_blacklist_since(0)
+        if len(rows) >= self.bloom_threshold:
+            # Room to grow, so the filter doesn't get rebuilt with every few new entries
+            bloom = BloomFilter(len(rows) * 2)
+            for _, user_id in rows:
+                bloom.add(user_id)
+            self._bloom, self._ids = bloom, None
+        else:
+            self._ids, self._bloom = {user_id for _, user_id in rows}, None
+        self._last_id = rows[-1][0] if rows else 0
+        self._rows = len(rows)
+
+    async def refresh(self):
+        if not self.loaded:
+            return await self.load()
+        rows = await self.db.get_blacklist_since(self._last_id)
+        for row_id, user_id in rows:
+            self._add(user_id)
+            self._last_id = row_id
+        self._rows += len(rows)
+        if await self.db.get_blacklist_count() != self._rows or \
+                (self._ids is not None and self._rows >= self.bloom_threshold):
+            await self.load()
+
+    def _add(self, user_id):
+        if self._bloom is not None:
+            self._bloom.add(user_id)
+        else:
+            self._ids.add(user_id)
+
+    def add(self, user_id):
+        """
+        Adds a user right away, the row itself is picked up by the next refresh
+        """
+        if self.loaded:
+            self._add(user_id)
+
+    def discard(self, user_id):
+        """
+        Removes a user right away, a Bloom filter can't forget, so it is rebuilt by the next refresh
+        """
+        if self._ids is not None:
+            self._ids.discard(user_id)
+
+    async def is_blacklisted(self, user_id):
+        """
+        :param user_id: the id of the user
+        :returns: True if the user is blacklisted
+        """
+        self.lookups += 1
+        if self._ids is not None:
+            return user_id in self._ids
+        if self._bloom is not None and user_id not in self._bloom:
+            return False
+        # Either not loaded yet or a possible false positive of the filter
+        self.confirmations += 1
+        return await self.db.get_bannlist(user_id)
+
+    def stats(self):
+        return {
+            "entries": self._rows,
+            "mode": "bloom" if self._bloom is not None else "set" if self._ids is not None else "not loaded",
+            "lookups": self.lookups,
+            "database checks": self.confirmations,
+        }
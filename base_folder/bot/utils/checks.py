@@ -62,12 +62,12 @@ def logging_to_channel_cmd(func):
         :return: returns the awaited command
         """
         embed = await func(self, ctx, *args, **kwargs)
-        cmdchannel = ctx.bot.get_channel(ctx.bot.cache.states[ctx.guild.id].get_channel("cmd"))
+        cmdchannel = ctx.bot.get_channel(await ctx.bot.cache.states[ctx.guild.id].channel("cmd"))
         if cmdchannel is not None:
             await cmdchannel.send(embed=embed)
             await ctx.bot.log.stdout(cmdchannel, ctx.message.content, ctx)
         else:
-            stdoutchannel = ctx.bot.get_channel(ctx.bot.cache.states[ctx.guild.id].get_channel())
+            stdoutchannel = ctx.bot.get_channel(await ctx.bot.cache.states[ctx.guild.id].channel())
             await ctx.bot.log.stdout(stdoutchannel, ctx.message.content, ctx)
     return predicate
 
@@ -90,7 +90,7 @@ def logging_to_channel_stdout(func):
         :return: returns the awaited command
         """
         if ctx.bot:
-            stdoutchannel = ctx.bot.get_channel(ctx.bot.cache.states[ctx.guild.id].get_channel())
+            stdoutchannel = ctx.bot.get_channel(await ctx.bot.cache.states[ctx.guild.id].channel())
             sig = signature(func)
             if stdoutchannel is not None:
                 try:
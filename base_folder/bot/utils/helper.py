@@ -1,11 +1,25 @@
 """
 This helper script is helpful in some situations  like creating the ctx object out of the member object etc
 """
-from asyncio import run_coroutine_threadsafe
+import asyncio
+import logging
+import time
+from collections import OrderedDict
 
+from base_folder.config import USER_CACHE_MAX, USER_CACHE_MAX_PER_GUILD, USER_CACHE_IDLE_TTL, SPAM_SNAPSHOT_PATH, \
+    WARMUP_CHUNK_SIZE
 from base_folder.bot.modules.base.db_management import Db
 from base_folder.bot.modules.listener.listern_antispam import User
+from base_folder.bot.utils.blacklist import Blacklist
+from base_folder.bot.utils.leaderboard import Leaderboards
+from base_folder.bot.utils.profile_cache import ProfileCache
+from base_folder.bot.utils.snapshot import SpamSnapshot
+from base_folder.bot.utils.spam_index import RaidIndex
+from base_folder.bot.utils.spam_policy import SpamPolicy
+from base_folder.bot.utils.write_behind import PunishmentBuffer, MessageBuffer, XpAccumulator
+from base_folder.celery.db import edit_warns
 
+logger = logging.getLogger('discord.snapshot')
 
 '''
 This class is designed to hold all data that the bot uses extensively and the class is designed in a way that it can
@@ -24,10 +38,191 @@ class Ctx:
         self.author = member
 
 
+class UserRegistry:
+    """
+    Keeps track of the anti spam User objects of all guilds, so the amount of them stays bounded.
+    It's ordered by the last access, which means the least recently used and idle users are always at the head.
+    """
+
+    def __init__(self, max_users=USER_CACHE_MAX, idle_ttl=USER_CACHE_IDLE_TTL):
+        self._order = OrderedDict()  # (guild id, user id) -> last access
+        self._caches = {}  # guild id -> UserCache
+        self._dirty = set()  # (guild id, user id) touched since the last snapshot
+        self._unexpired = set()  # (guild id, user id) that still had messages after the last sweep
+        self._last_sweep = time.monotonic()
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._order)
+
+    def register(self, cache):
+        self._caches[cache.guild_id] = cache
+
+    def unregister(self, cache):
+        for user_id in cache.keys():
+            self.forget(cache.guild_id, user_id)
+        self._caches.pop(cache.guild_id, None)
+
+    def touch(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        self._order[key] = time.monotonic()
+        self._order.move_to_end(key)
+        self._dirty.add(key)
+
+    def added(self, guild_id, user_id):
+        self.touch(guild_id, user_id)
+        while len(self._order) > self.max_users:
+            (guild_id, user_id), _ = self._order.popitem(last=False)
+            self._dirty.add((guild_id, user_id))
+            self._caches[guild_id].drop(user_id)
+            self.evictions += 1
+
+    def forget(self, guild_id, user_id):
+        self._order.pop((guild_id, user_id), None)
+        self._dirty.add((guild_id, user_id))
+
+    def pop_dirty(self):
+        dirty = self._dirty
+        self._dirty = set()
+        return dirty
+
+    def sweep(self):
+        """
+        Drops every user that was idle for longer than the idle ttl
+        and the expired messages of the remaining ones.
+        Both walks start at an end of the order and stop at the first user they don't need,
+        so a sweep only costs the users that expired or were active since the last one
+        """
+        now = time.monotonic()
+        expired = now - self.idle_ttl
+        while self._order:
+            (guild_id, user_id), last_access = next(iter(self._order.items()))
+            if last_access > expired:
+                break
+            del self._order[(guild_id, user_id)]
+            self._dirty.add((guild_id, user_id))
+            self._caches[guild_id].drop(user_id)
+            self.expirations += 1
+
+        # Users that weren't accessed since the last sweep had their messages cleaned up by it,
+        # unless some of them weren't outdated yet back then
+        candidates = self._unexpired
+        for key, last_access in reversed(self._order.items()):
+            if last_access < self._last_sweep:
+                break
+            candidates.add(key)
+        self._unexpired = set()
+        self._last_sweep = now
+        current_time = int(time.time() * 1000)
+        for guild_id, user_id in candidates:
+            cache = self._caches.get(guild_id)
+            user = cache.peek(user_id) if cache is not None else None
+            if user is None or not user.messages:
+                continue
+            user.clean_up(current_time)
+            if user.messages:
+                self._unexpired.add((guild_id, user_id))
+
+    def stats(self):
+        return {
+            "users": len(self._order),
+            "guilds": len(self._caches),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class UserCache:
+    """
+    The users of a single guild, behaves like the dict it replaces.
+    Evicted users are just missing, so they get rebuild by GuildStates.set_user on their next message.
+    """
+
+    def __init__(self, guild_id, registry=None, max_size=USER_CACHE_MAX_PER_GUILD, on_evict=None):
+        self.guild_id = guild_id
+        self.registry = registry if registry is not None else UserRegistry()
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._users = OrderedDict()
+        self.registry.register(self)
+
+    def __getitem__(self, user_id):
+        user = self._users[user_id]
+        self._users.move_to_end(user_id)
+        self.registry.touch(self.guild_id, user_id)
+        return user
+
+    def __setitem__(self, user_id, user):
+        self._users[user_id] = user
+        self._users.move_to_end(user_id)
+        self.registry.added(self.guild_id, user_id)
+        while len(self._users) > self.max_size:
+            evicted, user = self._users.popitem(last=False)
+            self.registry.forget(self.guild_id, evicted)
+            self.registry.evictions += 1
+            self._evicted(evicted, user)
+
+    def __delitem__(self, user_id):
+        user = self._users.pop(user_id)
+        self.registry.forget(self.guild_id, user_id)
+        self._evicted(user_id, user)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def get(self, user_id, default=None):
+        try:
+            return self[user_id]
+        except KeyError:
+            return default
+
+    def peek(self, user_id):
+        # Like get, but doesn't count as an access
+        return self._users.get(user_id)
+
+    def drop(self, user_id):
+        # Only used by the registry, which already removed the user from its order
+        user = self._users.pop(user_id, None)
+        if user is not None:
+            self._evicted(user_id, user)
+
+    def _evicted(self, user_id, user):
+        if self.on_evict is not None:
+            self.on_evict(user_id, user)
+
+    def keys(self):
+        return list(self._users.keys())
+
+    def values(self):
+        return list(self._users.values())
+
+    def items(self):
+        return list(self._users.items())
+
+
 class DbCache:
     def __init__(self, loop=None):
         self.loop = loop
         self._states = {}
+        self.users = UserRegistry()
+        self.db = Db()
+        self.snapshot = SpamSnapshot(SPAM_SNAPSHOT_PATH)
+        self.xp_accumulator = XpAccumulator()
+        self.profiles = ProfileCache(self.db, pending_xp=self.xp_accumulator.pending)
+        self.blacklist = Blacklist(self.db)
+        self.leaderboards = Leaderboards(self.db)
+        self.punishment_buffer = PunishmentBuffer(on_set=self._punishment_set)
+        self.message_buffer = MessageBuffer()
+        self._snapshot_lock = asyncio.Lock()
 
     @property
     def states(self):
@@ -35,31 +230,149 @@ class DbCache:
 
     def make_states(self, guilds, logger):
         for guild in guilds:
-            self._states[guild.id] = GuildStates(guild, self.loop, logger)
+            self.create_state(guild, logger)
 
     def create_state(self, guild, logger):
-        self._states[guild.id] = GuildStates(guild, self.loop, logger)
+        previous = self._states.get(guild.id)
+        if previous is not None:
+            # on_ready runs again after a reconnect, the users of the replaced state must not stay registered
+            self.users.unregister(previous.users)
+        self._states[guild.id] = GuildStates(guild, self.loop, logger, self.users, self.punishment_buffer,
+                                             self.profiles)
 
     def destruct_state(self, guild):
+        self.users.unregister(self._states[guild.id].users)
+        self.leaderboards.forget_guild(guild.id)
         del self._states[guild.id]
 
+    def _punishment_set(self, guild_id, user_id, column, amount):
+        if column == "warnings":
+            self.profiles.update(guild_id, user_id, warnings=amount)
+
+    def is_ready(self, guild):
+        # Direct messages don't need a guild state
+        if guild is None:
+            return True
+        state = self._states.get(guild.id)
+        return state is not None and state.ready
+
+    async def hydrate(self, guild):
+        """
+        Makes sure the state of the guild is loaded before its event gets handled
+        :param guild: the guild of the event, can be None
+        """
+        if not self.is_ready(guild) and guild.id in self._states:
+            await self._states[guild.id].hydrate()
+
+    async def warm_up(self, chunk_size=WARMUP_CHUNK_SIZE):
+        """
+        Loads settings, banned lists and reaction roles of all guilds with a few IN queries per chunk,
+        every guild of a chunk is ready as soon as its chunk is done
+        :param chunk_size: the amount of guilds per chunk
+        """
+        start = time.perf_counter()
+        guild_ids = list(self._states.keys())
+        for i in range(0, len(guild_ids), chunk_size):
+            chunk = guild_ids[i:i + chunk_size]
+            settings, banned, reaction_roles = await asyncio.gather(
+                self.db.get_settings_bulk(chunk),
+                self.db.get_banned_lists_bulk(chunk),
+                self.db.get_reaction_roles_bulk(chunk),
+            )
+            for guild_id in chunk:
+                state = self._states.get(guild_id)
+                if state is None or state.ready:
+                    continue
+                await state.set_banned_lists(banned[guild_id])
+                state.set_reaction_roles(reaction_roles[guild_id])
+                if guild_id in settings:
+                    await state.load_settings(settings[guild_id])
+                state.ready = True
+            print(f"Warmed up {min(i + chunk_size, len(guild_ids))}/{len(guild_ids)} guilds "
+                  f"in {time.perf_counter() - start:.2f}s")
+
+    async def sweep_users(self):
+        self.users.sweep()
+
+    async def flush_punishments(self, wait=False):
+        await self.punishment_buffer.flush(wait)
+
+    async def snapshot_users(self):
+        """
+        Writes the anti spam state of all users that changed to the snapshot file,
+        only the serialization happens in the loop
+        """
+        async with self._snapshot_lock:
+            self.snapshot.update(self)
+            data = self.snapshot.dumps()
+            await asyncio.get_event_loop().run_in_executor(None, self.snapshot.write, data)
+
+    async def restore_users(self):
+        """
+        Restores the anti spam state from the snapshot file, users that already sent a message
+        since the start are left alone. Yields to the loop every now and then, so events don't pile up.
+        Holds the snapshot lock, else a snapshot taken meanwhile would replace the file without the users
+        that aren't restored yet. Users of guilds without settings are dropped, the anti spam ignores those guilds
+        """
+        async with self._snapshot_lock:
+            states = await asyncio.get_event_loop().run_in_executor(None, self.snapshot.read)
+            for index, ((guild_id, user_id), state) in enumerate(states.items()):
+                if index % 500 == 0:
+                    await asyncio.sleep(0)
+                guild_state = self._states.get(guild_id)
+                if guild_state is None or user_id in guild_state.users:
+                    continue
+                try:
+                    await guild_state.hydrate()
+                    if guild_state.policy is None:
+                        continue
+                    guild_state.restore_user(user_id, state)
+                except Exception as ex:
+                    # One broken entry must not keep the other users from being restored
+                    logger.warning(f"Couldn't restore user {user_id} of guild {guild_id}: {ex!r}")
+
+    async def prefetch_punishments(self):
+        """
+        Loads the warnings and kick counts of all users that have any in one go,
+        so new authors can be created without a query
+        """
+        # A copy, guilds can be joined or left while the executor thread runs the query
+        guild_ids = list(self._states)
+        counts = await self.db.get_punishment_counts(guild_ids)
+        punishments = {guild_id: {} for guild_id in guild_ids}
+        for (guild_id, user_id), count in counts.items():
+            punishments[guild_id][user_id] = count
+        for guild_id, guild_punishments in punishments.items():
+            state = self._states.get(guild_id)
+            if state is not None:
+                state.set_punishments(guild_punishments)
+
     def __str__(self):
         return f"Dbcache with states { len(self._states) } in it"
 
 
 class GuildStates:
-    def __init__(self, guild, loop, logger):
+    def __init__(self, guild, loop, logger, registry=None, punishment_buffer=None, profiles=None):
         self.loop = loop
         self.db = Db()
         self.guild = guild
         self.logger = logger
         self.options = {}
-        self.users = {}
+        self.policy = None  # compiled from the options, None until the settings are loaded
+        self.users = UserCache(guild.id, registry, on_evict=self._remember_punishments)
+        self._punishments = None  # user id -> (warnings, kickCount), only users with any and without a User object
+        self.raid_index = RaidIndex()
+        self.punishment_buffer = punishment_buffer
+        self.profiles = profiles
         self._permisson_roles = {}
         self._prefix = None
         self._levelsystem_toggle = None
         self._get_imgtoggle = None
         self._channels = {}
+        self._reaction_roles = None  # (message id, emoji) -> role id, None until warmed up
+        self.ready = False  # True once settings, banned lists and reaction roles are loaded
+        self._settings_loaded = False
+        self._loading = {}  # key -> the task that is loading it
         self.banned_channels_cmd = []
         self.banned_roles_cmd = []
         self.banned_users_cmd = []
@@ -78,16 +391,56 @@ class GuildStates:
 
     @property
     def get_levelsystem(self):
-        if self._levelsystem_toggle is None:
-            run_coroutine_threadsafe(self.set_lvltoggle(), self.loop)
+        # Only the cached value, use levelsystem() if the guild might not be hydrated yet
         return self._levelsystem_toggle
 
     @property
     def get_imgtoggle(self):
-        if self._get_imgtoggle is None:
-            run_coroutine_threadsafe(self.set_imgtoggle(), self.loop)
+        # Only the cached value, use imgtoggle() if the guild might not be hydrated yet
+        return self._get_imgtoggle
+
+    async def levelsystem(self):
+        await self.ensure_settings()
+        return self._levelsystem_toggle
+
+    async def imgtoggle(self):
+        await self.ensure_settings()
         return self._get_imgtoggle
 
+    async def channel(self, channelname="stdout"):
+        await self.ensure_settings()
+        return self.get_channel(channelname)
+
+    async def _single_flight(self, key, loader):
+        """
+        Runs the loader once for all callers that ask for the same key at the same time
+        :param key: the name of what gets loaded
+        :param loader: coroutine function that loads it
+        """
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.ensure_future(loader())
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        # A cancelled caller must not cancel the load for everyone else
+        await asyncio.shield(task)
+
+    async def ensure_settings(self):
+        if not self._settings_loaded:
+            await self._single_flight("settings", self.load_settings)
+
+    async def hydrate(self):
+        """
+        Loads everything the guild needs, happens on its first event unless the warm up got to it first
+        """
+        if self.ready:
+            return
+        await asyncio.gather(
+            self._single_flight("banned", self.set_banned_lists),
+            self._single_flight("reaction_roles", self.load_reaction_roles),
+            self.ensure_settings(),
+        )
+        self.ready = True
+
     @property
     def get_perm_list(self):
         role_list = []
@@ -95,50 +448,183 @@ class GuildStates:
             role_list.append(self._permisson_roles[r])
         return role_list
 
+    async def load_settings(self, settings=None):
+        """
+        Sets up channels, roles, toggles, prefix and the spam policy from one settings row
+        :param settings: the settings row of the guild, gets fetched if none
+        """
+        if settings is None:
+            settings = await self.db.get_settings(self.guild.id)
+            if settings is None:
+                # Nothing to load, the guild runs without the features that need settings
+                self._settings_loaded = True
+                return
+        self._channels = {
+            'leave': settings.leave_channel_id,
+            'welcome': settings.welcome_channel_id,
+            'stdout': settings.stdout_channel_id,
+            'lvl': settings.lvl_channel_id,
+            'cmd': settings.cmd_channel_id,
+            'warn': settings.warn_channel_id,
+            'kick': settings.kick_channel_id,
+            'ban': settings.ban_channel_id,
+        }
+        self._permisson_roles = {
+            'mod': settings.mod_role_id,
+            'admin': settings.admin_role_id,
+            'dev': settings.dev_role_id,
+            'default': settings.standard_role_id,
+        }
+        self._levelsystem_toggle = settings.levelsystem_toggle
+        self._get_imgtoggle = settings.imgwelcome_toggle
+        self._prefix = settings.prefix
+        self._set_spam_options(settings)
+        self._settings_loaded = True
+
     async def set_spamsettings(self):
         opts = await self.db.get_spam_settings(self.guild.id)
+        self._set_spam_options(opts[0])
+
+    def _set_spam_options(self, opts):
+        # opts can be the whole settings row or the one of get_spam_settings, both name the columns
         options = {
-            "warn_threshold": opts[0][0],
-            "kick_threshold": opts[0][1],
-            "ban_threshold": opts[0][2],
-            "message_interval": opts[0][3],
-            "guild_warn_message": opts[0][4],
-            "guild_kick_message": opts[0][5],
-            "guild_ban_message": opts[0][6],
-            "user_kick_message": opts[0][5],
-            "user_ban_message": opts[0][6],
-            "message_duplicate_count": opts[0][7],
-            "message_duplicate_accuracy": opts[0][8],
+            "warn_threshold": opts.warnThreshold,
+            "kick_threshold": opts.kickThreshold,
+            "ban_threshold": opts.banThreshold,
+            "message_interval": opts.messageInterval,
+            "guild_warn_message": opts.warnMessage,
+            "guild_kick_message": opts.kickMessage,
+            "guild_ban_message": opts.banMessage,
+            "user_kick_message": opts.kickMessage,
+            "user_ban_message": opts.banMessage,
+            "message_duplicate_count": opts.messageDuplicateCount,
+            "message_duplicate_accuracy": opts.messageDuplicateAccuracy,
             "ignore_perms": [8],  # TODO: make this customizable
             "ignore_channels": self.banned_channels_spam,
             "ignore_Users": self.banned_users_spam,
-            "ignore_roles": self.banned_roles_cmd,
+            "ignore_roles": self.banned_roles_spam,
             "ignore_guilds": [],
             "ignore_bots": True,
+            "raid_author_count": opts.raidAuthorCount,
+            "exact_duplicates": bool(opts.exactDuplicates),
         }
         self.options = options
+        self.compile_policy()
+
+    def compile_policy(self):
+        """
+        Compiles the options into the SpamPolicy and hands it to the users that already exist
+        """
+        self.policy = SpamPolicy.compile(self.options)
+        # A payload counts towards a raid as long as a message counts towards spam
+        self.raid_index.interval = self.policy.interval
+        for user in self.users.values():
+            user.apply_policy(self.policy)
 
     async def set_user(self, userid, stdChannel, warnchannel, kick, banchannel):
+        if self._punishments is None:
+            counts = await self.db.get_punishment_counts([self.guild.id], [userid])
+            warns, kicks = counts.get((self.guild.id, userid), (0, 0))
+        else:
+            # Everyone with a warning or kick is prefetched, so a miss means a clean user
+            warns, kicks = self._punishments.pop(userid, (0, 0))
+        if self.punishment_buffer is not None:
+            # Counters that aren't flushed yet are newer than the database
+            pending = self.punishment_buffer.get(self.guild.id, userid, "warnings")
+            warns = warns if pending is None else pending
+            pending = self.punishment_buffer.get(self.guild.id, userid, "kickCount")
+            kicks = kicks if pending is None else pending
         user_data = {
-            'warnCount': await self.db.get_warns(self.guild.id, userid),
-            'kickCount': await self.db.get_kick_count(self.guild.id, userid),
+            'warnCount': warns,
+            'kickCount': kicks,
         }
-        self.users[userid] = User(userid, self.guild.id, self.options, user_data, self.logger,
-                                  stdChannel, warnchannel, kick,banchannel)
+        self.users[userid] = User(userid, self.guild.id, self.policy, user_data, self.logger,
+                                  stdChannel, warnchannel, kick, banchannel, self.raid_index,
+                                  self.punishment_buffer, self.punish_raider)
+
+    def restore_user(self, userid, state):
+        """
+        Creates the User object from its snapshot
+        :param userid: the id of the user
+        :param state: the state returned by User.snapshot
+        """
+        if self._punishments is not None:
+            self._punishments.pop(userid, None)
+        # Snapshots get restored before the warm up reaches every guild, the channels follow with the settings
+        channels = [self.guild.get_channel(self._channels.get(name, 0)) for name in ("stdout", "warn", "kick", "ban")]
+        user = User(userid, self.guild.id, self.policy, {'warnCount': 0, 'kickCount': 0}, self.logger,
+                    *channels, self.raid_index, self.punishment_buffer, self.punish_raider)
+        user.restore(state)
+        self.users[userid] = user
+
+    def punish_raider(self, userid, message):
+        """
+        Punishes an author whose message only turned out to be part of a raid later on
+        :param userid: the id of the user
+        :param message: the discord.Message of the user with the raid payload
+        """
+        user = self.users.peek(userid)
+        if user is not None:
+            # An evicted user has no counters left to raise, the payload has left its window anyway
+            user.punish_raid(message)
+
+    def set_punishments(self, punishments):
+        self._punishments = punishments
+
+    def _remember_punishments(self, userid, user):
+        # The User object was the source of truth, keep its counts around for the next time it gets created
+        if self._punishments is not None and (user.warn_count or user.kick_count):
+            self._punishments[userid] = (user.warn_count, user.kick_count)
+
+    async def get_warns(self, userid):
+        """
+        Returns the warnings of the user, the cache and the pending writes are newer than the database
+        :param userid: the id of the user
+        :returns: the warnings of the user, can be 0
+        """
+        user = self.users.peek(userid)
+        if user is not None:
+            return user.warn_count
+        if self.punishment_buffer is not None:
+            pending = self.punishment_buffer.get(self.guild.id, userid, "warnings")
+            if pending is not None:
+                return pending
+        if self.profiles is not None:
+            return (await self.profiles.get(self.guild.id, userid)).warnings
+        return await self.db.get_warns(self.guild.id, userid)
+
+    def update_warns(self, userid, amount):
+        """
+        Sets the warnings of the user in the cache and writes them to the database
+        :param userid: the id of the user
+        :param amount: the new amount of warnings
+        """
+        if self.punishment_buffer is not None:
+            self.punishment_buffer.set(self.guild.id, userid, "warnings", amount)
+        else:
+            edit_warns.delay(self.guild.id, userid, amount)
+            if self.profiles is not None:
+                self.profiles.update(self.guild.id, userid, warnings=amount)
+        user = self.users.get(userid)
+        if user is not None:
+            user.warn_count = amount
+        elif self._punishments is not None:
+            kicks = self._punishments.get(userid, (0, 0))[1]
+            if amount or kicks:
+                self._punishments[userid] = (amount, kicks)
+            else:
+                self._punishments.pop(userid, None)
 
     def get_role(self, rolename="admin"):
         role_id = self._permisson_roles[rolename]
         return role_id
 
     def get_channel(self, channelname="stdout"):
-        try:
-            channelid = self._channels[channelname]
-            if channelid == 0:
-                run_coroutine_threadsafe(self.set_channels(), self.loop)
-                return self._channels[channelname]
-            return channelid
-        except KeyError:
-            return 0
+        # Only the cached value, use channel() if the guild might not be hydrated yet
+        if not self._settings_loaded:
+            # Returning 0 here would silently drop whatever should be sent to the channel
+            raise RuntimeError(f"The settings of guild {self.guild.id} aren't loaded yet, use channel()")
+        return self._channels.get(channelname, 0)
 
     async def set_prefix(self, newprefix):
         self._prefix = newprefix
@@ -159,13 +645,67 @@ class GuildStates:
         self._channels["kick"] = await self.db.get_kick_channel(self.guild.id)
         self._channels["ban"] = await self.db.get_ban_channel(self.guild.id)
 
-    async def set_banned_lists(self):
-        self.banned_channels_cmd = await self.db.get_banned_channels_cmd(self.guild.id)
-        self.banned_roles_cmd = await self.db.get_banned_roles_cmd(self.guild.id)
-        self.banned_users_cmd = await self.db.get_banned_users_cmd(self.guild.id)
-        self.banned_channels_spam = await self.db.get_banned_channels_spam(self.guild.id)
-        self.banned_roles_spam = await self.db.get_banned_roles_spam(self.guild.id)
-        self.banned_users_spam = await self.db.get_banned_users_spam(self.guild.id)
+    async def set_banned_lists(self, banned=None):
+        """
+        :param banned: dict with the lists like Db.get_banned_lists_bulk returns them, gets fetched if none
+        """
+        if banned is None:
+            self.banned_channels_cmd = await self.db.get_banned_channels_cmd(self.guild.id)
+            self.banned_roles_cmd = await self.db.get_banned_roles_cmd(self.guild.id)
+            self.banned_users_cmd = await self.db.get_banned_users_cmd(self.guild.id)
+            self.banned_channels_spam = await self.db.get_banned_channels_spam(self.guild.id)
+            self.banned_roles_spam = await self.db.get_banned_roles_spam(self.guild.id)
+            self.banned_users_spam = await self.db.get_banned_users_spam(self.guild.id)
+        else:
+            self.banned_channels_cmd = banned["channels_cmd"]
+            self.banned_roles_cmd = banned["roles_cmd"]
+            self.banned_users_cmd = banned["users_cmd"]
+            self.banned_channels_spam = banned["channels_spam"]
+            self.banned_roles_spam = banned["roles_spam"]
+            self.banned_users_spam = banned["users_spam"]
+        if self.options:
+            self.options["ignore_channels"] = self.banned_channels_spam
+            self.options["ignore_Users"] = self.banned_users_spam
+            self.options["ignore_roles"] = self.banned_roles_spam
+            self.compile_policy()
+
+    async def load_reaction_roles(self):
+        reaction_roles = await self.db.get_reaction_roles_bulk([self.guild.id])
+        self.set_reaction_roles(reaction_roles[self.guild.id])
+
+    def set_reaction_roles(self, reaction_roles):
+        """
+        :param reaction_roles: dict with (message id, emoji) as key and the role id as value
+        """
+        self._reaction_roles = reaction_roles
+
+    def add_reaction_role(self, message_id, emoji, role_id):
+        # Like insert_reaction, a new role replaces the one the message and emoji had
+        if self._reaction_roles is not None:
+            self._reaction_roles[(message_id, emoji)] = role_id
+
+    def remove_reaction_role(self, message_id, emoji=None):
+        """
+        :param message_id: the id of the message
+        :param emoji: the emoji of the reaction role, every reaction role of the message if none
+        """
+        if self._reaction_roles is None:
+            return
+        if emoji is not None:
+            self._reaction_roles.pop((message_id, emoji), None)
+            return
+        for key in [key for key in self._reaction_roles if key[0] == message_id]:
+            del self._reaction_roles[key]
+
+    async def get_reaction_role(self, message_id, emoji):
+        """
+        :param message_id: the id of the message where a reaction got added
+        :param emoji: the added emoji
+        :return: the role id that the user should get, False if there is none
+        """
+        if self._reaction_roles is None:
+            return await self.db.get_reaction_role(self.guild.id, message_id, emoji)
+        return self._reaction_roles.get((message_id, emoji), False)
 
     async def set_imgtoggle(self):
         self._get_imgtoggle = await self.db.get_img(self.guild.id)
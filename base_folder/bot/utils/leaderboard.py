@@ -0,0 +1,238 @@
+"""
+Per guild text xp rankings, kept up to date by the level system instead of sorting the profiles on every request.
+"""
+import asyncio
+import random
+
+from base_folder.config import LEADERBOARD_PAGE_SIZE
+
+MAX_LEVEL = 32  # enough for 2 ** 32 users per guild
+
+
+class _Node:
+    __slots__ = ["key", "next", "width"]
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # how many positions the link on each level skips
+
+
+class Ranking:
+    """
+    Indexable skip list of (-xp, user id) keys, so the highest xp comes first and ties are ordered by id.
+    Updates, rank lookups and finding the start of a page are O(log n) expected.
+    """
+
+    def __init__(self, seed=None):
+        self._head = _Node(None, MAX_LEVEL)
+        self._xp = {}  # user id -> xp
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return len(self._xp)
+
+    def __contains__(self, user_id):
+        return user_id in self._xp
+
+    def xp(self, user_id):
+        return self._xp.get(user_id)
+
+    def items(self):
+        return list(self._xp.items())
+
+    @classmethod
+    def build(cls, items, seed=None):
+        """
+        Builds a ranking in one pass over the sorted keys instead of inserting them one by one
+        :param items: (user id, xp) pairs
+        :returns: the Ranking
+        """
+        ranking = cls(seed)
+        ranking._xp = dict(items)
+        last = [ranking._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        for position, key in enumerate(sorted((-xp, user_id) for user_id, xp in ranking._xp.items()), start=1):
+            node = _Node(key, ranking._level())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - positions[level]
+                last[level] = node
+                positions[level] = position
+        # The last link of every level points past the end, like the ones insert maintains
+        for level in range(MAX_LEVEL):
+            last[level].width[level] = len(ranking._xp) + 1 - positions[level]
+        return ranking
+
+    def _level(self):
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        chain = [None] * MAX_LEVEL
+        steps_at_level = [0] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        new = _Node(key, self._level())
+        steps = 0
+        for level in range(len(new.next)):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(len(new.next), MAX_LEVEL):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = [None] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        found = chain[0].next[0]
+        for level in range(MAX_LEVEL):
+            prev = chain[level]
+            if level < len(found.next):
+                prev.width[level] += found.width[level] - 1
+                prev.next[level] = found.next[level]
+            else:
+                prev.width[level] -= 1
+
+    def update(self, user_id, xp):
+        """
+        :param user_id: the id of the user
+        :param xp: the new text xp of the user
+        """
+        old = self._xp.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+        self._xp[user_id] = xp
+        self._insert((-xp, user_id))
+
+    def remove(self, user_id):
+        xp = self._xp.pop(user_id, None)
+        if xp is not None:
+            self._remove((-xp, user_id))
+
+    def rank(self, user_id):
+        """
+        :param user_id: the id of the user
+        :returns: the 1 based rank of the user, None if the user isn't ranked
+        """
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return None
+        key = (-xp, user_id)
+        position = 0
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def page(self, page=0, size=LEADERBOARD_PAGE_SIZE):
+        """
+        :param page: the 0 based page
+        :param size: entries per page
+        :returns: list of (rank, user id, xp) tuples
+        """
+        start = page * size
+        if start >= len(self._xp) or start < 0:
+            return []
+        # Walks to the entry at index start, then follows the bottom level
+        remaining = start + 1
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        entries = []
+        while node is not None and len(entries) < size:
+            entries.append((start + len(entries) + 1, node.key[1], -node.key[0]))
+            node = node.next[0]
+        return entries
+
+    def top(self, n=LEADERBOARD_PAGE_SIZE):
+        return self.page(0, n)
+
+
+class Leaderboards:
+    """
+    The rankings of all guilds, built from the profiles on start and updated with every xp change.
+    Guilds the start didn't load, e.g. joined ones, are loaded on their first use of ranking
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._rankings = {}  # guild id -> Ranking
+        self._loaded = set()  # the guilds whose ranking has every user of the database
+        self._loading = {}  # guild id -> the task that is loading it
+        self.loaded = False  # True once the rebuild on start is done
+
+    def __getitem__(self, guild_id):
+        ranking = self._rankings.get(guild_id)
+        if ranking is None:
+            ranking = self._rankings[guild_id] = Ranking()
+        return ranking
+
+    def update(self, guild_id, user_id, xp):
+        self[guild_id].update(user_id, xp)
+
+    def forget_guild(self, guild_id):
+        self._rankings.pop(guild_id, None)
+        self._loaded.discard(guild_id)
+
+    async def ranking(self, guild_id):
+        """
+        :param guild_id: the id of the guild
+        :returns: the complete Ranking of the guild, it gets loaded first if it isn't yet
+        """
+        if guild_id not in self._loaded:
+            task = self._loading.get(guild_id)
+            if task is None:
+                task = self._loading[guild_id] = asyncio.ensure_future(self._load([guild_id]))
+                task.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+            # A cancelled caller must not cancel the load for everyone else
+            await asyncio.shield(task)
+        return self[guild_id]
+
+    async def rebuild(self, guild_ids):
+        """
+        Loads the xp of every user with any in the given guilds
+        :param guild_ids: the ids of the guilds
+        """
+        await self._load(guild_ids)
+        self.loaded = True
+
+    async def _load(self, guild_ids):
+        rows = {guild_id: [] for guild_id in guild_ids}
+        for guild_id, user_id, xp in await self.db.get_text_xp_bulk(list(guild_ids)):
+            rows[guild_id].append((user_id, xp))
+        for guild_id, items in rows.items():
+            if guild_id in self._loaded:
+                # Loaded on its own while the query ran
+                continue
+            ranking = Ranking.build(items)
+            # Updates that happened while the query ran are newer than the rows
+            for user_id, xp in self[guild_id].items():
+                ranking.update(user_id, xp)
+            self._rankings[guild_id] = ranking
+            self._loaded.add(guild_id)
+
+    def stats(self):
+        return {
+            "guilds": len(self._rankings),
+            "ranked users": sum(len(ranking) for ranking in self._rankings.values()),
+        }
@@ -0,0 +1,118 @@
+"""
+Read through cache for the parts of the profiles table the bot reads all the time.
+"""
+from collections import OrderedDict
+
+from base_folder.config import PROFILE_CACHE_MAX
+
+
+class Profile:
+    """
+    The cached columns of a profile, None means the value isn't known yet
+    """
+    __slots__ = ["text_xp", "text_lvl", "warnings"]
+
+    def __init__(self, text_xp=None, text_lvl=None, warnings=None):
+        self.text_xp = text_xp
+        self.text_lvl = text_lvl
+        self.warnings = warnings
+
+    def __repr__(self):
+        return f"'{self.__class__.__name__} object. XP: {self.text_xp}, Level: {self.text_lvl}, " \
+               f"Warnings: {self.warnings}'"
+
+    @property
+    def complete(self):
+        return self.text_xp is not None and self.text_lvl is not None and self.warnings is not None
+
+
+class ProfileCache:
+    """
+    LRU cache of profiles keyed by (guild id, user id).
+    The bot's own writes go through update, so in steady state reads never reach the database.
+    A write for a profile that isn't cached yet is kept as a partial profile,
+    the next read only fills in the missing columns, so it can't overwrite the newer value with a stale one.
+    """
+
+    def __init__(self, db, max_size=PROFILE_CACHE_MAX, pending_xp=None):
+        """
+        :param db: the Db the profiles get read from
+        :param max_size: the maximum amount of cached profiles
+        :param pending_xp: called with guild id and user id, returns the xp that isn't in the database yet
+        """
+        self.db = db
+        self.pending_xp = pending_xp
+        self.max_size = max_size
+        self._profiles = OrderedDict()  # (guild id, user id) -> Profile
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def __contains__(self, key):
+        return key in self._profiles
+
+    async def get(self, guild_id, user_id):
+        """
+        :param guild_id: the id of the guild
+        :param user_id: the id of the user
+        :returns: the Profile of the user, users without a profile have 0 everywhere
+        """
+        key = (guild_id, user_id)
+        profile = self._profiles.get(key)
+        if profile is not None and profile.complete:
+            self.hits += 1
+            self._profiles.move_to_end(key)
+            return profile
+        self.misses += 1
+        row = await self.db.get_profile(guild_id, user_id)
+        text_xp, text_lvl, warnings = row if row is not None else (0, 0, 0)
+        # A write could have happened while the query was running
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._store(key, Profile())
+        if profile.text_xp is None:
+            profile.text_xp = (text_xp or 0) + (self.pending_xp(guild_id, user_id) if self.pending_xp else 0)
+        if profile.text_lvl is None:
+            profile.text_lvl = text_lvl or 0
+        if profile.warnings is None:
+            profile.warnings = warnings or 0
+        return profile
+
+    def update(self, guild_id, user_id, **columns):
+        """
+        Keeps the cache in sync with a write of the bot
+        :param guild_id: the id of the guild
+        :param user_id: the id of the user
+        :param columns: text_xp, text_lvl and/or warnings with their new values
+        """
+        key = (guild_id, user_id)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._store(key, Profile())
+        else:
+            self._profiles.move_to_end(key)
+        for column, value in columns.items():
+            setattr(profile, column, value)
+
+    def forget(self, guild_id, user_id):
+        self._profiles.pop((guild_id, user_id), None)
+
+    def _store(self, key, profile):
+        self._profiles[key] = profile
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+            self.evictions += 1
+        return profile
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "profiles": len(self._profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit rate": f"{self.hits / total:.1%}" if total else "-",
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,69 @@
+"""
+Keeps the anti spam state on disk, so restarts and deploys don't wipe the message windows and counters.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger('discord.snapshot')
+
+
+class SpamSnapshot:
+    """
+    The snapshot is incremental, only users that got touched since the last snapshot are serialized again.
+    The file itself is always written as a whole and replaced atomically, so a crash can't leave half of it behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}  # "guild id:user id" -> state of the user
+
+    def __len__(self):
+        return len(self._records)
+
+    def update(self, cache):
+        """
+        Serializes every user that changed since the last update
+        :param cache: the DbCache holding the users
+        """
+        for guild_id, user_id in cache.users.pop_dirty():
+            key = f"{guild_id}:{user_id}"
+            state = cache.states.get(guild_id)
+            user = state.users.peek(user_id) if state is not None else None
+            if user is None or not (user.messages or user.warn_count or user.kick_count):
+                self._records.pop(key, None)
+            else:
+                self._records[key] = user.snapshot()
+
+    def dumps(self):
+        return json.dumps(self._records, separators=(",", ":"))
+
+    def write(self, data):
+        """
+        Blocking, should run in an executor
+        :param data: the string returned by dumps
+        """
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def read(self):
+        """
+        Blocking, should run in an executor
+        :return: dict with (guild id, user id) as key and the state of the user as value
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as ex:
+            logger.warning(f"Ignoring broken anti spam snapshot {self.path}: {ex}")
+            return {}
+        self._records = records
+        states = {}
+        for key, state in records.items():
+            guild_id, user_id = key.split(":")
+            states[(int(guild_id), int(user_id))] = state
+        return states
@@ -0,0 +1,276 @@
+"""
+Index structures for the anti spam system.
+They keep the per message work of User.propagate small by only handing messages to the exact scorer
+that can actually be a duplicate of the new one.
+"""
+import hashlib
+import heapq
+from collections import deque
+
+from fuzzywuzzy.utils import full_process
+
+try:
+    # rapidfuzz is a lot faster than the pure python fallback of fuzzywuzzy and can stop scoring early
+    from rapidfuzz.fuzz import ratio as _ratio
+
+    def ratio(s1, s2, cutoff=0):
+        # fuzzywuzzy rounds its scores, so everything that rounds up to the cutoff has to pass
+        return int(round(_ratio(s1, s2, score_cutoff=max(cutoff - 0.5, 0))))
+except ImportError:
+    from fuzzywuzzy.fuzz import ratio as _ratio
+
+    def ratio(s1, s2, cutoff=0):
+        return _ratio(s1, s2)
+
+
+def stable_hash(text):
+    """
+    The builtin hash of a str is salted per process, this one gives the same buckets in every run
+    :param text: the text to hash
+    :return: a 64 bit int
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+
+def token_sort_key(content):
+    """
+    Processes a message the same way fuzz.token_sort_ratio does, so the result can be stored once
+    and compared with fuzz.ratio later on without processing the content again
+    :param content: the raw message content
+    :return: the lowered, ascii only content with its tokens sorted
+    """
+    tokens = full_process(content, force_ascii=True).split()
+    return " ".join(sorted(tokens)).strip()
+
+
+def score_window(key, candidates, accuracy, limit):
+    """
+    Scores the key against a whole window in one call, like fuzz.token_sort_ratio would do it.
+    The ratio is 2 * matches / total length and there can't be more matches than the shorter key has characters,
+    so candidates whose length difference already rules out the accuracy are dropped before scoring them.
+    :param key: the token sorted content of the new message
+    :param candidates: iterable of (message id, key) tuples
+    :param accuracy: the score a candidate needs to count as duplicate (out of 100)
+    :param limit: scoring stops once this many duplicates were found
+    :return: the amount of duplicates found
+    """
+    found = 0
+    length = len(key)
+    for _, other in candidates:
+        if key == other:
+            found += 1
+        else:
+            other_length = len(other)
+            if round(200 * min(length, other_length) / (length + other_length)) < accuracy:
+                continue
+            if ratio(key, other, accuracy) < accuracy:
+                continue
+            found += 1
+        if found >= limit:
+            break
+    return found
+
+
+class SimilarityIndex:
+    """
+    Approximate similarity index over the token sorted content of the messages in a window.
+
+    Every message gets a signature made of the smallest hashes of its character shingles (bottom-k MinHash).
+    Two messages are bucketed together if they share at least one of those hashes, which is very likely for
+    near duplicates and unlikely for unrelated messages. Only those candidates get scored exactly,
+    so the duplicate accuracy keeps its meaning.
+    Small windows are scanned linearly since the index doesn't pay off there and it keeps them exact,
+    in exact mode every message is a candidate.
+    """
+
+    __slots__ = [
+        "_entries",
+        "_buckets",
+        "shingle_size",
+        "signature_size",
+        "linear_threshold",
+        "exact",
+    ]
+
+    def __init__(self, shingle_size=3, signature_size=10, linear_threshold=8, exact=False):
+        """
+        :param shingle_size: the length of the character shingles a signature is build from
+        :param signature_size: the amount of hashes kept per message
+        :param linear_threshold: up to this amount of messages every message is a candidate
+        :param exact: if true every message is a candidate
+        """
+        self._entries = {}  # message id -> (key, signature)
+        self._buckets = {}  # shingle hash -> set of message ids
+        self.shingle_size = shingle_size
+        self.signature_size = signature_size
+        self.linear_threshold = linear_threshold
+        self.exact = exact
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, message_id):
+        return message_id in self._entries
+
+    def __repr__(self):
+        return f"'{self.__class__.__name__} object. Entries: {len(self._entries)}, Buckets: {len(self._buckets)}'"
+
+    def signature(self, key):
+        """
+        :param key: the token sorted content of a message
+        :return: tuple with the smallest shingle hashes of the key
+        """
+        size = self.shingle_size
+        if len(key) <= size:
+            return (stable_hash(key),)
+        shingles = {key[i:i + size] for i in range(len(key) - size + 1)}
+        return tuple(heapq.nsmallest(self.signature_size, map(stable_hash, shingles)))
+
+    def candidates(self, key, signature=None):
+        """
+        Returns the messages that could be a duplicate of the given key
+        :param key: the token sorted content of the new message
+        :param signature: the signature of the key, gets calculated if none
+        :return: list of (message id, key) tuples
+        """
+        entries = self._entries
+        if self.exact or len(entries) <= self.linear_threshold:
+            return [(message_id, entry[0]) for message_id, entry in entries.items()]
+        if signature is None:
+            signature = self.signature(key)
+        found = set()
+        for h in signature:
+            bucket = self._buckets.get(h)
+            if bucket:
+                found |= bucket
+        return [(message_id, entries[message_id][0]) for message_id in found]
+
+    def add(self, message_id, key, signature=None):
+        """
+        :param message_id: the id of the message
+        :param key: the token sorted content of the message
+        :param signature: the signature of the key, gets calculated if none
+        """
+        if signature is None:
+            signature = self.signature(key)
+        self._entries[message_id] = (key, signature)
+        for h in signature:
+            bucket = self._buckets.get(h)
+            if bucket is None:
+                self._buckets[h] = {message_id}
+            else:
+                bucket.add(message_id)
+
+    def remove(self, message_id):
+        """
+        Removes the message from the index, unknown ids are ignored
+        :param message_id: the id of the message
+        """
+        entry = self._entries.pop(message_id, None)
+        if entry is None:
+            return
+        for h in entry[1]:
+            bucket = self._buckets.get(h)
+            if bucket is not None:
+                bucket.discard(message_id)
+                if not bucket:
+                    del self._buckets[h]
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+
+class RaidIndex:
+    """
+    Guild wide sliding window of content fingerprints, shared by all users of a GuildStates.
+    A raid where many accounts post the same payload once each never trips the per user duplicate counter,
+    so this counts the distinct authors per fingerprint instead.
+    Each message costs O(1) and the window never holds more than max_entries messages.
+    Once a payload is a raid, take_raiders hands out the messages of the authors that posted it before.
+    """
+
+    __slots__ = [
+        "_window",
+        "_authors",
+        "_flagged",
+        "interval",
+        "max_entries",
+        "min_length",
+    ]
+
+    def __init__(self, interval=10000, max_entries=5000, min_length=10):
+        """
+        :param interval: the time in milliseconds a message counts towards a raid
+        :param max_entries: the maximum amount of messages kept for the guild
+        :param min_length: shorter messages are ignored, since e.g. 'gg' or 'lol' get posted by many people anyways
+        """
+        self._window = deque()  # (creation time, fingerprint, author id, message)
+        self._authors = {}  # fingerprint -> {author id: amount of messages}
+        self._flagged = set()  # fingerprints whose raiders were handed out
+        self.interval = interval
+        self.max_entries = max_entries
+        self.min_length = min_length
+
+    def __len__(self):
+        return len(self._window)
+
+    def __repr__(self):
+        return f"'{self.__class__.__name__} object. Entries: {len(self._window)}, Payloads: {len(self._authors)}'"
+
+    def add(self, key, author_id, current_time, message=None):
+        """
+        :param key: the token sorted content of the message
+        :param author_id: the id of the author
+        :param current_time: the creation time of the message in milliseconds
+        :param message: the message itself, kept for take_raiders
+        :return: the amount of distinct authors that posted this payload within the interval, 0 if it is ignored
+        """
+        self.clean_up(current_time)
+        if len(key) < self.min_length:
+            return 0
+        if len(self._window) >= self.max_entries:
+            self._pop()
+        fingerprint = stable_hash(key)
+        self._window.append((current_time, fingerprint, author_id, message))
+        authors = self._authors.get(fingerprint)
+        if authors is None:
+            authors = self._authors[fingerprint] = {}
+        authors[author_id] = authors.get(author_id, 0) + 1
+        return len(authors)
+
+    def take_raiders(self, key):
+        """
+        Only the first call per raid gets the authors, the ones that post the payload later
+        are caught by add on their own message
+        :param key: the token sorted content of the raid message
+        :return: dict of author id -> their latest message with the payload, empty if they were handed out already
+        """
+        fingerprint = stable_hash(key)
+        if fingerprint not in self._authors or fingerprint in self._flagged:
+            return {}
+        self._flagged.add(fingerprint)
+        # Walks the window, but only once per raid
+        return {author_id: message for _, entry, author_id, message in self._window if entry == fingerprint}
+
+    def clean_up(self, current_time):
+        """
+        Pops every message from the head of the window that is older than the interval
+        :param current_time: the current time in milliseconds
+        """
+        window = self._window
+        expired = current_time - self.interval
+        while window and window[0][0] <= expired:
+            self._pop()
+
+    def _pop(self):
+        _, fingerprint, author_id, _ = self._window.popleft()
+        authors = self._authors[fingerprint]
+        if authors[author_id] <= 1:
+            del authors[author_id]
+            if not authors:
+                del self._authors[fingerprint]
+                # A later raid with the same payload hands out its authors again
+                self._flagged.discard(fingerprint)
+        else:
+            authors[author_id] -= 1
@@ -0,0 +1,80 @@
+"""
+Compiled anti spam settings of a guild.
+"""
+from typing import Any, FrozenSet, NamedTuple
+
+
+def _ids(rows):
+    # The banned lists come as rows with the id as the only column
+    return frozenset(row[0] if isinstance(row, tuple) else row for row in rows)
+
+
+class SpamPolicy(NamedTuple):
+    """
+    Immutable form of the spam settings, it is compiled whenever the settings or the ignore lists
+    get loaded, so the hot path only does attribute lookups and set membership tests.
+    """
+    warn_threshold: int
+    kick_threshold: int
+    ban_threshold: int
+    interval: int  # milliseconds a message counts towards spam
+    duplicate_count: int
+    duplicate_accuracy: int
+    raid_author_count: int
+    exact_duplicates: bool
+    guild_warn_message: Any
+    guild_kick_message: Any
+    guild_ban_message: Any
+    user_kick_message: Any
+    user_ban_message: Any
+    ignored_channels: FrozenSet[int]
+    ignored_users: FrozenSet[int]
+    ignored_roles: FrozenSet[int]
+    ignored_perms: int  # bitmask of the permissions that bypass anti spam
+    ignore_bots: bool
+
+    @classmethod
+    def compile(cls, options):
+        """
+        :param options: the options dict of a GuildStates
+        :returns: the compiled policy
+        """
+        perms = 0
+        for perm in options["ignore_perms"]:
+            perms |= perm
+        return cls(
+            warn_threshold=options["warn_threshold"],
+            kick_threshold=options["kick_threshold"],
+            ban_threshold=options["ban_threshold"],
+            interval=int(options["message_interval"]),
+            duplicate_count=options["message_duplicate_count"],
+            duplicate_accuracy=options["message_duplicate_accuracy"],
+            raid_author_count=options["raid_author_count"],
+            exact_duplicates=options["exact_duplicates"],
+            guild_warn_message=options["guild_warn_message"],
+            guild_kick_message=options["guild_kick_message"],
+            guild_ban_message=options["guild_ban_message"],
+            user_kick_message=options["user_kick_message"],
+            user_ban_message=options["user_ban_message"],
+            ignored_channels=_ids(options["ignore_channels"]),
+            ignored_users=_ids(options["ignore_Users"]),
+            ignored_roles=_ids(options["ignore_roles"]),
+            ignored_perms=perms,
+            ignore_bots=options["ignore_bots"],
+        )
+
+    def ignores(self, message):
+        """
+        Checks if a message bypasses anti spam, without touching any user state
+        :param message: the discord.Message
+        :returns: True if the message should be ignored
+        """
+        author = message.author
+        if self.ignore_bots and author.bot:
+            return True
+        if author.id in self.ignored_users or message.channel.id in self.ignored_channels:
+            return True
+        if self.ignored_roles and not self.ignored_roles.isdisjoint(role.id for role in getattr(author, "roles", ())):
+            return True
+        permissions = getattr(author, "guild_permissions", None)
+        return bool(self.ignored_perms and permissions is not None and permissions.value & self.ignored_perms)
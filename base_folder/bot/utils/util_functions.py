@@ -10,6 +10,8 @@ from discord.embeds import EmptyEmbed
 A short utility for random functions which don't fit into an object
 """
 
+DISCORD_EPOCH = 1420070400000
+
 
 def prefix(client, ctx):
     try:
@@ -19,6 +21,15 @@ def prefix(client, ctx):
         return "-"
 
 
+def snowflake_time_ms(snowflake):
+    """
+    Discord snowflakes carry their creation time in the upper bits
+    :param snowflake: the id of e.g. a message
+    :return: the creation time in milliseconds since the unix epoch
+    """
+    return (int(snowflake) >> 22) + DISCORD_EPOCH
+
+
 def loadmodules(modules, client):
     for extension in modules:
         try:
@@ -0,0 +1,306 @@
+"""
+Write behind buffers for the punishment counters of the anti spam system, the text xp and the message log.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import partial
+
+from base_folder.config import PUNISHMENT_FLUSH_SIZE, PUNISHMENT_FLUSH_TIMEOUT, MESSAGE_FLUSH_SIZE, \
+    MESSAGE_BUFFER_MAX, XP_FLUSH_SIZE
+from base_folder.celery.db import edit_punishments, insert_messages, add_text_xp
+
+logger = logging.getLogger('discord.write_behind')
+
+
+class PunishmentBuffer:
+    """
+    Collects the warnings and kick counts per (guild id, user id, column) instead of sending a task per change.
+    Only the latest amount of a key is kept and everything is written with one statement on flush.
+    Only one flush is in flight at a time. A flush doesn't wait for the worker, the next one checks whether
+    the previous one finished and only sends its rows once it did, so an older amount can never overwrite a newer one.
+    """
+    COLUMNS = ("warnings", "kickCount")
+
+    def __init__(self, max_pending=PUNISHMENT_FLUSH_SIZE, timeout=PUNISHMENT_FLUSH_TIMEOUT, on_set=None):
+        """
+        :param max_pending: amount of pending keys that triggers a flush
+        :param timeout: seconds after which a flush that didn't finish gets logged, also the wait on shutdown
+        :param on_set: called with guild id, user id, column and amount for every change, e.g. to update caches
+        """
+        self.on_set = on_set
+        self._pending = {}  # (guild id, user id, column) -> amount
+        self._inflight = {}  # the amounts of the flush the worker didn't confirm yet
+        self._result = None  # the result of that flush
+        self._sent_at = 0
+        self._late = False  # the flush in flight got logged as late
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.flushes = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def set(self, guild_id, user_id, column, amount):
+        """
+        :param guild_id: the id of the guild
+        :param user_id: the id of the user
+        :param column: warnings or kickCount
+        :param amount: the new absolute amount
+        """
+        if column not in self.COLUMNS:
+            raise ValueError(f"Can't buffer column {column}")
+        key = (guild_id, user_id, column)
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = amount
+        if self.on_set is not None:
+            self.on_set(guild_id, user_id, column, amount)
+        # With a flush in flight the next tick sends the rows anyway
+        if len(self._pending) >= self.max_pending and self._result is None:
+            try:
+                asyncio.get_event_loop().create_task(self.flush())
+            except RuntimeError:
+                pass
+
+    def get(self, guild_id, user_id, column):
+        """
+        :returns: the amount that isn't written yet, None if there is none
+        """
+        key = (guild_id, user_id, column)
+        amount = self._pending.get(key)
+        return self._inflight.get(key) if amount is None else amount
+
+    async def flush(self, wait=False):
+        """
+        Sends all pending amounts once the previous flush finished. Rows of a failed flush are kept
+        unless a newer amount got set in the meantime
+        :param wait: waits up to timeout for the worker before and after sending, e.g. on shutdown
+        """
+        if wait:
+            await self._wait()
+        if self._result is not None and not self._settle():
+            return
+        if not self._pending:
+            return
+        self._inflight, self._pending = self._pending, {}
+        rows = [[guild_id, user_id, column, amount]
+                for (guild_id, user_id, column), amount in self._inflight.items()]
+        try:
+            self._result = edit_punishments.delay(rows)
+        except Exception as ex:
+            # The task never got queued
+            self._requeue()
+            logger.warning(f"Flushing {len(rows)} punishment counters failed, retrying with the next flush: {ex}")
+            return
+        self._sent_at = time.monotonic()
+        self._late = False
+        if wait:
+            await self._wait()
+            # A scheduled flush could have settled it meanwhile
+            if self._result is not None:
+                self._settle()
+
+    async def _wait(self):
+        # Blocks a thread of the executor instead of the loop, nothing else waits for it
+        result = self._result
+        if result is None:
+            return
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, partial(result.get, timeout=self.timeout))
+        except Exception:
+            # _settle reports the outcome
+            pass
+
+    def _settle(self):
+        """
+        Takes the outcome of the flush in flight without waiting for it
+        :returns: False if it is still queued or running
+        """
+        if not self._result.ready():
+            if not self._late and time.monotonic() - self._sent_at > self.timeout:
+                logger.warning(f"Flushing {len(self._inflight)} punishment counters takes longer than "
+                               f"{self.timeout}s, the next flush waits for it")
+                self._late = True
+            return False
+        if self._result.successful():
+            self._inflight = {}
+            self.flushes += 1
+        else:
+            # The task failed and its transaction got rolled back
+            logger.warning(f"Flushing {len(self._inflight)} punishment counters failed, retrying with the next flush")
+            self._requeue()
+        self._result = None
+        return True
+
+    def _requeue(self):
+        for key, amount in self._inflight.items():
+            self._pending.setdefault(key, amount)
+        self._inflight = {}
+
+    def stats(self):
+        return {"pending": len(self._pending), "in flight": len(self._inflight), "flushes": self.flushes,
+                "coalesced": self.coalesced}
+
+
+class MessageBuffer:
+    """
+    Collects the logged messages and sends them as one insert_messages task per batch
+    instead of a task and a commit per message.
+    The buffer is bounded, if the broker is unreachable for long the oldest messages are dropped.
+    """
+
+    def __init__(self, batch_size=MESSAGE_FLUSH_SIZE, max_buffered=MESSAGE_BUFFER_MAX):
+        """
+        :param batch_size: amount of buffered messages that triggers a flush, also the most rows per task
+        :param max_buffered: the most messages that are kept, older ones get dropped
+        """
+        self._messages = deque()
+        self._lock = asyncio.Lock()
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self.flushes = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def append(self, guild_id, user_id, message_id, channel_id, content):
+        """
+        :param guild_id: id of the guild the message was sent in
+        :param user_id: the id of the author
+        :param message_id: the id of the message
+        :param channel_id: the channel id the message was sent in
+        :param content: message content itself
+        """
+        if len(self._messages) >= self.max_buffered:
+            self._messages.popleft()
+            self.dropped += 1
+        self._messages.append((guild_id, user_id, message_id, channel_id, content))
+        if len(self._messages) >= self.batch_size and not self._lock.locked():
+            try:
+                asyncio.get_event_loop().create_task(self.flush())
+            except RuntimeError:
+                pass
+
+    async def flush(self):
+        """
+        Sends everything that is buffered in batches of batch_size,
+        a batch the broker didn't take goes back to the front of the buffer
+        """
+        async with self._lock:
+            while self._messages:
+                batch = [self._messages.popleft() for _ in range(min(self.batch_size, len(self._messages)))]
+                try:
+                    insert_messages.delay(batch)
+                except Exception as ex:
+                    self._messages.extendleft(reversed(batch))
+                    while len(self._messages) > self.max_buffered:
+                        self._messages.popleft()
+                        self.dropped += 1
+                    logger.warning(f"Sending {len(batch)} messages failed, retrying with the next flush: {ex}")
+                    return
+                self.flushes += 1
+
+    def stats(self):
+        return {"buffered": len(self._messages), "flushes": self.flushes, "dropped": self.dropped}
+
+
+class XpAccumulator:
+    """
+    Sums the text xp users earn per (guild id, user id) and writes it as text_xp = text_xp + delta,
+    so writes can't overwrite each other no matter in which order the workers apply them.
+    Level ups are computed by the bot and written as GREATEST(text_lvl, level) with the next flush.
+    Sent deltas count as pending until the worker committed them, so a profile read in between still adds them.
+    """
+
+    def __init__(self, max_pending=XP_FLUSH_SIZE):
+        """
+        :param max_pending: amount of pending users that triggers a flush
+        """
+        self._deltas = {}  # (guild id, user id) -> xp earned since the last flush
+        self._levels = {}  # (guild id, user id) -> level reached since the last flush
+        self._inflight = []  # (result, deltas, levels) of the flushes the worker didn't confirm yet
+        self._lock = asyncio.Lock()
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.added = 0
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def add(self, guild_id, user_id, delta, level=None):
+        """
+        :param guild_id: the id of the guild
+        :param user_id: the id of the user
+        :param delta: the xp the user earned
+        :param level: the new level if the user leveled up
+        """
+        key = (guild_id, user_id)
+        self._deltas[key] = self._deltas.get(key, 0) + delta
+        if level is not None:
+            self._levels[key] = max(level, self._levels.get(key, 0))
+        self.added += 1
+        if len(self._deltas) >= self.max_pending and not self._lock.locked():
+            try:
+                asyncio.get_event_loop().create_task(self.flush())
+            except RuntimeError:
+                pass
+
+    def pending(self, guild_id, user_id):
+        """
+        :returns: the xp of the user that isn't written yet, including the xp of flushes that aren't committed
+        """
+        key = (guild_id, user_id)
+        # Only the flushes that have xp of the user get checked, the profile cache calls this on every miss
+        if any(key in deltas for _, deltas, _ in self._inflight):
+            self._settle()
+        return self._deltas.get(key, 0) + sum(deltas.get(key, 0) for _, deltas, _ in self._inflight)
+
+    async def flush(self):
+        """
+        Sends all pending deltas. A flush is never waited for or sent again on a timeout,
+        that could add the same delta twice. Only a flush the worker reported as failed got rolled back
+        and is sent again with the next one.
+        """
+        async with self._lock:
+            self._settle()
+            if not self._deltas:
+                return
+            deltas, self._deltas = self._deltas, {}
+            levels, self._levels = self._levels, {}
+            rows = [[guild_id, user_id, delta, levels.get((guild_id, user_id), 0)]
+                    for (guild_id, user_id), delta in deltas.items()]
+            try:
+                result = add_text_xp.delay(rows)
+            except Exception as ex:
+                self._requeue(deltas, levels)
+                logger.warning(f"Sending the xp of {len(rows)} users failed, retrying with the next flush: {ex}")
+                return
+            self._inflight.append((result, deltas, levels))
+            self.flushes += 1
+
+    def _settle(self):
+        """
+        Forgets the flushes the worker finished, the deltas of failed ones are pending again
+        """
+        inflight = []
+        for result, deltas, levels in self._inflight:
+            if not result.ready():
+                inflight.append((result, deltas, levels))
+            elif not result.successful():
+                self._requeue(deltas, levels)
+                logger.warning(f"Adding the xp of {len(deltas)} users failed, retrying with the next flush")
+        self._inflight = inflight
+
+    def _requeue(self, deltas, levels):
+        for key, delta in deltas.items():
+            self._deltas[key] = self._deltas.get(key, 0) + delta
+        for key, level in levels.items():
+            self._levels[key] = max(level, self._levels.get(key, 0))
+
+    def stats(self):
+        return {"pending": len(self._deltas), "in flight": len(self._inflight), "flushes": self.flushes,
+                "messages": self.added}
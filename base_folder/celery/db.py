@@ -1,24 +1,70 @@
 import base64
+import os
+import threading
 from abc import ABC
 from base_folder.celery.worker import app, Task
-from base_folder.config import sql
+from base_folder.celery.pool import ConnectionPool
+from base_folder.celery.local import local_executor
+from base_folder.config import TASK_EXECUTOR, WORKER_DB_POOL_SIZE
+from base_folder.query_stats import query_stats
 '''
 Initialize the tables
 '''
 
 
-class DatabaseTask(Task, ABC):
-    _db = None
+_pool = None
+_local = threading.local()  # the connection of the task that runs in this thread
+
+
+def _connection_pool():
+    """
+    :returns: the connection pool of this worker process
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        if TASK_EXECUTOR == "local":
+            # Every thread of the local executor can run a task at the same time
+            _pool = ConnectionPool(size=max(WORKER_DB_POOL_SIZE, local_executor().threads))
+        else:
+            _pool = ConnectionPool()
+    return _pool
+
+
+class ExecutorTask(Task, ABC):
+    """
+    Runs on the executor of the config, the celery workers or the threads of the local mode
+    """
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        # In the local mode .delay() runs the task on a thread of this process instead of sending it to a worker
+        if TASK_EXECUTOR == "local":
+            return local_executor().submit(self, args or (), kwargs, options.get("queue"))
+        return super().apply_async(args, kwargs, **options)
+
+
+class DatabaseTask(ExecutorTask, ABC):
+    """
+    Lends every run a connection of the process pool and gives it back afterwards,
+    open cursors are closed and uncommitted changes rolled back even if the task raised
+    """
+
+    def __call__(self, *args, **kwargs):
+        connection_pool = _connection_pool()
+        previous = getattr(_local, "connection", None)
+        _local.connection = connection_pool.acquire()
+        try:
+            return super().__call__(*args, **kwargs)
+        finally:
+            connection_pool.release(_local.connection)
+            _local.connection = previous
 
     @property
     def db(self):
-        if self._db is None:
-            self._db = sql()
-        if self._db.is_connected():
-            return self._db
-        else:
-            self._db = sql()
-            return self._db
+        # The cursors of the connection time their statements
+        connection = getattr(_local, "connection", None)
+        if connection is None:
+            raise RuntimeError("The database connection is only available while a database task runs")
+        return connection
 
 
 @app.task(base=DatabaseTask, ignore_result=False)
@@ -120,6 +166,24 @@ def edit_kickcount(guild_id, user_id, amount):
     return
 
 
+@app.task(base=DatabaseTask, ignore_result=False)
+def edit_punishments(rows):
+    # sets warnings and kickCount of many users with one statement, rows are [guild_id, user_id, column, amount]
+    conn = edit_punishments.db
+    c = conn.cursor()
+    cases = {"warnings": [], "kickCount": []}
+    users = set()
+    for guild_id, user_id, column, amount in rows:
+        cases[column].append(f"WHEN guild_id={int(guild_id)} and user_id={int(user_id)} THEN {int(amount)}")
+        users.add(f"({int(guild_id)}, {int(user_id)})")
+    columns = ", ".join(f"{column}=CASE {' '.join(when)} ELSE {column} END"
+                        for column, when in cases.items() if when)
+    c.execute(f"UPDATE profiles SET {columns} WHERE (guild_id, user_id) IN ({', '.join(users)})")
+    conn.commit()
+    c.close()
+    return len(rows)
+
+
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_muted_at(guild_id, user_id, date):
     conn = edit_muted_at.db
@@ -231,7 +295,7 @@ def edit_settings_welcome(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_stdout(guild_id, channel_id):
     # sets the stdout_channel to the given channel id
-    conn = edit_settings_welcome.db
+    conn = edit_settings_stdout.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET stdout_channel_id={str(channel_id)} WHERE guild_id = '{guild_id}'")
     conn.commit()
@@ -242,7 +306,7 @@ def edit_settings_stdout(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_warn(guild_id, channel_id):
     # sets the warn_channel to the given channel id
-    conn = edit_settings_welcome.db
+    conn = edit_settings_warn.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET warn_channel_id={str(channel_id)} WHERE guild_id = '{guild_id}'")
     conn.commit()
@@ -253,7 +317,7 @@ def edit_settings_warn(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_kick(guild_id, channel_id):
     # sets the  kick_channel to the given channel id
-    conn = edit_settings_welcome.db
+    conn = edit_settings_kick.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET kick_channel_id={str(channel_id)} WHERE guild_id = '{guild_id}'")
     conn.commit()
@@ -264,7 +328,7 @@ def edit_settings_kick(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_ban(guild_id, channel_id):
     # sets the ban_channel to the given channel id
-    conn = edit_settings_welcome.db
+    conn = edit_settings_ban.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET ban_channel_id={str(channel_id)} WHERE guild_id = '{guild_id}'")
     conn.commit()
@@ -286,7 +350,7 @@ def edit_settings_leave(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_cmd(guild_id, channel_id):
     # sets the leave_channel to the given channel id
-    conn = edit_settings_leave.db
+    conn = edit_settings_cmd.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET cmd_channel_id ={str(channel_id)} WHERE guild_id ='{guild_id}'")
     conn.commit()
@@ -297,7 +361,7 @@ def edit_settings_cmd(guild_id, channel_id):
 @app.task(base=DatabaseTask, ignore_result=True)
 def set_leave_text(guild_id, text):
     # sets the leave_channel to the given channel id
-    conn = edit_settings_leave.db
+    conn = set_leave_text.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET leave_text ='{str(text)}' WHERE guild_id ='{guild_id}'")
     conn.commit()
@@ -308,7 +372,7 @@ def set_leave_text(guild_id, text):
 @app.task(base=DatabaseTask, ignore_result=True)
 def edit_settings_lvl(guild_id, channel_id):
     # sets the lvl_channel to the given channel id
-    conn = edit_settings_leave.db
+    conn = edit_settings_lvl.db
     c = conn.cursor()
     c.execute(f"UPDATE settings SET lvl_channel_id ={str(channel_id)} WHERE guild_id ='{guild_id}'")
     conn.commit()
@@ -364,10 +428,28 @@ def update_xp_text(guild_id, user_id, amount):
     return
 
 
-@app.task(ignore_result=True)
+@app.task(base=DatabaseTask, ignore_result=False)
+def add_text_xp(rows):
+    """
+    Adds the xp users earned since the last flush, all rows are written with one commit
+    :param rows: list of [guild_id, user_id, xp delta, level], level is 0 if the user didn't level up
+    :return: nothing
+    """
+    conn = add_text_xp.db
+    c = conn.cursor()
+    # The columns are nullable, NULL + delta stays NULL and GREATEST with a NULL is NULL as well
+    c.executemany("UPDATE profiles SET text_xp = COALESCE(text_xp, 0) + %s, "
+                  "text_lvl = GREATEST(COALESCE(text_lvl, 0), %s) WHERE guild_id = %s and user_id = %s",
+                  [(int(delta), int(level), int(guild_id), int(user_id)) for guild_id, user_id, delta, level in rows])
+    conn.commit()
+    c.close()
+    return
+
+
+@app.task(base=DatabaseTask, ignore_result=True)
 def update_text_lvl(guild_id, user_id, amount=1):
     # updates the text lvl for a given user
-    conn = update_xp_text.db
+    conn = update_text_lvl.db
     c = conn.cursor()
     c.execute(f"UPDATE profiles SET text_lvl = {str(amount)}  WHERE user_id ="
               f"{str(user_id)} and guild_id={str(guild_id)}")
@@ -408,6 +490,24 @@ def insert_message(guild_id, userid, messageid, channelid, message):
     return
 
 
+@app.task(base=DatabaseTask, ignore_result=True)
+def insert_messages(rows):
+    """
+    Logs many messages with one multi row insert and one commit
+    :param rows: list of [guild_id, user_id, message_id, channel_id, message]
+    :return: nothing
+    """
+    conn = insert_messages.db
+    c = conn.cursor()
+    # A batch can be delivered twice, the unique key on (guild_id, message_id) skips messages that are logged.
+    # Unlike INSERT IGNORE that only skips duplicates, foreign key and data errors still fail the batch
+    c.executemany("INSERT INTO `messages`(`guild_id`, `user_id`, `message_id`, `channel_id`, `message`) "
+                  "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE `id` = `id`", [tuple(row) for row in rows])
+    conn.commit()
+    c.close()
+    return
+
+
 @app.task(base=DatabaseTask, ignore_result=True)
 def insert_reaction(guild_id, message_id, roleid, emoji):
     """
@@ -418,10 +518,32 @@ def insert_reaction(guild_id, message_id, roleid, emoji):
     :param emoji: the emoji the bot reacted with
     :return:
     """
-    conn = insert_message.db
+    conn = insert_reaction.db
     c = conn.cursor()
+    # A message and emoji map to one role, a new role replaces the old one
     c.execute(f"INSERT INTO `reactions`(`guild_id`, `message_id`, `role_id`, `emoji`) VALUES ('{guild_id}',"
-              f"'{message_id}','{roleid}', %s)", (emoji,))
+              f"'{message_id}','{roleid}', %s) ON DUPLICATE KEY UPDATE `role_id` = VALUES(`role_id`)", (emoji,))
+    conn.commit()
+    c.close()
+    return
+
+
+@app.task(base=DatabaseTask, ignore_result=True)
+def delete_reaction(guild_id, message_id, emoji=None):
+    """
+
+    :param guild_id: id of the guild the data is for
+    :param message_id: the id of the message
+    :param emoji: the emoji of the reaction role, every reaction role of the message if none
+    :return:
+    """
+    conn = delete_reaction.db
+    c = conn.cursor()
+    if emoji is None:
+        c.execute(f"DELETE FROM `reactions` WHERE `guild_id` = {int(guild_id)} AND `message_id` = {int(message_id)}")
+    else:
+        c.execute(f"DELETE FROM `reactions` WHERE `guild_id` = {int(guild_id)} AND `message_id` = {int(message_id)} "
+                  f"AND `emoji` = %s", (emoji,))
     conn.commit()
     c.close()
     return
@@ -442,3 +564,54 @@ def update_role_name(guild_id, roleid, name):
     conn.commit()
     c.close()
     return
+
+
+'''
+Blacklist
+'''
+
+
+@app.task(base=DatabaseTask, ignore_result=True)
+def blacklist_add(user_id):
+    conn = blacklist_add.db
+    c = conn.cursor()
+    c.execute(f"INSERT INTO blacklist (user_id) SELECT {int(user_id)} FROM DUAL "
+              f"WHERE NOT EXISTS (SELECT 1 FROM blacklist WHERE user_id={int(user_id)})")
+    conn.commit()
+    c.close()
+    return
+
+
+@app.task(base=DatabaseTask, ignore_result=True)
+def blacklist_remove(user_id):
+    conn = blacklist_remove.db
+    c = conn.cursor()
+    c.execute(f"DELETE FROM blacklist WHERE user_id={int(user_id)}")
+    conn.commit()
+    c.close()
+    return
+
+
+'''
+Instrumentation
+'''
+
+
+# Neither of them queries the database, so they don't take a connection of the pool
+@app.task(base=ExecutorTask, ignore_result=False)
+def top_queries(n=10):
+    """
+    Reports the statements of the worker that answers, every worker process keeps its own stats
+    :param n: amount of statement shapes
+    :return: list of dicts with the shape, count and latencies in milliseconds
+    """
+    return query_stats.top(n)
+
+
+@app.task(base=ExecutorTask, ignore_result=False)
+def worker_pool_stats():
+    """
+    Reports the connection pool of the worker process that answers
+    :return: dict with size, open, idle and discarded connections
+    """
+    return _connection_pool().stats()
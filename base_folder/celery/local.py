@@ -0,0 +1,143 @@
+"""
+Runs the celery tasks on threads of the bot process instead of sending them to a worker.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from base_folder.config import WORKER_CONCURRENCY, LOCAL_EXECUTOR_MAX_PENDING, task_routes, task_default_queue
+
+logger = logging.getLogger('celery.local')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LocalResult:
+    """
+    The part of celery's AsyncResult the bot uses, backed by a future
+    """
+    __slots__ = ["id", "_future"]
+
+    def __init__(self, future):
+        self.id = str(uuid.uuid4())
+        self._future = future
+
+    def get(self, timeout=None):
+        """
+        :param timeout: seconds to wait for the task
+        :returns: the return value of the task, raises its exception
+        """
+        return self._future.result(timeout)
+
+    def ready(self):
+        return self._future.done()
+
+    def successful(self):
+        return self._future.done() and self._future.exception() is None
+
+
+class LocalExecutor:
+    """
+    One thread pool per celery queue, so the local mode keeps the separation of the workers.
+    Every pool takes at most max_pending tasks that haven't finished.
+    """
+
+    def __init__(self, concurrency=None, max_pending=LOCAL_EXECUTOR_MAX_PENDING):
+        """
+        :param concurrency: dict of queue -> threads, WORKER_CONCURRENCY by default
+        :param max_pending: tasks per queue that are queued or running
+        """
+        concurrency = concurrency or WORKER_CONCURRENCY
+        self.max_pending = max_pending
+        self._pools = {queue: ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"task-{queue}")
+                       for queue, threads in concurrency.items()}
+        self._slots = {queue: threading.BoundedSemaphore(max_pending) for queue in self._pools}
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @property
+    def threads(self):
+        return sum(pool._max_workers for pool in self._pools.values())
+
+    def queue_of(self, task, queue=None):
+        """
+        :param task: the celery task
+        :param queue: the queue the caller asked for
+        :returns: the queue the task runs on
+        """
+        queue = queue or task_routes.get(task.name, {}).get('queue', task_default_queue)
+        return queue if queue in self._pools else task_default_queue
+
+    def submit(self, task, args=(), kwargs=None, queue=None):
+        """
+        :param task: the celery task
+        :param args: the positional arguments of the task
+        :param kwargs: the keyword arguments of the task
+        :param queue: the queue the caller asked for, the routes of the config otherwise
+        :returns: a LocalResult
+        """
+        queue = self.queue_of(task, queue)
+        slots = self._slots[queue]
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise QueueFull(f"{self.max_pending} tasks are already waiting in the {queue} queue")
+        self.submitted += 1
+        try:
+            future = self._pools[queue].submit(task, *args, **(kwargs or {}))
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda done: self._done(task, slots, done))
+        return LocalResult(future)
+
+    def _done(self, task, slots, future):
+        slots.release()
+        if future.exception() is not None:
+            self.failed += 1
+            logger.error(f"Task {task.name} failed: {future.exception()!r}")
+
+    def shutdown(self, wait=True):
+        """
+        :param wait: wait for the queued tasks to finish
+        """
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+
+    def stats(self):
+        return {
+            "pending": {queue: self.max_pending - slots._value for queue, slots in self._slots.items()},
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def local_executor():
+    """
+    :returns: the LocalExecutor of this process, created on first use
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = LocalExecutor()
+    return _executor
+
+
+def shutdown(wait=True):
+    """
+    Waits for the queued tasks, e.g. the last flush of the write behind buffers
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -0,0 +1,177 @@
+"""
+MySQL connection pool of a worker process.
+"""
+import logging
+import os
+import threading
+import time
+
+import mysql.connector
+
+from base_folder.config import sql, WORKER_DB_POOL_SIZE, WORKER_DB_POOL_TIMEOUT, WORKER_DB_HEALTH_CHECK_INTERVAL
+from base_folder.query_stats import TimedConnection
+
+logger = logging.getLogger('celery.pool')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection(TimedConnection):
+    """
+    A connection lent to one task, it remembers the cursors it handed out, so they can be closed afterwards
+    """
+    __slots__ = ["_cursors", "last_used"]
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._cursors = []
+        self.last_used = time.monotonic()
+
+    @property
+    def raw(self):
+        return self._connection
+
+    def cursor(self, *args, **kwargs):
+        cursor = super().cursor(*args, **kwargs)
+        self._cursors.append(cursor)
+        return cursor
+
+    def close_cursors(self):
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                # e.g. a cursor with unread results, the rollback of the release takes care of it
+                pass
+        self._cursors.clear()
+
+
+class ConnectionPool:
+    """
+    Up to size connections that are created when needed and reused by the tasks of this process.
+    Idle connections are pinged by a background thread every health_check_interval seconds,
+    so checking a connection out costs nothing.
+    """
+
+    def __init__(self, connect=sql, size=WORKER_DB_POOL_SIZE, timeout=WORKER_DB_POOL_TIMEOUT,
+                 health_check_interval=WORKER_DB_HEALTH_CHECK_INTERVAL):
+        """
+        :param connect: creates a new mysql connection
+        :param size: the most connections this process opens
+        :param timeout: seconds a task waits for a free connection
+        :param health_check_interval: seconds between the pings of the idle connections, None disables them
+        """
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()  # a pool must not be shared with forked children
+        self._idle = []  # the most recently used connection is the last one and gets reused first
+        self._created = 0
+        self._lock = threading.Lock()
+        # Notified whenever a connection gets idle or one can be opened again
+        self._available = threading.Condition(self._lock)
+        self._health_thread = None
+        self.discarded = 0
+
+    def acquire(self):
+        """
+        :returns: a PooledConnection, it has to be given back with release
+        """
+        self._start_health_checks()
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection got free within {self.timeout} seconds")
+                self._available.wait(remaining)
+        # Connecting happens outside of the lock, so it doesn't hold up the other tasks
+        try:
+            return PooledConnection(self.connect())
+        except Exception:
+            self._freed()
+            raise
+
+    def release(self, connection):
+        """
+        Closes the cursors of the task and rolls back what it didn't commit,
+        connections that fail doing so are dropped
+        :param connection: the PooledConnection from acquire
+        """
+        connection.close_cursors()
+        try:
+            connection.rollback()
+        except mysql.connector.Error as ex:
+            logger.warning(f"Dropping a broken database connection: {ex}")
+            self._discard(connection)
+            return
+        connection.last_used = time.monotonic()
+        with self._available:
+            self._idle.append(connection)
+            self._available.notify()
+
+    def _discard(self, connection):
+        try:
+            connection.raw.close()
+        except mysql.connector.Error:
+            pass
+        self._freed()
+        self.discarded += 1
+
+    def _freed(self):
+        # A waiting task can open a new connection instead
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def check_idle(self):
+        """
+        Pings the connections that were idle for a whole interval, the ones that don't answer are dropped
+        """
+        checked = []
+        now = time.monotonic()
+        with self._available:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            if now - connection.last_used < (self.health_check_interval or 0):
+                checked.append(connection)
+                continue
+            try:
+                connection.raw.ping(reconnect=False)
+            except mysql.connector.Error as ex:
+                logger.info(f"Dropping an idle database connection that failed its health check: {ex}")
+                self._discard(connection)
+                continue
+            connection.last_used = now
+            checked.append(connection)
+        # Below the connections that got released meanwhile, they were used more recently
+        with self._available:
+            self._idle[:0] = checked
+            self._available.notify(len(checked))
+
+    def _start_health_checks(self):
+        if self.health_check_interval is None or self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="db-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            try:
+                self.check_idle()
+            except Exception as ex:
+                logger.warning(f"Health check of the database connections failed: {ex}")
+
+    def stats(self):
+        return {"size": self.size, "open": self._created, "idle": len(self._idle), "discarded": self.discarded}
@@ -1,5 +1,9 @@
+import sys
+
 from celery import Celery, Task
 
+from base_folder.config import WORKER_CONCURRENCY, WORKER_PREFETCH_MULTIPLIER
+
 app = Celery('celery', include=['base_folder.celery.db', ])
 app.config_from_object('base_folder.config')
 
@@ -8,5 +12,21 @@ app.conf.update(
     result_expires=3600,
 )
 
+
+def worker_argv(queue, loglevel="info"):
+    """
+    :param queue: the name of the queue from base_folder.config
+    :param loglevel: the log level of the worker
+    :returns: the arguments of a worker that only consumes the queue, with the concurrency of the config
+    """
+    return ["worker", f"--queues={queue}", f"--hostname={queue}@%h", f"--loglevel={loglevel}",
+            f"--concurrency={WORKER_CONCURRENCY[queue]}",
+            f"--prefetch-multiplier={WORKER_PREFETCH_MULTIPLIER[queue]}"]
+
+
 if __name__ == '__main__':
-    app.start()
+    # python -m base_folder.celery.worker <queue> starts the worker of a queue, anything else goes to celery
+    if len(sys.argv) == 2 and sys.argv[1] in WORKER_CONCURRENCY:
+        app.worker_main(worker_argv(sys.argv[1]))
+    else:
+        app.start()
@@ -1,6 +1,6 @@
 import mysql.connector
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from os import environ as env
 
 '''
@@ -16,8 +16,8 @@ SQL_DB = "M3E5"
 SQL_AUTH_PLUGIN = env['sql_auth_pl']
 
 # Celery config
-broker_url = 'redis://default:' + str(env['redis_pass']) + '@172.17.0.1:6000/0'
-result_backend = 'redis://default:' + str(env['redis_pass']) + '@172.17.0.1:6000/1'
+broker_url = 'redis://default:' + str(env.get('redis_pass', '')) + '@172.17.0.1:6000/0'
+result_backend = 'redis://default:' + str(env.get('redis_pass', '')) + '@172.17.0.1:6000/1'
 broker_connection_max_retries = True
 broker_connection_retry = 0
 imports = ('base_folder.celery.db',)
@@ -25,6 +25,85 @@ include = ['base_folder.celery']
 task_cls = 'base_folder.celery.db:DatabaseTask'
 timezone = ''
 
+# Celery queues, each one is consumed by its own workers so a flood of messages can't delay
+# the moderation and settings writes. Start them with python -m base_folder.celery.worker <queue>
+HOT_QUEUE = 'hot'  # high volume writes of every message, xp and the error log
+MODERATION_QUEUE = 'moderation'  # warnings, kicks, mutes, bans and the blacklist
+SETTINGS_QUEUE = 'settings'  # guild setup, prefix, settings, roles, reaction roles and the dev stats
+QUEUE_TASKS = {
+    HOT_QUEUE: ('insert_message', 'insert_messages', 'update_xp_text', 'add_text_xp', 'update_text_lvl',
+                'is_user_indb', 'on_error'),
+    MODERATION_QUEUE: ('edit_warns', 'edit_kickcount', 'edit_punishments', 'edit_muted_at', 'muted_until',
+                       'edit_banned_at', 'banned_until', 'blacklist_add', 'blacklist_remove'),
+    # The settings worker runs one task at a time, so e.g. a reaction role delete can't overtake its insert
+    SETTINGS_QUEUE: ('initialize_guild', 'set_prefix', 'set_leave_text', 'roles_to_db', 'remove_role',
+                     'update_role_name', 'insert_reaction', 'delete_reaction', 'edit_settings_role',
+                     'edit_settings_welcome', 'edit_settings_stdout', 'edit_settings_warn', 'edit_settings_kick',
+                     'edit_settings_ban', 'edit_settings_leave', 'edit_settings_cmd', 'edit_settings_lvl',
+                     'edit_settings_img', 'edit_settings_img_text', 'edit_settings_levelsystem', 'top_queries',
+                     'worker_pool_stats'),
+}
+# Worker processes and prefetched tasks per process of every queue. The hot queue mostly gets batches,
+# so a few processes that prefetch keep up with it, the others prefetch one task at a time
+# so a slow statement doesn't hold back the tasks queued behind it
+WORKER_CONCURRENCY = {HOT_QUEUE: 4, MODERATION_QUEUE: 2, SETTINGS_QUEUE: 1}
+WORKER_PREFETCH_MULTIPLIER = {HOT_QUEUE: 4, MODERATION_QUEUE: 1, SETTINGS_QUEUE: 1}
+task_default_queue = HOT_QUEUE
+task_routes = {f'base_folder.celery.db.{name}': {'queue': queue}
+               for queue, names in QUEUE_TASKS.items() for name in names}
+
+# Task executor, "celery" sends the tasks to the workers through redis, "local" runs them on threads of the bot
+# process with WORKER_CONCURRENCY threads per queue, so a single node needs neither redis nor a worker
+TASK_EXECUTOR = env.get('task_executor', 'celery')
+LOCAL_EXECUTOR_MAX_PENDING = 10000  # waiting tasks per queue, beyond that .delay() raises like without a broker
+
+# Anti spam user cache
+USER_CACHE_MAX = 100000  # over all guilds
+USER_CACHE_MAX_PER_GUILD = 20000
+USER_CACHE_IDLE_TTL = 3600  # seconds a user can be idle before it gets dropped
+USER_CACHE_SWEEP_INTERVAL = 60  # seconds
+SPAM_SNAPSHOT_PATH = env.get('spam_snapshot_path', 'spam_state.json')
+SPAM_SNAPSHOT_INTERVAL = 30  # seconds
+
+# Profile cache
+PROFILE_CACHE_MAX = 50000  # profiles over all guilds
+
+# Write behind buffer for the text xp
+XP_FLUSH_INTERVAL = 10  # seconds
+XP_FLUSH_SIZE = 1000  # users with pending xp that trigger an early flush
+
+# Write behind buffer for the message log
+MESSAGE_FLUSH_INTERVAL = 2  # seconds
+MESSAGE_FLUSH_SIZE = 500  # buffered messages that trigger an early flush, also the rows per insert
+MESSAGE_BUFFER_MAX = 20000  # messages kept while the broker is unreachable, older ones get dropped
+
+# Leaderboard
+LEADERBOARD_PAGE_SIZE = 10  # ranks per leaderboard page
+
+# Blacklist
+BLACKLIST_REFRESH_INTERVAL = 60  # seconds between fetching new entries
+BLACKLIST_BLOOM_THRESHOLD = 1000000  # entries from which on a bloom filter replaces the set
+BLACKLIST_BLOOM_ERROR_RATE = 0.001  # share of joins that need a query despite not being blacklisted
+
+# Startup
+MIGRATE_ON_BOOT = True  # applies pending schema migrations before connecting, else use python -m base_folder.migrations
+WARMUP_ON_BOOT = True  # if false every guild gets loaded on its first event only
+WARMUP_CHUNK_SIZE = 500  # guilds loaded per round of IN queries
+
+# Connection pool of every celery worker process
+WORKER_DB_POOL_SIZE = 4  # one connection per task running at once, prefork needs 1, thread pools their concurrency
+WORKER_DB_POOL_TIMEOUT = 30  # seconds a task waits for a free connection
+WORKER_DB_HEALTH_CHECK_INTERVAL = 60  # seconds between the pings of idle connections
+
+# Query instrumentation
+SLOW_QUERY_THRESHOLD = float(env.get('slow_query_threshold', 0.2))  # seconds, slower statements get logged
+QUERY_STATS_MAX_SHAPES = 500  # distinct statements that get their own stats
+
+# Write behind buffer for warnings and kicks
+PUNISHMENT_FLUSH_INTERVAL = 5  # seconds
+PUNISHMENT_FLUSH_SIZE = 200  # pending updates that trigger an early flush
+PUNISHMENT_FLUSH_TIMEOUT = 30  # seconds after which an unfinished flush gets logged, also the wait on shutdown
+
 '''
 SQL
 '''
@@ -39,5 +118,18 @@ def sql():
       auth_plugin=SQL_AUTH_PLUGIN
     )
     return mydb
-engine = create_engine('mysql+mysqlconnector://'+SQL_USER+':'+SQL_passwd+'@'+SQL_IP+'/'+SQL_DB)
-Session = sessionmaker(bind=engine)
+
+
+# Connection pool of the bot
+DB_EXECUTOR_WORKERS = 8  # threads that run the queries of the bot, each holds at most one connection at a time
+DB_POOL_SIZE = DB_EXECUTOR_WORKERS  # connections kept open
+DB_POOL_MAX_OVERFLOW = 4  # extra connections when all pooled ones are in use, e.g. for prefix lookups
+DB_POOL_TIMEOUT = 10  # seconds to wait for a free connection before the query fails
+DB_POOL_RECYCLE = 3600  # seconds, must be below the wait_timeout of the server
+DB_POOL_PRE_PING = True  # tests connections on checkout, so connections the server dropped get replaced
+
+engine = create_engine('mysql+mysqlconnector://'+SQL_USER+':'+SQL_passwd+'@'+SQL_IP+'/'+SQL_DB,
+                       pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                       pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING)
+# One session per thread, Db removes it after every call so the connection goes back to the pool
+Session = scoped_session(sessionmaker(bind=engine))
@@ -0,0 +1,249 @@
+"""
+Versioned schema migrations.
+Every migration has a version, the applied versions are stored in the schema_migrations table,
+so each one runs once per database. The bot applies pending migrations on start if MIGRATE_ON_BOOT is set,
+otherwise run: python -m base_folder.migrations upgrade
+"""
+import datetime
+import inspect
+import logging
+
+from sqlalchemy import event
+
+logger = logging.getLogger('discord.migrations')
+
+LOCK_NAME = "m3e5_migrations"
+
+
+def _table_columns(conn, table):
+    rows = conn.execute("SELECT column_name FROM information_schema.columns "
+                        "WHERE table_schema = DATABASE() AND table_name = %s", (table,)).fetchall()
+    return {row[0] for row in rows}
+
+
+def _index_exists(conn, table, name):
+    return conn.execute("SELECT 1 FROM information_schema.statistics "
+                        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+                        (table, name)).first() is not None
+
+
+def add_index(table, name, columns, unique=False):
+    """
+    :param table: name of the table
+    :param name: name of the index
+    :param columns: the indexed columns in order
+    :param unique: creates a unique key instead of a plain index
+    :returns: the step, it does nothing if the index already exists
+    """
+    def step(conn):
+        existing = _table_columns(conn, table)
+        missing = set(columns) - existing
+        if missing:
+            # Installations that were set up from an older dump don't have every table
+            logger.warning(f"Skipping index {name}, {table} lacks {', '.join(sorted(missing))}")
+            print(f"  skipped {name}: {table} lacks {', '.join(sorted(missing))}")
+            return
+        if _index_exists(conn, table, name):
+            return
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(f"ALTER TABLE `{table}` ADD {kind} `{name}` ({', '.join(f'`{c}`' for c in columns)})")
+        print(f"  added {name} on {table}({', '.join(columns)})")
+    return step
+
+
+def add_column(table, name, definition):
+    """
+    :param table: name of the table
+    :param name: name of the column
+    :param definition: the type and default of the column, e.g. "int NOT NULL DEFAULT 0"
+    :returns: the step, it does nothing if the column already exists
+    """
+    def step(conn):
+        if name in _table_columns(conn, table):
+            return
+        conn.execute(f"ALTER TABLE `{table}` ADD COLUMN `{name}` {definition}")
+        print(f"  added {table}.{name}")
+    return step
+
+
+def merge_duplicates(table, columns, maxima):
+    """
+    Writes the highest values of every group of rows with the same values in columns into its oldest row,
+    so drop_duplicates doesn't lose what only the newer rows have
+    :param table: name of the table, it needs an id column
+    :param columns: the columns that will be unique
+    :param maxima: the columns whose highest value of the group is kept, missing ones get skipped
+    :returns: the step
+    """
+    def step(conn):
+        existing = _table_columns(conn, table)
+        if not set(columns) | {"id"} <= existing:
+            return
+        merged = [c for c in maxima if c in existing]
+        if not merged:
+            return
+        keys = ", ".join(f"`{c}`" for c in columns)
+        # The grouped derived table gets materialized, so MySQL lets the update read the table it writes
+        result = conn.execute(f"UPDATE `{table}` kept JOIN ("
+                              f"SELECT MIN(id) AS id, {', '.join(f'MAX(`{c}`) AS `{c}`' for c in merged)} "
+                              f"FROM `{table}` GROUP BY {keys} HAVING COUNT(*) > 1) dup ON kept.id = dup.id "
+                              f"SET {', '.join(f'kept.`{c}` = dup.`{c}`' for c in merged)}")
+        if result.rowcount:
+            print(f"  merged duplicates into {result.rowcount} rows of {table}")
+    return step
+
+
+def drop_duplicates(table, columns):
+    """
+    Deletes all but the oldest row of every group of rows with the same values in columns,
+    needed before a unique key can be added. Use merge_duplicates first if the newer rows can hold data
+    :param table: name of the table, it needs an id column
+    :param columns: the columns that will be unique
+    :returns: the step
+    """
+    def step(conn):
+        if not set(columns) | {"id"} <= _table_columns(conn, table):
+            return
+        on = " AND ".join(f"newer.`{c}` = older.`{c}`" for c in columns)
+        result = conn.execute(f"DELETE newer FROM `{table}` newer JOIN `{table}` older "
+                              f"ON {on} AND newer.id > older.id")
+        if result.rowcount:
+            print(f"  removed {result.rowcount} duplicate rows from {table}")
+    return step
+
+
+class Migration:
+    __slots__ = ["version", "description", "steps"]
+
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+MIGRATIONS = [
+    Migration(1, "composite keys for the profile, message and reaction lookups", [
+        # The bot updates every row of a user, so a duplicate holds the same counters or ones that started later,
+        # a sum would count them twice
+        merge_duplicates("profiles", ("guild_id", "user_id"),
+                         ("warnings", "kickCount", "text_xp", "text_lvl", "voice_xp", "voice_lvl",
+                          "banned_at", "banned_until", "muted_at", "muted_until")),
+        drop_duplicates("profiles", ("guild_id", "user_id")),
+        add_index("profiles", "profiles_guild_user", ("guild_id", "user_id"), unique=True),
+        drop_duplicates("messages", ("guild_id", "message_id")),
+        add_index("messages", "messages_guild_message", ("guild_id", "message_id"), unique=True),
+        drop_duplicates("reactions", ("guild_id", "message_id", "emoji")),
+        add_index("reactions", "reactions_guild_message_emoji", ("guild_id", "message_id", "emoji"), unique=True),
+    ]),
+    Migration(2, "raid detection threshold per guild", [
+        add_column("settings", "raidAuthorCount", "int NOT NULL DEFAULT 10"),
+    ]),
+    Migration(3, "exact duplicate scoring per guild", [
+        add_column("settings", "exactDuplicates", "tinyint(1) NOT NULL DEFAULT '0'"),
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS `schema_migrations` ("
+                 "`version` int NOT NULL PRIMARY KEY, "
+                 "`description` varchar(255) NOT NULL, "
+                 "`applied_at` datetime NOT NULL)")
+
+
+def status(engine):
+    """
+    :param engine: the sqlalchemy engine of the database
+    :returns: list of (version, description, applied_at) tuples, applied_at is None for pending migrations
+    """
+    with engine.connect() as conn:
+        _ensure_version_table(conn)
+        applied = dict(conn.execute("SELECT version, applied_at FROM schema_migrations").fetchall())
+    return [(m.version, m.description, applied.get(m.version)) for m in MIGRATIONS]
+
+
+def upgrade(engine, migrations=MIGRATIONS):
+    """
+    Applies the pending migrations in order of their version.
+    A named lock keeps two processes from migrating at the same time.
+    :param engine: the sqlalchemy engine of the database
+    :param migrations: the migrations to apply if they are pending
+    :returns: the versions that got applied
+    """
+    done = []
+    with engine.connect() as conn:
+        if not conn.execute("SELECT GET_LOCK(%s, 60)", (LOCK_NAME,)).scalar():
+            raise RuntimeError("Another process is migrating the database")
+        try:
+            _ensure_version_table(conn)
+            applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if migration.version in applied:
+                    continue
+                print(f"Applying migration {migration.version}: {migration.description}")
+                # DDL commits implicitly in MySQL, so every step has to be safe to run again
+                for step in migration.steps:
+                    step(conn)
+                conn.execute("INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                             (migration.version, migration.description, datetime.datetime.utcnow()))
+                done.append(migration.version)
+        finally:
+            conn.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    return done
+
+
+# Values the getters of Db get called with while they are explained, by parameter name
+SAMPLE_ARGS = {
+    "guild_id": 0,
+    "user_id": 0,
+    "message_id": 0,
+    "emoji": "x",
+    "command": None,
+    "guild_ids": [0],
+    "user_ids": [0],
+    "last_id": 0,
+}
+
+
+def explain(engine, db):
+    """
+    Runs every getter of Db with sample arguments and EXPLAINs the statements they send
+    :param engine: the sqlalchemy engine the Db uses
+    :param db: the Db
+    :returns: list of (getter, table, access type, key) tuples of every table a statement reads
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    plans = []
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        for name, method in inspect.getmembers(type(db), inspect.isfunction):
+            func = getattr(method, "__wrapped__", None)
+            if func is None:
+                continue
+            params = list(inspect.signature(func).parameters)[1:]
+            if any(param not in SAMPLE_ARGS for param in params):
+                print(f"  {name}: no sample arguments for {', '.join(params)}")
+                continue
+            statements.clear()
+            try:
+                db._call(func, *(SAMPLE_ARGS[param] for param in params))
+            except Exception:
+                # Many getters fail without a matching row, the statements were sent anyway
+                pass
+            captured = list(statements)
+            with engine.connect() as conn:
+                for statement, parameters in captured:
+                    result = conn.execute("EXPLAIN " + statement, parameters)
+                    columns = list(result.keys())
+                    for row in result.fetchall():
+                        row = dict(zip(columns, row))
+                        if row.get("table") is not None:
+                            plans.append((name, row["table"], row.get("type"), row.get("key")))
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return plans
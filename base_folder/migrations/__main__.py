@@ -0,0 +1,34 @@
+"""
+python -m base_folder.migrations [status|upgrade|explain]
+"""
+import argparse
+import sys
+
+from base_folder.config import engine
+from base_folder.migrations import status, upgrade, explain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database migrations")
+    parser.add_argument("command", choices=("status", "upgrade", "explain"), nargs="?", default="status")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Applied {len(applied)} migration(s)")
+    elif args.command == "status":
+        for version, description, applied_at in status(engine):
+            print(f"{version:>4} {'applied ' + str(applied_at) if applied_at else 'pending':<28} {description}")
+    else:
+        from base_folder.bot.modules.base.db_management import Db
+        scans = 0
+        for getter, table, access, key in explain(engine, Db()):
+            # ALL is a full table scan, everything else uses an index or a constant lookup
+            flag = "FULL SCAN" if access == "ALL" else ""
+            scans += access == "ALL"
+            print(f"{getter:<28} {table:<22} {str(access):<8} {str(key):<32} {flag}")
+        sys.exit(1 if scans else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Timing of the sql statements of the bot and the celery workers.
+Statements are grouped by their shape, that is the statement with all literals replaced,
+so the f-string queries of the workers end up in the same group as their parametrized twins.
+"""
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from base_folder.config import SLOW_QUERY_THRESHOLD, QUERY_STATS_MAX_SHAPES
+
+logger = logging.getLogger('discord.sql')
+
+# Upper bounds of the histogram buckets in milliseconds, the last one catches everything
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+_FILE = os.path.abspath(__file__)
+_HERE = os.path.dirname(_FILE)
+
+
+@functools.lru_cache(maxsize=4096)
+def shape(statement):
+    """
+    :param statement: the sql statement
+    :returns: the statement without literals, whitespace and with IN lists collapsed
+    """
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def caller():
+    """
+    :returns: file:line function of the first frame of base_folder, e.g. the Db getter or the celery task
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_HERE) and filename != _FILE:
+            return f"{os.path.relpath(filename, _HERE)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class ShapeStats:
+    __slots__ = ["count", "total", "max", "buckets"]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def percentile(self, p):
+        """
+        :param p: the percentile between 0 and 1
+        :returns: the upper bound of the bucket the percentile falls into, in milliseconds
+        """
+        rank = p * self.count
+        seen = 0
+        for bound, amount in zip(BUCKETS, self.buckets):
+            seen += amount
+            if seen >= rank:
+                return min(bound, self.max * 1000)
+        return self.max * 1000
+
+
+class QueryStats:
+    """
+    Per shape count, total time and latency histogram of the executed statements.
+    Recording is a dict lookup and a few additions under a lock, so it can stay on in production.
+    """
+
+    def __init__(self, slow_threshold=SLOW_QUERY_THRESHOLD, max_shapes=QUERY_STATS_MAX_SHAPES):
+        """
+        :param slow_threshold: seconds after which a statement gets logged with its caller, None disables the log
+        :param max_shapes: statements with new shapes beyond this are counted as "other"
+        """
+        self.slow_threshold = slow_threshold
+        self.max_shapes = max_shapes
+        self.slow = 0
+        self._shapes = {}  # shape -> ShapeStats
+        self._lock = threading.Lock()
+
+    def record(self, statement, elapsed):
+        """
+        :param statement: the executed sql statement
+        :param elapsed: the time it took in seconds
+        """
+        key = shape(statement)
+        with self._lock:
+            stats = self._shapes.get(key)
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    key = "other"
+                stats = self._shapes.setdefault(key, ShapeStats())
+            stats.count += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+            ms = elapsed * 1000
+            for i, bound in enumerate(BUCKETS):
+                if ms <= bound:
+                    stats.buckets[i] += 1
+                    break
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            with self._lock:
+                self.slow += 1
+            logger.warning(f"Slow query ({elapsed * 1000:.1f}ms) from {caller()}: {key}")
+
+    def top(self, n=10):
+        """
+        :param n: amount of shapes
+        :returns: list of dicts for the n shapes with the most total time
+        """
+        with self._lock:
+            items = sorted(self._shapes.items(), key=lambda item: item[1].total, reverse=True)[:n]
+            return [{
+                "shape": key,
+                "count": stats.count,
+                "total": round(stats.total * 1000, 1),
+                "avg": round(stats.total / stats.count * 1000, 2),
+                "p50": round(stats.percentile(0.5), 2),
+                "p99": round(stats.percentile(0.99), 2),
+                "max": round(stats.max * 1000, 2),
+            } for key, stats in items]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self.slow = 0
+
+
+query_stats = QueryStats()
+
+
+def instrument_engine(engine, stats=query_stats):
+    """
+    Times every statement of a sqlalchemy engine
+    :param engine: the engine
+    :param stats: the QueryStats that record the statements
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        stats.record(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class TimedCursor:
+    """
+    Wraps a dbapi cursor and times execute and executemany
+    """
+    __slots__ = ["_cursor", "_stats"]
+
+    def __init__(self, cursor, stats=query_stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            self._stats.record(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            self._stats.record(operation, time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, item):
+        return getattr(self._cursor, item)
+
+
+class TimedConnection:
+    """
+    Wraps a dbapi connection, so its cursors are TimedCursors
+    """
+    __slots__ = ["_connection", "_stats"]
+
+    def __init__(self, connection, stats=query_stats):
+        self._connection = connection
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._connection.cursor(*args, **kwargs), self._stats)
+
+    def __getattr__(self, item):
+        return getattr(self._connection, item)
@@ -0,0 +1,228 @@
+"""
+Replays message streams through GuildStates and User.propagate and reports throughput, latency and memory.
+Everything runs on the test doubles, so neither Discord nor MySQL are needed.
+Run it with: python -m base_folder.tests.benchmark.antispam_benchmark [--replay stream.jsonl] [--record stream.jsonl]
+
+A recorded stream is a json lines file, every line looks like
+{"offset": 120, "author": 3, "channel": 2, "content": "hello"}
+where offset is the time in milliseconds since the start of the stream.
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from base_folder.bot.utils.exceptions import DuplicateObject
+from base_folder.bot.utils.helper import GuildStates, UserRegistry
+from base_folder.bot.utils.logger import Log
+from base_folder.bot.utils.write_behind import PunishmentBuffer
+from base_folder.tests.test_doubles.channel import TextChannel
+from base_folder.tests.test_doubles.guild import Guild
+from base_folder.tests.test_doubles.member import Member
+from base_folder.tests.test_doubles.message import Message, snowflake
+
+GUILD_ID = 616609333832187924
+CHANNELS = (10, 11, 12)
+START = 1600000000000  # all streams start at this unix time in milliseconds
+
+# A settings row with the defaults of the settings table
+SETTINGS = SimpleNamespace(
+    leave_channel_id=0, welcome_channel_id=0, stdout_channel_id=CHANNELS[0], lvl_channel_id=0, cmd_channel_id=0,
+    warn_channel_id=CHANNELS[0], kick_channel_id=CHANNELS[0], ban_channel_id=CHANNELS[0], mod_role_id=0,
+    admin_role_id=0, dev_role_id=0, standard_role_id=0, levelsystem_toggle=False, imgwelcome_toggle=False,
+    prefix="!", warnThreshold=3, kickThreshold=2, banThreshold=2, messageInterval=2500,
+    warnMessage="Hey $MENTIONUSER, please stop spamming/sending duplicate messages.",
+    kickMessage="$USERNAME was kicked for spamming/sending duplicate messages.",
+    banMessage="$USERNAME was banned for spamming/sending duplicate messages.",
+    messageDuplicateCount=5, messageDuplicateAccuracy=90, raidAuthorCount=10, exactDuplicates=False,
+)
+
+
+def _sentence(rng, words=None):
+    words = words or rng.randint(3, 25)
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+                    for _ in range(words))
+
+
+def normal_chat(size, seed=28, authors=200):
+    """
+    Many authors writing distinct messages, a message every 50ms on average
+    :return: list of (offset, author id, channel id, content) tuples
+    """
+    rng = random.Random(seed)
+    offset = 0
+    stream = []
+    for _ in range(size):
+        offset += rng.randint(0, 100)
+        stream.append((offset, 1000 + rng.randrange(authors), rng.choice(CHANNELS), _sentence(rng)))
+    return stream
+
+
+def flood(size, seed=28, authors=5):
+    """
+    A few authors copy pasting the same payload with small changes, every 100ms
+    """
+    rng = random.Random(seed)
+    payloads = [_sentence(rng, 20) for _ in range(authors)]
+    offset = 0
+    stream = []
+    for _ in range(size):
+        offset += rng.randint(50, 150)
+        author = rng.randrange(authors)
+        content = payloads[author]
+        if rng.random() < 0.3:
+            content += " " + rng.choice(string.ascii_lowercase)
+        stream.append((offset, 2000 + author, rng.choice(CHANNELS), content))
+    return stream
+
+
+def raid(size, seed=28):
+    """
+    Fresh accounts posting the same payload once each, mixed with normal chat
+    """
+    rng = random.Random(seed)
+    payload = _sentence(rng, 15)
+    offset = 0
+    stream = []
+    for i in range(size):
+        offset += rng.randint(0, 20)
+        if rng.random() < 0.8:
+            stream.append((offset, 100000 + i, CHANNELS[0], payload))
+        else:
+            stream.append((offset, 1000 + rng.randrange(200), rng.choice(CHANNELS), _sentence(rng)))
+    return stream
+
+
+SCENARIOS = {
+    "normal chat": normal_chat,
+    "flood": flood,
+    "raid": raid,
+}
+
+
+def record(stream, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for offset, author, channel, content in stream:
+            f.write(json.dumps({"offset": offset, "author": author, "channel": channel, "content": content}) + "\n")
+
+
+def replay(path):
+    with open(path, encoding="utf-8") as f:
+        # Blank lines, e.g. a trailing one from an editor, aren't json
+        return [(line["offset"], line["author"], line["channel"], line["content"])
+                for line in (json.loads(raw) for raw in f if raw.strip())]
+
+
+async def make_state():
+    """
+    Builds a GuildStates like on_ready and its hydration would do it, but from the defaults instead of the database
+    :return: the GuildStates
+    """
+    guild = Guild(GUILD_ID)
+    guild.channels = [TextChannel(channel_id, guild) for channel_id in CHANNELS]
+    # There is no worker to flush to, so the buffer just collects everything
+    state = GuildStates(guild, None, Log(), UserRegistry(), PunishmentBuffer(max_pending=float("inf")))
+    state.set_punishments({})
+    await state.load_settings(SETTINGS)
+    return state
+
+
+def build_messages(stream, guild):
+    members = {}
+    channels = {channel.id: channel for channel in guild.channels}
+    messages = []
+    for increment, (offset, author, channel, content) in enumerate(stream):
+        member = members.get(author)
+        if member is None:
+            member = members[author] = Member(guild, f"member{author}", memberid=author)
+        messages.append(Message(snowflake(START + offset, increment), content, member, channels[channel]))
+    return messages
+
+
+async def process(state, message):
+    # Same steps as MainBot.process_spam
+    if state.policy.ignores(message):
+        return
+    try:
+        user = state.users[message.author.id]
+    except KeyError:
+        channel = state.guild.get_channel(state.get_channel())
+        await state.set_user(message.author.id, channel, channel, channel, channel)
+        user = state.users[message.author.id]
+    try:
+        user.propagate(message)
+    except DuplicateObject:
+        pass
+
+
+async def _replay(stream, measure_memory):
+    state = await make_state()
+    messages = build_messages(stream, state.guild)
+    latencies = []
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        begin = time.perf_counter()
+        await process(state, message)
+        latencies.append(time.perf_counter() - begin)
+        if i % 100 == 0:
+            # Lets the punishment and log messages that got scheduled run, like the bot's loop would
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if measure_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    await asyncio.sleep(0)
+    punishments = {
+        "warns": sum(user.warn_count for user in state.users.values()),
+        "kicks": len(set(state.guild.kicked)),
+        "bans": len(set(state.guild.banned)),
+    }
+    return elapsed, latencies, peak, punishments
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[int(round(p * (len(ordered) - 1)))]
+
+
+def run_stream(name, stream, measure_memory=True):
+    loop = asyncio.new_event_loop()
+    try:
+        elapsed, latencies, _, punishments = loop.run_until_complete(_replay(stream, False))
+        # tracemalloc slows everything down, so memory gets its own pass
+        peak = loop.run_until_complete(_replay(stream, True))[2] if measure_memory else None
+    finally:
+        loop.close()
+    memory = f"{peak / 1024 / 1024:7.2f}MiB" if peak is not None else "      -"
+    print(f"{name:>12}: {len(stream):>6} messages {len(stream) / elapsed:10.0f} msgs/s  "
+          f"p50 {percentile(latencies, 0.5) * 1e6:8.1f}us  p99 {percentile(latencies, 0.99) * 1e6:8.1f}us  "
+          f"peak {memory}  {punishments['warns']} warns, {punishments['kicks']} kicks, {punishments['bans']} bans")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anti spam benchmark")
+    parser.add_argument("--size", type=int, default=10000, help="messages per synthetic scenario")
+    parser.add_argument("--replay", help="replays a recorded stream instead of the synthetic scenarios")
+    parser.add_argument("--record", help="writes the synthetic scenarios to this path (the name gets a suffix)")
+    parser.add_argument("--no-memory", action="store_true", help="skips the memory pass")
+    args = parser.parse_args()
+
+    if args.replay:
+        run_stream("replay", replay(args.replay), not args.no_memory)
+        return
+    for name, scenario in SCENARIOS.items():
+        stream = scenario(args.size)
+        if args.record:
+            record(stream, f"{args.record}.{name.replace(' ', '_')}")
+        run_stream(name, stream, not args.no_memory)
+
+
+if __name__ == '__main__':
+    main()
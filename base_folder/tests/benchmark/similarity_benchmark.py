@@ -0,0 +1,77 @@
+"""
+Compares the old linear fuzz.token_sort_ratio scan of User.propagate against the SimilarityIndex
+and the batched exact scoring with cutoffs.
+Run it with: python -m base_folder.tests.benchmark.similarity_benchmark
+"""
+import random
+import string
+import time
+
+from fuzzywuzzy import fuzz
+
+from base_folder.bot.utils.spam_index import SimilarityIndex, score_window, token_sort_key
+
+ACCURACY = 90
+DUPLICATE_COUNT = 5
+
+
+def _sentence(rng, words=None):
+    words = words or rng.randint(3, 60)
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+                    for _ in range(words))
+
+
+def make_window(size, seed=28):
+    """
+    Builds a window of mostly distinct long messages with a few copy pasted ones in between
+    :param size: amount of messages in the window
+    :param seed: seed for the random generator so runs are comparable
+    :return: list with message contents and the new message that gets checked against them
+    """
+    rng = random.Random(seed)
+    payload = _sentence(rng, 40)
+    window = [payload if i % 10 == 0 else _sentence(rng) for i in range(size)]
+    return window, payload
+
+
+def linear_scan(window, content):
+    return sum(1 for other in window if fuzz.token_sort_ratio(content, other) >= ACCURACY)
+
+
+def indexed_scan(index, content):
+    key = token_sort_key(content)
+    return sum(1 for _, other in index.candidates(key) if fuzz.ratio(key, other) >= ACCURACY)
+
+
+def exact_batch(index, content):
+    key = token_sort_key(content)
+    return score_window(key, index.candidates(key), ACCURACY, DUPLICATE_COUNT)
+
+
+def _time(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return (time.perf_counter() - start) / rounds, result
+
+
+def run(sizes=(10, 100, 1000), rounds=5):
+    for size in sizes:
+        window, payload = make_window(size)
+        index = SimilarityIndex()
+        exact = SimilarityIndex(exact=True)
+        for message_id, content in enumerate(window):
+            index.add(message_id, token_sort_key(content))
+            exact.add(message_id, token_sort_key(content))
+
+        linear, expected = _time(lambda: linear_scan(window, payload), rounds)
+        indexed, found = _time(lambda: indexed_scan(index, payload), rounds)
+        batched, limited = _time(lambda: exact_batch(exact, payload), rounds)
+
+        print(f"window {size:>5}: linear {linear * 1000:9.2f}ms  indexed {indexed * 1000:9.2f}ms "
+              f"({linear / indexed:6.1f}x, {found}/{expected} duplicates)  "
+              f"exact batch {batched * 1000:9.2f}ms ({linear / batched:6.1f}x, stopped at {limited})")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,11 @@
+class TextChannel:
+    """
+    TextChannel class test double for the text channel object
+    """
+    def __init__(self, channelid, guild):
+        self.id = channelid
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
@@ -1,6 +1,30 @@
+import discord
+
+
 class Guild:
     """
     Guild class test double for the guild object
     """
-    def __init__(self, guildid):
+    def __init__(self, guildid, name="Test guild", owner_id=0):
+        from base_folder.tests.test_doubles.member import Member
+
         self.id = guildid
+        self.name = name
+        self.owner_id = owner_id
+        self.icon_url = ""
+        self.channels = []
+        self.me = Member(self, "Bot", memberid=1, permissions=discord.Permissions.all().value, position=1)
+        self.kicked = []
+        self.banned = []
+
+    def get_channel(self, channelid):
+        for channel in self.channels:
+            if channel.id == channelid:
+                return channel
+        return None
+
+    async def kick(self, member, reason=None):
+        self.kicked.append(member.id)
+
+    async def ban(self, member, reason=None):
+        self.banned.append(member.id)
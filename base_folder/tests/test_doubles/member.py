@@ -1,10 +1,34 @@
+import discord
+
+
+class Role:
+    """
+    Role class test double for the role object
+    """
+    def __init__(self, roleid, position=0):
+        self.id = roleid
+        self.position = position
+
+
 class Member:
     """
     Member class test double for the member object
     """
-    def __init__(self, guild, member):
+    def __init__(self, guild, member, memberid=0, bot=False, roles=(), permissions=0, position=0):
         self.guild = guild
         self.member = member
+        self.id = memberid
+        self.bot = bot
+        self.display_name = member
+        self.mention = f"<@{memberid}>"
+        self.avatar_url = ""
+        self.roles = [Role(roleid) for roleid in roles]
+        self.top_role = Role(0, position)
+        self.guild_permissions = discord.Permissions(permissions)
+        self.sent = 0
 
     def __repr__(self):
         return self.member
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
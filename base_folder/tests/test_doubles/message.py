@@ -0,0 +1,32 @@
+import discord
+
+from base_folder.bot.utils.util_functions import DISCORD_EPOCH
+
+
+def snowflake(timestamp_ms, increment=0):
+    """
+    :param timestamp_ms: unix time in milliseconds
+    :param increment: keeps ids of the same millisecond unique
+    :return: a snowflake id that was created at the given time
+    """
+    return ((timestamp_ms - DISCORD_EPOCH) << 22) | (increment & 0xFFF)
+
+
+class Message(discord.Message):
+    """
+    Message class test double for the message object,
+    it subclasses discord.Message so it passes the isinstance checks of the anti spam system
+    """
+    def __init__(self, messageid, content, author, channel):
+        self.id = messageid
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+
+    def __repr__(self):
+        return f"<Message id={self.id} author={self.author.id} channel={self.channel.id}>"
+
+    @property
+    def clean_content(self):
+        return self.content
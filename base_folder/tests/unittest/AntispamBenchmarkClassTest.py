@@ -0,0 +1,29 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from base_folder.tests.benchmark.antispam_benchmark import SCENARIOS, record, replay, run_stream
+
+
+class AntispamBenchmarkTest(unittest.TestCase):
+    """Anti spam benchmark"""
+    def test_scenarios_run(self):
+        # Keeps the benchmark in step with GuildStates, it only gets run by hand otherwise
+        for name, scenario in SCENARIOS.items():
+            out = io.StringIO()
+            with redirect_stdout(out):
+                run_stream(name, scenario(200), measure_memory=False)
+            self.assertIn(f"{name}:", out.getvalue())
+
+    def test_replay_skips_blank_lines(self):
+        stream = SCENARIOS["raid"](20)
+        path = os.path.join(tempfile.mkdtemp(), "stream.jsonl")
+        record(stream, path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n  \n")
+        self.assertEqual(replay(path), stream)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+from base_folder.bot.utils.blacklist import Blacklist, BloomFilter
+
+
+class FakeDb:
+    def __init__(self, user_ids):
+        self.rows = [(i + 1, user_id) for i, user_id in enumerate(user_ids)]
+        self.queries = 0
+
+    async def get_blacklist_since(self, last_id):
+        self.queries += 1
+        return [row for row in self.rows if row[0] > last_id]
+
+    async def get_blacklist_count(self):
+        return len(self.rows)
+
+    async def get_bannlist(self, user_id):
+        self.queries += 1
+        return any(row[1] == user_id for row in self.rows)
+
+
+class BlacklistTest(unittest.TestCase):
+    """Blacklist class"""
+    def test_set_lookup_without_queries(self):
+        db = FakeDb([1, 2, 3])
+        blacklist = Blacklist(db)
+        asyncio.run(blacklist.load())
+        queries = db.queries
+        self.assertTrue(asyncio.run(blacklist.is_blacklisted(2)))
+        self.assertFalse(asyncio.run(blacklist.is_blacklisted(4)))
+        self.assertEqual(db.queries, queries)
+
+    def test_not_loaded_asks_database(self):
+        db = FakeDb([1])
+        self.assertTrue(asyncio.run(Blacklist(db).is_blacklisted(1)))
+        self.assertEqual(db.queries, 1)
+
+    def test_incremental_refresh(self):
+        db = FakeDb([1, 2])
+        blacklist = Blacklist(db)
+        asyncio.run(blacklist.load())
+        db.rows.append((3, 5))
+        asyncio.run(blacklist.refresh())
+        self.assertTrue(asyncio.run(blacklist.is_blacklisted(5)))
+        self.assertEqual(len(blacklist), 3)
+
+    def test_refresh_notices_deletions(self):
+        db = FakeDb([1, 2])
+        blacklist = Blacklist(db)
+        asyncio.run(blacklist.load())
+        del db.rows[0]
+        asyncio.run(blacklist.refresh())
+        self.assertFalse(asyncio.run(blacklist.is_blacklisted(1)))
+        self.assertTrue(asyncio.run(blacklist.is_blacklisted(2)))
+
+    def test_bloom_mode(self):
+        db = FakeDb(range(1000, 1100))
+        blacklist = Blacklist(db, bloom_threshold=50)
+        asyncio.run(blacklist.load())
+        self.assertEqual(blacklist.stats()["mode"], "bloom")
+        self.assertTrue(asyncio.run(blacklist.is_blacklisted(1050)))
+        misses = sum(asyncio.run(blacklist.is_blacklisted(user_id)) for user_id in range(5000, 6000))
+        self.assertEqual(misses, 0)
+        # Only possible hits of the filter go to the database
+        self.assertLess(blacklist.confirmations, 20)
+
+
+class BloomFilterTest(unittest.TestCase):
+    """BloomFilter class"""
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for user_id in range(616609333832187924, 616609333832188924):
+            bloom.add(user_id)
+        self.assertTrue(all(user_id in bloom for user_id in range(616609333832187924, 616609333832188924)))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for user_id in range(1000):
+            bloom.add(user_id)
+        false_positives = sum(user_id in bloom for user_id in range(10000, 20000))
+        self.assertLess(false_positives, 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from base_folder.celery import db
+from base_folder.celery.worker import app, worker_argv
+from base_folder.config import QUEUE_TASKS, WORKER_CONCURRENCY, MODERATION_QUEUE, SETTINGS_QUEUE
+
+
+class CeleryRoutingTest(unittest.TestCase):
+    """Celery routing"""
+    def queue_of(self, task):
+        return app.amqp.router.route({}, task.name)["queue"].name
+
+    def test_every_task_has_a_queue(self):
+        tasks = {name for name in app.tasks if name.startswith(db.__name__ + ".")}
+        routed = {f"{db.__name__}.{name}" for names in QUEUE_TASKS.values() for name in names}
+        self.assertEqual(tasks, routed)
+
+    def test_queues(self):
+        self.assertEqual(self.queue_of(db.edit_warns), MODERATION_QUEUE)
+        self.assertEqual(self.queue_of(db.set_prefix), SETTINGS_QUEUE)
+        self.assertNotEqual(self.queue_of(db.insert_messages), MODERATION_QUEUE)
+
+    def test_every_queue_has_workers(self):
+        for queue in QUEUE_TASKS:
+            self.assertIn(f"--queues={queue}", worker_argv(queue))
+        self.assertEqual(set(WORKER_CONCURRENCY), set(QUEUE_TASKS))
+
+
+if __name__ == '__main__':
+    unittest.main()
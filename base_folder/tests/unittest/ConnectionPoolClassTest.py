@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+import mysql.connector
+from base_folder.celery.pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+
+    def execute(self, operation, params=None):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.rollbacks = 0
+        self.cursors = []
+
+    def cursor(self):
+        cursor = FakeCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if not self.alive:
+            raise mysql.connector.errors.OperationalError("gone")
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError("gone")
+
+    def close(self):
+        pass
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """ConnectionPool class"""
+    def pool(self, size=2, timeout=0.01):
+        self.created = []
+
+        def connect():
+            self.created.append(FakeConnection())
+            return self.created[-1]
+        return ConnectionPool(connect, size=size, timeout=timeout, health_check_interval=None)
+
+    def test_reuse(self):
+        pool = self.pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(self.created), 1)
+
+    def test_exhausted(self):
+        pool = self.pool(size=1)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+    def test_release_cleans_up(self):
+        pool = self.pool()
+        connection = pool.acquire()
+        connection.cursor().execute("UPDATE profiles SET warnings=1")
+        pool.release(connection)
+        self.assertTrue(self.created[0].cursors[0].closed)
+        self.assertEqual(self.created[0].rollbacks, 1)
+
+    def test_broken_connection_is_dropped(self):
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        self.created[0].alive = False
+        pool.release(connection)
+        self.assertEqual(pool.stats()["open"], 0)
+        self.assertIsNot(pool.acquire().raw, self.created[0])
+
+    def test_waiter_opens_dropped_connection(self):
+        pool = self.pool(size=1, timeout=5)
+        connection = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        self.created[0].alive = False
+        start = time.monotonic()
+        pool.release(connection)
+        waiter.join(5)
+        # The waiter opens a new connection right away instead of waiting for the timeout
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIs(acquired[0].raw, self.created[1])
+
+    def test_health_check(self):
+        pool = self.pool()
+        pool.release(pool.acquire())
+        self.created[0].alive = False
+        pool.check_idle()
+        self.assertEqual(pool.stats()["idle"], 0)
+        self.assertEqual(pool.discarded, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
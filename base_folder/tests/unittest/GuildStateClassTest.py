@@ -1,10 +1,45 @@
+import asyncio
+import os
+import tempfile
 import unittest
-from base_folder.bot.utils.helper import DbCache, GuildStates, Ctx
+from types import SimpleNamespace
+from base_folder.bot.utils.helper import DbCache, GuildStates, Ctx, UserCache, UserRegistry
 from base_folder.bot.utils.logger import Log
+from base_folder.bot.utils.snapshot import SpamSnapshot
+from base_folder.bot.utils.spam_policy import SpamPolicy
 
+from base_folder.tests.benchmark.antispam_benchmark import build_messages, make_state, process
 from base_folder.tests.test_doubles.guild import Guild
 from base_folder.tests.test_doubles.member import Member
 
+OPTIONS = {
+    "warn_threshold": 3,
+    "kick_threshold": 2,
+    "ban_threshold": 1,
+    "message_interval": 30000,
+    "guild_warn_message": "warn",
+    "guild_kick_message": "kick",
+    "guild_ban_message": "ban",
+    "user_kick_message": "kick",
+    "user_ban_message": "ban",
+    "message_duplicate_count": 5,
+    "message_duplicate_accuracy": 90,
+    "ignore_perms": [8],
+    "ignore_channels": [(10,)],
+    "ignore_Users": [(20,)],
+    "ignore_roles": [(30,)],
+    "ignore_guilds": [],
+    "ignore_bots": True,
+    "raid_author_count": 10,
+    "exact_duplicates": False,
+}
+
+
+def message(author_id=1, channel_id=2, role_ids=(), permissions=0, bot=False):
+    author = SimpleNamespace(id=author_id, bot=bot, roles=[SimpleNamespace(id=i) for i in role_ids],
+                             guild_permissions=SimpleNamespace(value=permissions))
+    return SimpleNamespace(author=author, channel=SimpleNamespace(id=channel_id))
+
 
 class GuildStateTest(unittest.TestCase):
     """Class ctx"""
@@ -47,6 +82,32 @@ class GuildStateTest(unittest.TestCase):
         cache.destruct_state(Guild(616609333832187924))
         self.assertEqual(cache.__str__(), "Dbcache with states 0 in it")
 
+    def test_dbcache_is_ready(self):
+        cache = DbCache()
+        cache.create_state(Guild(616609333832187924), logger=Log())
+        self.assertTrue(cache.is_ready(None))
+        self.assertFalse(cache.is_ready(Guild(616609333832187924)))
+        self.assertFalse(cache.is_ready(Guild(616609333832187923)))
+        cache.states[616609333832187924].ready = True
+        self.assertTrue(cache.is_ready(Guild(616609333832187924)))
+
+    def test_dbcache_prefetch_punishments_while_guilds_change(self):
+        cache = DbCache()
+        cache.create_state(Guild(616609333832187924), logger=Log())
+
+        class FakeDb:
+            async def get_punishment_counts(self, guild_ids):
+                # A guild joins while the query runs
+                cache.create_state(Guild(616609333832187923), logger=Log())
+                self.guild_ids = list(guild_ids)
+                return {(616609333832187924, 1): (2, 1)}
+
+        cache.db = FakeDb()
+        asyncio.run(cache.prefetch_punishments())
+        self.assertEqual(cache.db.guild_ids, [616609333832187924])
+        self.assertEqual(cache.states[616609333832187924]._punishments, {1: (2, 1)})
+        self.assertIsNone(cache.states[616609333832187923]._punishments)
+
     """GuildState class"""
     def test_GuildState_init(self):
         guild = Guild(616609333832187924)
@@ -70,6 +131,268 @@ class GuildStateTest(unittest.TestCase):
         guildstate._levelsystem_toggle = 1
         self.assertEqual(guildstate.get_levelsystem, 1)
 
+    def test_GuildState_load_settings(self):
+        guildstate = GuildStates(Guild(616609333832187924), logger=Log(), loop=None)
+        settings = SimpleNamespace(
+            leave_channel_id=1, welcome_channel_id=2, stdout_channel_id=3, lvl_channel_id=4, cmd_channel_id=5,
+            warn_channel_id=6, kick_channel_id=7, ban_channel_id=8, mod_role_id=9, admin_role_id=10,
+            dev_role_id=11, standard_role_id=12, levelsystem_toggle=True, imgwelcome_toggle=False, prefix="!",
+            warnThreshold=3, kickThreshold=2, banThreshold=2, messageInterval=2500, warnMessage="warn",
+            kickMessage="kick", banMessage="ban", messageDuplicateCount=5, messageDuplicateAccuracy=90,
+            raidAuthorCount=4, exactDuplicates=1,
+        )
+        asyncio.run(guildstate.load_settings(settings))
+        self.assertEqual(guildstate.get_channel("warn"), 6)
+        self.assertEqual(guildstate.get_role("mod"), 9)
+        self.assertEqual(guildstate.get_prefix, "!")
+        self.assertEqual(guildstate.get_levelsystem, True)
+        self.assertEqual(guildstate.policy.interval, 2500)
+        self.assertEqual(guildstate.policy.user_kick_message, "kick")
+        self.assertEqual(guildstate.policy.raid_author_count, 4)
+        self.assertEqual(guildstate.raid_index.interval, 2500)
+        self.assertIs(guildstate.policy.exact_duplicates, True)
+
+    def test_GuildState_channel_unhydrated(self):
+        guildstate = GuildStates(Guild(616609333832187924), logger=Log(), loop=None)
+        settings = SimpleNamespace(
+            leave_channel_id=1, welcome_channel_id=2, stdout_channel_id=3, lvl_channel_id=4, cmd_channel_id=5,
+            warn_channel_id=6, kick_channel_id=7, ban_channel_id=8, mod_role_id=9, admin_role_id=10,
+            dev_role_id=11, standard_role_id=12, levelsystem_toggle=True, imgwelcome_toggle=False, prefix="!",
+            warnThreshold=3, kickThreshold=2, banThreshold=2, messageInterval=2500, warnMessage="warn",
+            kickMessage="kick", banMessage="ban", messageDuplicateCount=5, messageDuplicateAccuracy=90,
+            raidAuthorCount=4, exactDuplicates=1,
+        )
+
+        class FakeDb:
+            async def get_settings(self, guild_id):
+                return settings
+
+        guildstate.db = FakeDb()
+        # The sync getter must not answer with the default 0 before the settings got loaded
+        with self.assertRaises(RuntimeError):
+            guildstate.get_channel("welcome")
+        self.assertEqual(asyncio.run(guildstate.channel("welcome")), 2)
+        self.assertEqual(guildstate.get_channel("welcome"), 2)
+
+    def test_GuildState_single_flight(self):
+        guildstate = GuildStates(Guild(616609333832187924), logger=Log(), loop=None)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0)
+
+        async def load_concurrently():
+            await asyncio.gather(*(guildstate._single_flight("settings", loader) for _ in range(5)))
+            await guildstate._single_flight("settings", loader)
+
+        asyncio.run(load_concurrently())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(guildstate._loading, {})
+
+    def test_GuildState_reaction_roles(self):
+        guildstate = GuildStates(Guild(616609333832187924), logger=Log(), loop=None)
+        guildstate.set_reaction_roles({(1, "a"): 10, (1, "b"): 11, (2, "a"): 12})
+        guildstate.add_reaction_role(1, "a", 13)
+        self.assertEqual(asyncio.run(guildstate.get_reaction_role(1, "a")), 13)
+        guildstate.remove_reaction_role(1, "b")
+        self.assertFalse(asyncio.run(guildstate.get_reaction_role(1, "b")))
+        guildstate.remove_reaction_role(1)
+        self.assertFalse(asyncio.run(guildstate.get_reaction_role(1, "a")))
+        self.assertEqual(asyncio.run(guildstate.get_reaction_role(2, "a")), 12)
+
+    """UserCache class"""
+    def test_user_cache_per_guild_cap(self):
+        registry = UserRegistry()
+        cache = UserCache(616609333832187924, registry, max_size=2)
+        cache[1] = "user1"
+        cache[2] = "user2"
+        self.assertEqual(cache[1], "user1")
+        cache[3] = "user3"
+        self.assertNotIn(2, cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(registry.stats()["users"], 2)
+        self.assertEqual(registry.evictions, 1)
+
+    def test_user_cache_global_cap(self):
+        registry = UserRegistry(max_users=2)
+        first = UserCache(616609333832187924, registry)
+        second = UserCache(616609333832187923, registry)
+        first[1] = "user1"
+        second[1] = "user1"
+        first[1]
+        second[2] = "user2"
+        self.assertIn(1, first)
+        self.assertNotIn(1, second)
+        self.assertEqual(len(registry), 2)
+
+    def test_user_cache_idle_ttl(self):
+        registry = UserRegistry(idle_ttl=0)
+        cache = UserCache(616609333832187924, registry)
+        cache[1] = []
+        registry.sweep()
+        self.assertNotIn(1, cache)
+        self.assertEqual(registry.expirations, 1)
+        with self.assertRaises(KeyError):
+            cache[1]
+
+    def test_user_cache_sweep_skips_inactive(self):
+        class FakeUser:
+            def __init__(self, messages):
+                self.messages = messages
+                self.cleaned = 0
+
+            def clean_up(self, current_time):
+                self.cleaned += 1
+                self.messages = self.messages[1:]
+
+        registry = UserRegistry()
+        cache = UserCache(616609333832187924, registry)
+        idle, active = FakeUser(["a"]), FakeUser(["a", "b"])
+        cache[1] = idle
+        registry.sweep()
+        self.assertEqual(idle.cleaned, 1)
+        cache[2] = active
+        registry.sweep()
+        # The idle user got cleaned up by the first sweep, the active one still has a message left
+        self.assertEqual((idle.cleaned, active.cleaned), (1, 1))
+        registry.sweep()
+        self.assertEqual((idle.cleaned, active.cleaned), (1, 2))
+        registry.sweep()
+        self.assertEqual((idle.cleaned, active.cleaned), (1, 2))
+
+    def test_dbcache_make_states_again(self):
+        cache = DbCache()
+        guild = Guild(616609333832187924)
+        cache.make_states([guild], logger=Log())
+        cache.states[guild.id].users[1] = []
+        # A reconnect builds the states again
+        cache.make_states([guild], logger=Log())
+        self.assertEqual(len(cache.users), 0)
+        cache.states[guild.id].users[2] = []
+        self.assertEqual(len(cache.users), 1)
+
+    """SpamSnapshot class"""
+    def test_snapshot_round_trip(self):
+        guild = Guild(616609333832187924)
+        cache = DbCache()
+        cache.create_state(guild, logger=Log())
+        state = cache.states[guild.id]
+        state.options = dict(OPTIONS)
+        state.compile_policy()
+        state.restore_user(1, [1, 0, 2, [[779060220133539840, "spam spam", 5, True]]])
+        path = os.path.join(tempfile.mkdtemp(), "spam_state.json")
+        snapshot = SpamSnapshot(path)
+        snapshot.update(cache)
+        snapshot.write(snapshot.dumps())
+        restored = SpamSnapshot(path).read()
+        self.assertEqual(restored, {(guild.id, 1): [1, 0, 2, [[779060220133539840, "spam spam", 5, True]]]})
+
+    def test_snapshot_waits_for_restore(self):
+        guild = Guild(616609333832187924)
+        cache = DbCache()
+        cache.create_state(guild, logger=Log())
+        state = cache.states[guild.id]
+        state.options = dict(OPTIONS)
+        state.compile_policy()
+        state.ready = True
+        users_in_snapshot = []
+
+        class FakeSnapshot:
+            def read(self):
+                return {(guild.id, 1): [0, 0, 1, []], (guild.id, 2): [0, 0, 1, []]}
+
+            def update(self, _):
+                users_in_snapshot.append(len(state.users))
+
+            def dumps(self):
+                return ""
+
+            def write(self, data):
+                pass
+
+        cache.snapshot = FakeSnapshot()
+
+        async def restore_and_snapshot():
+            restore = asyncio.ensure_future(cache.restore_users())
+            await asyncio.sleep(0)
+            await asyncio.gather(restore, cache.snapshot_users())
+
+        asyncio.run(restore_and_snapshot())
+        self.assertEqual(users_in_snapshot, [2])
+
+    def test_restore_guild_without_settings(self):
+        cache = DbCache()
+        cache.create_state(Guild(616609333832187923), logger=Log())
+        cache.create_state(Guild(616609333832187924), logger=Log())
+        unset = cache.states[616609333832187923]
+        unset.ready = True
+        state = cache.states[616609333832187924]
+        state.options = dict(OPTIONS)
+        state.compile_policy()
+        state.ready = True
+
+        class FakeSnapshot:
+            def read(self):
+                return {(616609333832187923, 1): [0, 0, 1, []], (616609333832187924, 1): "broken",
+                        (616609333832187924, 2): [0, 0, 1, []]}
+
+        cache.snapshot = FakeSnapshot()
+        with self.assertLogs("discord.snapshot", "WARNING"):
+            asyncio.run(cache.restore_users())
+        # The guild without settings has no policy, its users are skipped instead of stopping the restore
+        self.assertEqual(len(unset.users), 0)
+        self.assertIn(2, state.users)
+
+    def test_snapshot_missing_file(self):
+        snapshot = SpamSnapshot(os.path.join(tempfile.mkdtemp(), "missing.json"))
+        self.assertEqual(snapshot.read(), {})
+
+    """SpamPolicy class"""
+    def test_policy_compile(self):
+        policy = SpamPolicy.compile(OPTIONS)
+        self.assertEqual(policy.interval, 30000)
+        self.assertEqual(policy.ignored_channels, frozenset({10}))
+        self.assertEqual(policy.ignored_users, frozenset({20}))
+        self.assertEqual(policy.ignored_roles, frozenset({30}))
+        with self.assertRaises(AttributeError):
+            policy.interval = 1
+
+    def test_policy_ignores(self):
+        policy = SpamPolicy.compile(OPTIONS)
+        self.assertFalse(policy.ignores(message()))
+        self.assertTrue(policy.ignores(message(bot=True)))
+        self.assertTrue(policy.ignores(message(channel_id=10)))
+        self.assertTrue(policy.ignores(message(author_id=20)))
+        self.assertTrue(policy.ignores(message(role_ids=(5, 30))))
+        self.assertTrue(policy.ignores(message(permissions=8)))
+
+    def test_policy_reaches_existing_users(self):
+        guild = Guild(616609333832187924)
+        state = GuildStates(guild, logger=Log(), loop=None)
+        state.options = dict(OPTIONS)
+        state.compile_policy()
+        state.restore_user(1, [0, 0, 1, []])
+        state.options["message_interval"] = 1000
+        state.compile_policy()
+        self.assertEqual(state.users[1].policy.interval, 1000)
+        state.options["exact_duplicates"] = True
+        state.compile_policy()
+        self.assertTrue(state.users[1]._index.exact)
+
+
+    def test_GuildState_punishes_every_raider(self):
+        async def raid():
+            state = await make_state()
+            authors = range(100000, 100000 + state.policy.raid_author_count)
+            stream = [(i * 10, author, 10, "join my server at discord gg something") for i, author in enumerate(authors)]
+            for message in build_messages(stream, state.guild):
+                await process(state, message)
+            return {author: state.users.peek(author).warn_count for author in authors}
+
+        warns = asyncio.run(raid())
+        self.assertEqual(warns, dict.fromkeys(warns, 1))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import random
+import unittest
+from base_folder.bot.utils.leaderboard import Leaderboards, Ranking
+
+
+def expected(xp):
+    order = sorted(xp.items(), key=lambda item: (-item[1], item[0]))
+    return [(rank, user_id, amount) for rank, (user_id, amount) in enumerate(order, start=1)]
+
+
+class RankingTest(unittest.TestCase):
+    """Ranking class"""
+    def test_pages_and_ranks(self):
+        rng = random.Random(28)
+        ranking = Ranking(seed=28)
+        xp = {}
+        for _ in range(3000):
+            user_id = rng.randrange(300)
+            if rng.random() < 0.1:
+                ranking.remove(user_id)
+                xp.pop(user_id, None)
+            else:
+                xp[user_id] = rng.randrange(500)
+                ranking.update(user_id, xp[user_id])
+        order = expected(xp)
+        self.assertEqual(ranking.page(0, len(order)), order)
+        self.assertEqual(ranking.page(2, 10), order[20:30])
+        self.assertEqual([ranking.rank(user_id) for _, user_id, _ in order], list(range(1, len(order) + 1)))
+        self.assertEqual(len(ranking), len(xp))
+
+    def test_build(self):
+        xp = {user_id: user_id % 17 for user_id in range(500)}
+        ranking = Ranking.build(xp.items(), seed=28)
+        ranking.update(3, 1000)
+        ranking.remove(4)
+        xp[3] = 1000
+        del xp[4]
+        self.assertEqual(ranking.top(len(xp)), expected(xp))
+        self.assertEqual(ranking.rank(3), 1)
+
+    def test_out_of_range(self):
+        ranking = Ranking()
+        self.assertEqual(ranking.page(0), [])
+        self.assertIsNone(ranking.rank(1))
+
+
+class FakeDb:
+    def __init__(self):
+        self.queries = []
+
+    async def get_text_xp_bulk(self, guild_ids):
+        self.queries.append(guild_ids)
+        rows = [(616609333832187924, 1, 50), (616609333832187924, 2, 70), (616609333832187923, 3, 20)]
+        return [row for row in rows if row[0] in guild_ids]
+
+
+class LeaderboardsTest(unittest.TestCase):
+    """Leaderboards class"""
+    def test_rebuild_keeps_newer_updates(self):
+        leaderboards = Leaderboards(FakeDb())
+        leaderboards.update(616609333832187924, 1, 100)
+        asyncio.run(leaderboards.rebuild([616609333832187924]))
+        self.assertTrue(leaderboards.loaded)
+        self.assertEqual(leaderboards[616609333832187924].top(), [(1, 1, 100), (2, 2, 70)])
+
+    def test_joined_guild_loads_on_first_use(self):
+        db = FakeDb()
+        leaderboards = Leaderboards(db)
+        asyncio.run(leaderboards.rebuild([616609333832187924]))
+        leaderboards.update(616609333832187923, 4, 10)
+
+        async def show_twice():
+            return await asyncio.gather(leaderboards.ranking(616609333832187923),
+                                        leaderboards.ranking(616609333832187923))
+
+        first, second = asyncio.run(show_twice())
+        self.assertIs(first, second)
+        self.assertEqual(first.top(), [(1, 3, 20), (2, 4, 10)])
+        # Both callers shared one query, and the loaded ranking needs none
+        asyncio.run(leaderboards.ranking(616609333832187923))
+        self.assertEqual(db.queries, [[616609333832187924], [616609333832187923]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import unittest
+from unittest.mock import patch
+from base_folder.celery import db
+from base_folder.celery.local import LocalExecutor, QueueFull
+from base_folder.celery.pool import ConnectionPool
+from base_folder.config import HOT_QUEUE, MODERATION_QUEUE
+
+
+class FakeTask:
+    def __init__(self, name, function):
+        self.name = f"base_folder.celery.db.{name}"
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+
+class FakeConnection:
+    def cursor(self):
+        return self
+
+    def execute(self, operation, params=None):
+        pass
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class LocalExecutorTest(unittest.TestCase):
+    """LocalExecutor class"""
+    def setUp(self):
+        self.executor = LocalExecutor({HOT_QUEUE: 1, MODERATION_QUEUE: 1}, max_pending=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_result(self):
+        result = self.executor.submit(FakeTask("add_text_xp", lambda a, b=0: a + b), (1,), {"b": 2})
+        self.assertEqual(result.get(timeout=1), 3)
+        self.assertTrue(result.successful())
+
+    def test_routing(self):
+        self.assertEqual(self.executor.queue_of(FakeTask("edit_warns", None)), MODERATION_QUEUE)
+        self.assertEqual(self.executor.queue_of(FakeTask("insert_messages", None)), HOT_QUEUE)
+        # Queues without threads fall back to the default queue
+        self.assertEqual(self.executor.queue_of(FakeTask("set_prefix", None)), HOT_QUEUE)
+
+    def test_queues_dont_block_each_other(self):
+        release = threading.Event()
+        self.executor.submit(FakeTask("insert_messages", lambda: release.wait(1)))
+        result = self.executor.submit(FakeTask("edit_warns", lambda: "done"))
+        self.assertEqual(result.get(timeout=0.5), "done")
+        release.set()
+
+    def test_bounded(self):
+        release = threading.Event()
+        task = FakeTask("insert_messages", lambda: release.wait(1))
+        self.executor.submit(task)
+        self.executor.submit(task)
+        with self.assertRaises(QueueFull):
+            self.executor.submit(task)
+        release.set()
+        self.executor.shutdown()
+        self.assertEqual(self.executor.stats()["pending"][HOT_QUEUE], 0)
+        self.assertEqual(self.executor.rejected, 1)
+
+    def test_failure(self):
+        def fail():
+            raise ValueError("broken")
+        result = self.executor.submit(FakeTask("edit_warns", fail))
+        with self.assertRaises(ValueError):
+            result.get(timeout=1)
+        self.executor.shutdown()
+        self.assertEqual(self.executor.failed, 1)
+
+    def test_delay_runs_locally(self):
+        with patch.object(db, "TASK_EXECUTOR", "local"), patch.object(db, "local_executor", lambda: self.executor), \
+                patch.object(db, "_pool", ConnectionPool(FakeConnection, size=1, health_check_interval=None)):
+            result = db.edit_warns.delay(1, 2, 3)
+            self.assertIsNone(result.get(timeout=1))
+        self.assertEqual(self.executor.submitted, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
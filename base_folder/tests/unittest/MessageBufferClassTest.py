@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+from unittest import mock
+from base_folder.bot.utils.write_behind import MessageBuffer
+
+
+class MessageBufferTest(unittest.TestCase):
+    """MessageBuffer class"""
+    def test_flush_in_batches(self):
+        buffer = MessageBuffer(batch_size=2, max_buffered=10)
+        with mock.patch("base_folder.bot.utils.write_behind.insert_messages") as task:
+            for message_id in range(5):
+                buffer.append(616609333832187924, 1, message_id, 2, "hello")
+            asyncio.run(buffer.flush())
+        self.assertEqual([len(call.args[0]) for call in task.delay.call_args_list], [2, 2, 1])
+        self.assertEqual(len(buffer), 0)
+
+    def test_bounded(self):
+        buffer = MessageBuffer(batch_size=100, max_buffered=3)
+        for message_id in range(5):
+            buffer.append(616609333832187924, 1, message_id, 2, "hello")
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.dropped, 2)
+
+    def test_failed_flush_keeps_messages(self):
+        buffer = MessageBuffer(batch_size=100, max_buffered=10)
+        buffer.append(616609333832187924, 1, 1, 2, "hello")
+        with mock.patch("base_folder.bot.utils.write_behind.insert_messages") as task:
+            task.delay.side_effect = ConnectionError("broker down")
+            asyncio.run(buffer.flush())
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.flushes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import inspect
+import unittest
+from base_folder.bot.modules.base.db_management import Db
+from base_folder.migrations import SAMPLE_ARGS, Migration, add_column, add_index, drop_duplicates, \
+    merge_duplicates, upgrade
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = len(rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeConnection:
+    """Answers the information_schema and schema_migrations queries like MySQL would"""
+    def __init__(self, columns, indexes=(), applied=()):
+        self.columns = columns
+        self.indexes = set(indexes)
+        self.applied = list(applied)
+        self.executed = []
+
+    def execute(self, statement, parameters=()):
+        self.executed.append(statement)
+        if "information_schema.columns" in statement:
+            return FakeResult([(c,) for c in self.columns.get(parameters[0], ())])
+        if "information_schema.statistics" in statement:
+            return FakeResult([(1,)] if tuple(parameters) in self.indexes else [])
+        if statement.startswith("SELECT GET_LOCK"):
+            return FakeResult([(1,)])
+        if statement.startswith("SELECT version"):
+            return FakeResult([(v,) for v in self.applied])
+        if statement.startswith("INSERT INTO schema_migrations"):
+            self.applied.append(parameters[0])
+        return FakeResult([])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connect(self):
+        return self.conn
+
+
+class MigrationsTest(unittest.TestCase):
+    """Migrations"""
+    def test_add_index(self):
+        conn = FakeConnection({"profiles": {"id", "guild_id", "user_id"}})
+        add_index("profiles", "profiles_guild_user", ("guild_id", "user_id"), unique=True)(conn)
+        self.assertIn("ALTER TABLE `profiles` ADD UNIQUE INDEX `profiles_guild_user` (`guild_id`, `user_id`)",
+                      conn.executed)
+
+    def test_add_index_exists_or_missing_columns(self):
+        conn = FakeConnection({"profiles": {"id", "guild_id", "user_id"}, "messages": {"id", "guild_id"}},
+                              indexes=[("profiles", "profiles_guild_user")])
+        add_index("profiles", "profiles_guild_user", ("guild_id", "user_id"))(conn)
+        add_index("messages", "messages_guild_message", ("guild_id", "message_id"))(conn)
+        self.assertFalse([s for s in conn.executed if s.startswith("ALTER")])
+
+    def test_add_column(self):
+        conn = FakeConnection({"settings": {"guild_id"}})
+        add_column("settings", "raidAuthorCount", "int NOT NULL DEFAULT 10")(conn)
+        self.assertIn("ALTER TABLE `settings` ADD COLUMN `raidAuthorCount` int NOT NULL DEFAULT 10", conn.executed)
+        conn = FakeConnection({"settings": {"guild_id", "raidAuthorCount"}})
+        add_column("settings", "raidAuthorCount", "int NOT NULL DEFAULT 10")(conn)
+        self.assertFalse([s for s in conn.executed if s.startswith("ALTER")])
+
+    def test_merge_before_drop_duplicates(self):
+        conn = FakeConnection({"profiles": {"id", "guild_id", "user_id", "warnings", "text_xp"}})
+        merge_duplicates("profiles", ("guild_id", "user_id"), ("warnings", "text_xp", "voice_xp"))(conn)
+        drop_duplicates("profiles", ("guild_id", "user_id"))(conn)
+        merge, drop = conn.executed[1], conn.executed[3]
+        self.assertTrue(merge.startswith("UPDATE `profiles` kept JOIN (SELECT MIN(id) AS id"))
+        self.assertIn("MAX(`warnings`) AS `warnings`, MAX(`text_xp`) AS `text_xp`", merge)
+        self.assertIn("SET kept.`warnings` = dup.`warnings`, kept.`text_xp` = dup.`text_xp`", merge)
+        # The table lacks voice_xp
+        self.assertNotIn("voice_xp", merge)
+        # The merged row is the one that is kept
+        self.assertIn("newer.id > older.id", drop)
+
+    def test_upgrade_runs_pending_once(self):
+        steps = []
+        migrations = [Migration(2, "second", [lambda conn: steps.append(2)]),
+                      Migration(1, "first", [lambda conn: steps.append(1)])]
+        engine = FakeEngine(FakeConnection({}))
+        self.assertEqual(upgrade(engine, migrations), [1, 2])
+        self.assertEqual(upgrade(engine, migrations), [])
+        self.assertEqual(steps, [1, 2])
+
+    def test_sample_args_cover_getters(self):
+        # explain skips a getter it has no sample arguments for
+        for name, method in inspect.getmembers(Db, inspect.isfunction):
+            func = getattr(method, "__wrapped__", None)
+            if func is None:
+                continue
+            for param in list(inspect.signature(func).parameters)[1:]:
+                self.assertIn(param, SAMPLE_ARGS, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+from base_folder.bot.utils.profile_cache import ProfileCache
+
+
+class FakeDb:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    async def get_profile(self, guild_id, user_id):
+        self.queries += 1
+        return self.rows.get((guild_id, user_id))
+
+
+class ProfileCacheTest(unittest.TestCase):
+    """ProfileCache class"""
+    def test_read_through(self):
+        db = FakeDb({(616609333832187924, 1): (120, 3, 1)})
+        cache = ProfileCache(db)
+        profile = asyncio.run(cache.get(616609333832187924, 1))
+        self.assertEqual((profile.text_xp, profile.text_lvl, profile.warnings), (120, 3, 1))
+        asyncio.run(cache.get(616609333832187924, 1))
+        self.assertEqual(db.queries, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_missing_profile(self):
+        cache = ProfileCache(FakeDb({}))
+        profile = asyncio.run(cache.get(616609333832187924, 1))
+        self.assertEqual((profile.text_xp, profile.text_lvl, profile.warnings), (0, 0, 0))
+
+    def test_update_wins_over_database(self):
+        db = FakeDb({(616609333832187924, 1): (120, 3, 1)})
+        cache = ProfileCache(db)
+        # The write happened before the profile was ever read, the database still has the old value
+        cache.update(616609333832187924, 1, warnings=2)
+        profile = asyncio.run(cache.get(616609333832187924, 1))
+        self.assertEqual((profile.text_xp, profile.warnings), (120, 2))
+        cache.update(616609333832187924, 1, text_xp=130)
+        self.assertEqual(asyncio.run(cache.get(616609333832187924, 1)).text_xp, 130)
+        self.assertEqual(db.queries, 1)
+
+    def test_lru_eviction(self):
+        cache = ProfileCache(FakeDb({}), max_size=2)
+        asyncio.run(cache.get(616609333832187924, 1))
+        asyncio.run(cache.get(616609333832187924, 2))
+        asyncio.run(cache.get(616609333832187924, 1))
+        asyncio.run(cache.get(616609333832187924, 3))
+        self.assertIn((616609333832187924, 1), cache)
+        self.assertNotIn((616609333832187924, 2), cache)
+        self.assertEqual(cache.evictions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
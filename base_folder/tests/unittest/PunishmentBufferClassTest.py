@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+import celery.exceptions
+
+from base_folder.bot.utils.write_behind import PunishmentBuffer
+
+
+class FakeResult:
+    def __init__(self, error=None):
+        self.error = error
+        self.done = threading.Event()
+
+    def get(self, timeout=None):
+        if self.error is not None:
+            raise self.error
+        if not self.done.wait(timeout):
+            raise celery.exceptions.TimeoutError("timed out")
+        return 1
+
+    def ready(self):
+        return self.error is not None or self.done.is_set()
+
+    def successful(self):
+        return self.error is None
+
+
+class PunishmentBufferTest(unittest.TestCase):
+    """PunishmentBuffer class"""
+    def test_last_write_wins(self):
+        buffer = PunishmentBuffer()
+        buffer.set(616609333832187924, 1, "warnings", 1)
+        buffer.set(616609333832187924, 1, "warnings", 2)
+        buffer.set(616609333832187924, 1, "kickCount", 1)
+        self.assertEqual(buffer.get(616609333832187924, 1, "warnings"), 2)
+        self.assertEqual(buffer.get(616609333832187924, 1, "kickCount"), 1)
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.coalesced, 1)
+
+    def test_unknown_column(self):
+        buffer = PunishmentBuffer()
+        with self.assertRaises(ValueError):
+            buffer.set(616609333832187924, 1, "text_xp", 1)
+
+    def test_get_missing(self):
+        buffer = PunishmentBuffer()
+        self.assertIsNone(buffer.get(616609333832187924, 1, "warnings"))
+
+    def test_in_flight_amounts_stay_visible(self):
+        buffer = PunishmentBuffer()
+        buffer.set(616609333832187924, 1, "warnings", 2)
+        result = FakeResult()
+        with mock.patch("base_folder.bot.utils.write_behind.edit_punishments") as task:
+            task.delay.return_value = result
+            # Returns without waiting for the worker
+            asyncio.run(buffer.flush())
+            self.assertEqual(len(buffer), 0)
+            self.assertEqual(buffer.get(616609333832187924, 1, "warnings"), 2)
+            result.done.set()
+            asyncio.run(buffer.flush())
+        self.assertIsNone(buffer.get(616609333832187924, 1, "warnings"))
+        self.assertEqual(buffer.flushes, 1)
+
+    def test_unfinished_flush_is_not_sent_again(self):
+        buffer = PunishmentBuffer(timeout=0)
+        buffer.set(616609333832187924, 1, "warnings", 1)
+        late = FakeResult()
+        with mock.patch("base_folder.bot.utils.write_behind.edit_punishments") as task:
+            task.delay.return_value = late
+            asyncio.run(buffer.flush())
+            buffer.set(616609333832187924, 1, "warnings", 2)
+            # The first flush is still queued, so the newer amount has to wait for it
+            with self.assertLogs("discord.write_behind", "WARNING"):
+                asyncio.run(buffer.flush())
+            self.assertEqual(task.delay.call_count, 1)
+            self.assertEqual(buffer.get(616609333832187924, 1, "warnings"), 2)
+            late.done.set()
+            task.delay.return_value = FakeResult()
+            task.delay.return_value.done.set()
+            asyncio.run(buffer.flush())
+            asyncio.run(buffer.flush())
+        self.assertEqual([call.args[0] for call in task.delay.call_args_list],
+                         [[[616609333832187924, 1, "warnings", 1]], [[616609333832187924, 1, "warnings", 2]]])
+        self.assertEqual(buffer.flushes, 2)
+
+    def test_failed_flush_is_retried(self):
+        buffer = PunishmentBuffer()
+        buffer.set(616609333832187924, 1, "warnings", 1)
+        with mock.patch("base_folder.bot.utils.write_behind.edit_punishments") as task:
+            task.delay.return_value = FakeResult(ValueError("deadlock"))
+            asyncio.run(buffer.flush())
+            task.delay.return_value = FakeResult()
+            asyncio.run(buffer.flush())
+        self.assertEqual(task.delay.call_count, 2)
+        self.assertEqual(task.delay.call_args.args[0], [[616609333832187924, 1, "warnings", 1]])
+        self.assertEqual(buffer.flushes, 0)
+
+    def test_wait_on_shutdown(self):
+        buffer = PunishmentBuffer()
+        buffer.set(616609333832187924, 1, "warnings", 1)
+        result = FakeResult()
+        with mock.patch("base_folder.bot.utils.write_behind.edit_punishments") as task:
+            task.delay.return_value = result
+            threading.Timer(0.05, result.done.set).start()
+            asyncio.run(buffer.flush(wait=True))
+        self.assertEqual(buffer.flushes, 1)
+        self.assertEqual(buffer.stats()["in flight"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
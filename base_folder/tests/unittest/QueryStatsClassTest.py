@@ -0,0 +1,66 @@
+import unittest
+from base_folder.query_stats import QueryStats, TimedConnection, shape
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, operation, params=None):
+        self.executed.append(operation)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def is_connected(self):
+        return True
+
+
+class QueryStatsTest(unittest.TestCase):
+    """QueryStats class"""
+    def test_shape(self):
+        self.assertEqual(shape("UPDATE profiles SET warnings = 3 WHERE user_id= '42' and guild_id='616609333832187924'"),
+                         "UPDATE profiles SET warnings = ? WHERE user_id= ? and guild_id=?")
+        self.assertEqual(shape("SELECT a FROM t WHERE id IN (%s, %s,\n %s)"), "SELECT a FROM t WHERE id IN (...)")
+
+    def test_top(self):
+        stats = QueryStats(slow_threshold=None)
+        stats.record("SELECT * FROM profiles WHERE user_id=1", 0.003)
+        stats.record("SELECT * FROM profiles WHERE user_id=2", 0.004)
+        stats.record("SELECT * FROM settings WHERE guild_id=1", 0.001)
+        top = stats.top(1)
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]["shape"], "SELECT * FROM profiles WHERE user_id=?")
+        self.assertEqual(top[0]["count"], 2)
+        self.assertEqual(top[0]["p50"], 4.0)
+
+    def test_max_shapes(self):
+        stats = QueryStats(slow_threshold=None, max_shapes=1)
+        stats.record("SELECT a FROM t", 0.001)
+        stats.record("SELECT b FROM t", 0.001)
+        self.assertEqual({row["shape"] for row in stats.top()}, {"SELECT a FROM t", "other"})
+
+    def test_slow_log(self):
+        stats = QueryStats(slow_threshold=0.1)
+        with self.assertLogs('discord.sql', level='WARNING') as logs:
+            stats.record("SELECT a FROM t", 0.2)
+        self.assertIn("test_slow_log", logs.output[0])
+        self.assertEqual(stats.slow, 1)
+
+    def test_timed_connection(self):
+        stats = QueryStats(slow_threshold=None)
+        conn = TimedConnection(FakeConnection(), stats)
+        self.assertTrue(conn.is_connected())
+        c = conn.cursor()
+        c.execute("DELETE FROM reactions WHERE message_id=5")
+        c.close()
+        self.assertEqual(stats.top()[0]["count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from fuzzywuzzy import fuzz
+
+from base_folder.bot.utils.spam_index import SimilarityIndex, RaidIndex, score_window, token_sort_key
+
+
+class SpamIndexTest(unittest.TestCase):
+    """token sort key"""
+    def test_token_sort_key_matches_fuzz(self):
+        a = "Hello there, General Kenobi!"
+        b = "general kenobi hello THERE"
+        self.assertEqual(fuzz.ratio(token_sort_key(a), token_sort_key(b)), fuzz.token_sort_ratio(a, b))
+
+    """score window"""
+    def test_score_window_matches_token_sort_ratio(self):
+        window = ["hello there general kenobi", "general kenobi, hello there", "hello there general kenobi!!",
+                  "you are a bold one", "", "hello"]
+        content = "Hello there General Kenobi"
+        expected = sum(1 for other in window if fuzz.token_sort_ratio(content, other) >= 90)
+        candidates = [(i, token_sort_key(other)) for i, other in enumerate(window)]
+        self.assertEqual(score_window(token_sort_key(content), candidates, 90, len(window)), expected)
+
+    def test_score_window_stops_at_limit(self):
+        candidates = [(i, "spam spam spam") for i in range(100)]
+        self.assertEqual(score_window("spam spam spam", candidates, 90, 5), 5)
+
+    """SimilarityIndex class"""
+    def test_index_add_remove(self):
+        index = SimilarityIndex()
+        index.add(1, token_sort_key("some message"))
+        self.assertIn(1, index)
+        self.assertEqual(len(index), 1)
+        index.remove(1)
+        index.remove(2)
+        self.assertNotIn(1, index)
+        self.assertEqual(index._buckets, {})
+
+    def test_index_linear_below_threshold(self):
+        index = SimilarityIndex(linear_threshold=8)
+        for i in range(8):
+            index.add(i, token_sort_key(f"unrelated message number {i} " * i))
+        self.assertEqual(len(index.candidates(token_sort_key("something else"))), 8)
+
+    def test_index_finds_near_duplicates(self):
+        index = SimilarityIndex(linear_threshold=0)
+        payload = "buy cheap nitro now at this totally legit website please click"
+        index.add(1, token_sort_key(payload))
+        index.add(2, token_sort_key("what are we playing tonight, anyone up for some games?"))
+        index.add(3, token_sort_key(payload + "!!"))
+        found = [message_id for message_id, _ in index.candidates(token_sort_key(payload.upper()))]
+        self.assertIn(1, found)
+        self.assertIn(3, found)
+        self.assertNotIn(2, found)
+
+    """RaidIndex class"""
+    def test_raid_index_counts_distinct_authors(self):
+        index = RaidIndex(interval=1000, min_length=5)
+        key = token_sort_key("join my server discord gg something")
+        self.assertEqual(index.add(key, 1, 0), 1)
+        self.assertEqual(index.add(key, 1, 10), 1)
+        self.assertEqual(index.add(key, 2, 20), 2)
+        self.assertEqual(index.add(key, 3, 30), 3)
+        self.assertEqual(index.add(token_sort_key("gg"), 4, 40), 0)
+
+    def test_raid_index_expires(self):
+        index = RaidIndex(interval=1000, min_length=5)
+        key = token_sort_key("join my server discord gg something")
+        index.add(key, 1, 0)
+        index.add(key, 2, 500)
+        self.assertEqual(index.add(key, 3, 1200), 2)
+        self.assertEqual(len(index), 2)
+
+    def test_raid_index_take_raiders_once(self):
+        index = RaidIndex(interval=1000, min_length=5)
+        key = token_sort_key("join my server discord gg something")
+        index.add(key, 1, 0, "first")
+        index.add(key, 2, 10, "second")
+        index.add(key, 2, 20, "again")
+        self.assertEqual(index.take_raiders(key), {1: "first", 2: "again"})
+        index.add(key, 3, 30, "third")
+        self.assertEqual(index.take_raiders(key), {})
+        self.assertEqual(index.take_raiders(token_sort_key("something else entirely")), {})
+
+    def test_raid_index_bounded(self):
+        index = RaidIndex(max_entries=3, min_length=0)
+        for i in range(10):
+            index.add(f"payload {i}", i, i)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(len(index._authors), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
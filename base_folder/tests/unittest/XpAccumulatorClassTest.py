@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from unittest import mock
+from base_folder.bot.utils.profile_cache import ProfileCache
+from base_folder.bot.utils.write_behind import XpAccumulator
+
+
+class FakeResult:
+    def __init__(self):
+        self.done = False
+        self.failed = False
+
+    def ready(self):
+        return self.done
+
+    def successful(self):
+        return not self.failed
+
+
+class FakeDb:
+    def __init__(self, text_xp):
+        self.text_xp = text_xp
+
+    async def get_profile(self, guild_id, user_id):
+        return self.text_xp, 1, 0
+
+
+class XpAccumulatorTest(unittest.TestCase):
+    """XpAccumulator class"""
+    def test_sums_deltas(self):
+        accumulator = XpAccumulator()
+        accumulator.add(616609333832187924, 1, 3)
+        accumulator.add(616609333832187924, 1, 4, level=2)
+        accumulator.add(616609333832187924, 2, 1)
+        self.assertEqual(accumulator.pending(616609333832187924, 1), 7)
+        with mock.patch("base_folder.bot.utils.write_behind.add_text_xp") as task:
+            asyncio.run(accumulator.flush())
+        self.assertEqual(sorted(task.delay.call_args.args[0]),
+                         [[616609333832187924, 1, 7, 2], [616609333832187924, 2, 1, 0]])
+        self.assertEqual(len(accumulator), 0)
+
+    def test_failed_flush_keeps_deltas(self):
+        accumulator = XpAccumulator()
+        accumulator.add(616609333832187924, 1, 3, level=1)
+        with mock.patch("base_folder.bot.utils.write_behind.add_text_xp") as task:
+            task.delay.side_effect = ConnectionError("broker down")
+            asyncio.run(accumulator.flush())
+        accumulator.add(616609333832187924, 1, 2)
+        self.assertEqual(accumulator.pending(616609333832187924, 1), 5)
+        with mock.patch("base_folder.bot.utils.write_behind.add_text_xp") as task:
+            asyncio.run(accumulator.flush())
+        self.assertEqual(task.delay.call_args.args[0], [[616609333832187924, 1, 5, 1]])
+
+    def test_profile_miss_during_flush(self):
+        accumulator = XpAccumulator()
+        db = FakeDb(100)
+        profiles = ProfileCache(db, pending_xp=accumulator.pending)
+        accumulator.add(616609333832187924, 1, 30)
+        result = FakeResult()
+        with mock.patch("base_folder.bot.utils.write_behind.add_text_xp") as task:
+            task.delay.return_value = result
+            asyncio.run(accumulator.flush())
+        # The worker didn't commit yet, the database still has the old xp
+        self.assertEqual(asyncio.run(profiles.get(616609333832187924, 1)).text_xp, 130)
+        result.done = True
+        db.text_xp = 130
+        profiles = ProfileCache(db, pending_xp=accumulator.pending)
+        self.assertEqual(asyncio.run(profiles.get(616609333832187924, 1)).text_xp, 130)
+        self.assertEqual(accumulator.stats()["in flight"], 0)
+
+    def test_failed_worker_requeues_deltas(self):
+        accumulator = XpAccumulator()
+        accumulator.add(616609333832187924, 1, 30, level=2)
+        result = FakeResult()
+        with mock.patch("base_folder.bot.utils.write_behind.add_text_xp") as task:
+            task.delay.return_value = result
+            asyncio.run(accumulator.flush())
+            result.done = result.failed = True
+            accumulator.add(616609333832187924, 1, 5)
+            asyncio.run(accumulator.flush())
+        self.assertEqual(task.delay.call_args.args[0], [[616609333832187924, 1, 35, 2]])
+
+
+if __name__ == '__main__':
+    unittest.main()